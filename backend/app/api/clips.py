@@ -0,0 +1,86 @@
+import sqlite3
+import uuid
+import asyncio
+from fastapi import APIRouter, BackgroundTasks, HTTPException
+
+from app.api.search import build_matching_scenes_subquery
+from app.core.schemas import SearchRequest
+from app.core.websockets import FINISHED_JOB_RETENTION, manager
+from app.services.clip_service import ClipError, export_clips, get_or_create_clip
+from app.services.database_service import DB_FILE
+
+# ==============================================================================
+# --- CONFIGURAÇÃO DO ROTEADOR ---
+# ==============================================================================
+router = APIRouter()
+
+# Estado das exportações em lote, indexado pelo job_id (as concluídas ficam
+# FINISHED_JOB_RETENTION segundos, como o último estado no WebSocket)
+export_jobs: dict[str, dict] = {}
+
+def _clip_url(clip_path: str) -> str:
+    return f"/clips/{clip_path}"
+
+# ==============================================================================
+# --- ENDPOINTS DE CLIPES ---
+# ==============================================================================
+
+@router.post("/scenes/{scene_id}/clip", tags=["Clips"], summary="Gera (ou reaproveita) o clipe de uma cena")
+async def create_scene_clip(scene_id: int):
+    """
+    Corta o trecho start_time/end_time da cena, salva em /clips e registra o clip_path.
+    Se o clipe já existir no cache, apenas o retorna.
+    """
+    try:
+        result = await get_or_create_clip(scene_id)
+    except (LookupError, FileNotFoundError) as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ClipError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {**result, "url": _clip_url(result["clip_path"])}
+
+@router.post("/clips/export", status_code=202, tags=["Clips"], summary="Exporta os clipes de todas as cenas de uma busca")
+async def export_search_clips(request: SearchRequest, background_tasks: BackgroundTasks):
+    """
+    Executa a mesma busca do endpoint /search (sem paginação) e agenda a extração
+    dos clipes de todas as cenas encontradas. O progresso é enviado pelo WebSocket do job.
+    """
+    subquery_sql, subquery_params = build_matching_scenes_subquery(request)
+    conn = sqlite3.connect(DB_FILE)
+    try:
+        rows = conn.execute(f"""
+            SELECT s.scene_id FROM scenes s
+            WHERE s.scene_id IN ({subquery_sql})
+            ORDER BY s.video_id, s.start_time""", subquery_params).fetchall()
+    except sqlite3.Error as e:
+        raise HTTPException(status_code=500, detail=f"Erro no banco de dados: {e}")
+    finally:
+        conn.close()
+    scene_ids = [row[0] for row in rows]
+
+    job_id = str(uuid.uuid4())
+    export_jobs[job_id] = {"status": "queued", "progress": 0, "total": len(scene_ids), "results": []}
+
+    async def progress_callback(data: dict):
+        export_jobs[job_id].update(data)
+        await manager.send_json(job_id, data)
+
+    async def run_export():
+        try:
+            results = await export_clips(scene_ids, progress_callback)
+            for result in results:
+                if "clip_path" in result:
+                    result["url"] = _clip_url(result["clip_path"])
+            export_jobs[job_id]["results"] = results
+        finally:
+            asyncio.get_running_loop().call_later(FINISHED_JOB_RETENTION, export_jobs.pop, job_id, None)
+
+    background_tasks.add_task(run_export)
+    return {"job_id": job_id, "scene_count": len(scene_ids), "message": "Exportação de clipes iniciada"}
+
+@router.get("/clips/export/{job_id}", tags=["Clips"], summary="Consulta o estado de uma exportação em lote")
+def get_export_status(job_id: str):
+    job = export_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Exportação não encontrada")
+    return job
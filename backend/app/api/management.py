@@ -1,11 +1,17 @@
 import os
+import uuid
+import asyncio
 import sqlite3
-import json
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
 from pydantic import BaseModel
 from typing import List
 from pathlib import Path
 
+from app.core.websockets import FINISHED_JOB_RETENTION, manager
+from app.services.catalog_maintenance import cleanup_videos, scan_new_videos as catalog_scan_new_videos
+from app.services.fingerprint_service import duplicate_clusters, fingerprint_library
+from app.services.media_info_service import get_media_info_batch
+
 # ==============================================================================
 # --- CONFIGURAÇÃO E DEPENDÊNCIAS ---
 # ==============================================================================
@@ -20,17 +26,71 @@ VIDEOS_ROOT_FOLDER = BASE_DIR / "backend" / "videos"
 class PathList(BaseModel):
     paths: List[str]
 
+CATALOG_TABLES = {"videos", "scenes", "tags", "scene_tags"}
+
+def _require_db():
+    """
+    503 enquanto o catálogo não existe. O arquivo do banco sempre existe (o backend
+    o cria ao iniciar, com as tabelas auxiliares), então o que se confere são as
+    tabelas criadas pelo 'construir_banco_de_cenas.py'.
+    """
+    try:
+        # Somente leitura: a verificação nunca cria o arquivo
+        conn = sqlite3.connect(f"{DB_FILE.as_uri()}?mode=ro", uri=True)
+        try:
+            names = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        names = set()
+    if not CATALOG_TABLES <= names:
+        raise HTTPException(status_code=503,
+                            detail=f"Catálogo não encontrado em {DB_FILE}: rode o construir_banco_de_cenas.py")
+
 def get_db():
     """Função de dependência do FastAPI para obter uma conexão com o banco de dados."""
-    if not DB_FILE.exists():
-        raise HTTPException(status_code=503, detail=f"Arquivo de banco de dados não encontrado em {DB_FILE}")
-    db = sqlite3.connect(DB_FILE)
+    _require_db()
+    # O FastAPI abre a dependência e roda o endpoint em threads diferentes do pool;
+    # a conexão só é usada por uma requisição de cada vez
+    db = sqlite3.connect(DB_FILE, check_same_thread=False)
     db.row_factory = sqlite3.Row
     try:
         yield db
     finally:
         db.close()
 
+# Estado das operações em lote (limpeza e catalogação), indexado pelo job_id; as
+# concluídas ficam FINISHED_JOB_RETENTION segundos, como o último estado no WebSocket
+maintenance_jobs: dict[str, dict] = {}
+
+def _start_maintenance_job(operation, function, paths, background_tasks, summary):
+    """
+    Agenda 'function(paths, progress)' numa thread (o event loop segue livre) e
+    publica o progresso no estado do job e no WebSocket.
+    """
+    job_id = str(uuid.uuid4())
+    maintenance_jobs[job_id] = {"operation": operation, "status": "queued", "progress": 0, "path_count": len(paths)}
+
+    def publish(data: dict):
+        maintenance_jobs[job_id].update(data)
+        manager.publish(job_id, data)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        publish({"status": "processing", "progress": 1, "message": "Iniciando..."})
+        try:
+            result = await asyncio.to_thread(function, paths, lambda data: loop.call_soon_threadsafe(publish, data))
+        except Exception as e:
+            publish({"status": "error", "progress": 100, "message": f"Erro durante a operação: {e}"})
+            return
+        else:
+            publish({"status": "completed", "progress": 100, "message": summary(result), "result": result})
+        finally:
+            loop.call_later(FINISHED_JOB_RETENTION, maintenance_jobs.pop, job_id, None)
+
+    background_tasks.add_task(run)
+    return {"job_id": job_id, "path_count": len(paths), "message": "Operação iniciada"}
+
 # ==============================================================================
 # --- ENDPOINTS DA API DE GERENCIAMENTO ---
 # ==============================================================================
@@ -71,90 +131,69 @@ def get_sync_status(db: sqlite3.Connection = Depends(get_db)):
         "untracked_files": untracked_files
     }
 
-@router.post("/management/cleanup", tags=["Management"], summary="Remove registros órfãos do DB")
-def cleanup_orphan_records(payload: PathList, db: sqlite3.Connection = Depends(get_db)):
+@router.post("/management/media_info/refresh", tags=["Management"], summary="Atualiza a media_info de todos os vídeos")
+async def refresh_media_info():
     """
-    Recebe uma lista de file_paths e os remove da tabela 'videos'.
-    O ON DELETE CASCADE cuidará de remover as cenas e tags associadas.
+    Faz uma passada de ffprobe em lote por todos os vídeos da pasta raiz.
+    Arquivos já conhecidos (mesmo caminho, tamanho e mtime) não são reprocessados.
     """
-    if not payload.paths:
-        return {"message": "Nenhum caminho fornecido para limpeza.", "deleted_count": 0}
-            
-    cursor = db.cursor()
-    deleted_count = 0
-    try:
-        for path in payload.paths:
-            cursor.execute("DELETE FROM videos WHERE file_path = ?", (path,))
-            deleted_count += cursor.rowcount
-        db.commit()
-        return {"message": "Limpeza concluída com sucesso.", "deleted_count": deleted_count}
-    except sqlite3.Error as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Erro no banco de dados durante a limpeza: {e}")
+    if not VIDEOS_ROOT_FOLDER.exists():
+        raise HTTPException(status_code=404, detail=f"Pasta raiz de vídeos '{VIDEOS_ROOT_FOLDER}' não encontrada.")
+
+    supported_extensions = ('.mp4', '.mkv', '.mov', '.avi', '.webm', '.mpg', '.wmv')
+    video_paths = [str(Path(root) / file)
+                   for root, _, files in os.walk(VIDEOS_ROOT_FOLDER)
+                   for file in files if file.lower().endswith(supported_extensions)]
+
+    results = await get_media_info_batch(video_paths)
+    return {"video_count": len(video_paths), "media_info_count": len(results),
+            "failed": sorted(set(video_paths) - set(results))}
 
-@router.post("/management/scan_new", tags=["Management"], summary="Adiciona novos vídeos ao DB")
-def scan_new_videos(payload: PathList, db: sqlite3.Connection = Depends(get_db)):
+@router.post("/management/fingerprints/refresh", tags=["Management"], summary="Calcula as impressões perceptuais dos vídeos")
+async def refresh_fingerprints():
     """
-    Recebe uma lista de file_paths de vídeos não catalogados e os adiciona ao DB,
-    assumindo que seus arquivos _cenas.json já existem.
+    Calcula o pHash dos frames amostrados de cada vídeo da pasta raiz (só dos
+    arquivos novos ou modificados), usado para achar duplicatas.
     """
-    if not payload.paths:
-        return {"message": "Nenhum caminho fornecido para escanear.", "added_count": 0}
+    if not VIDEOS_ROOT_FOLDER.exists():
+        raise HTTPException(status_code=404, detail=f"Pasta raiz de vídeos '{VIDEOS_ROOT_FOLDER}' não encontrada.")
+    return await fingerprint_library(VIDEOS_ROOT_FOLDER)
 
-    cursor = db.cursor()
-    added_count = 0
-    
-    for relative_path_str in payload.paths:
-        try:
-            # Reconstrói o caminho completo a partir do caminho relativo
-            video_path = BASE_DIR / relative_path_str
-            base_video_name = video_path.stem
-            category_name = video_path.parent.name
-            
-            json_path = video_path.with_name(f"{base_video_name}_cenas.json")
-
-            if not json_path.exists():
-                print(f"Aviso: JSON para '{video_path.name}' não encontrado. Pulando.")
-                continue
-
-            # Insere o vídeo
-            cursor.execute("INSERT OR IGNORE INTO videos (video_name, category, file_path) VALUES (?, ?, ?)",
-                           (base_video_name, category_name, relative_path_str))
-            cursor.execute("SELECT video_id FROM videos WHERE file_path = ?", (relative_path_str,))
-            video_id_result = cursor.fetchone()
-            if not video_id_result: continue
-            video_id = video_id_result['video_id']
-            
-            # Insere as cenas e tags
-            with open(json_path, 'r', encoding='utf-8') as f:
-                scenes_data = json.load(f)
-            
-            if not isinstance(scenes_data, list): continue
-
-            for scene in scenes_data:
-                # Usa INSERT OR IGNORE para evitar duplicatas se o script for rodado novamente
-                cursor.execute("INSERT OR IGNORE INTO scenes (video_id, scene_number, start_time, end_time, duration) VALUES (?, ?, ?, ?, ?)",
-                               (video_id, scene.get('cena_n'), scene.get('start_time'), scene.get('end_time'), scene.get('duration')))
-                
-                # Para obter o scene_id, precisamos buscá-lo, já que o IGNORE não retorna lastrowid
-                cursor.execute("SELECT scene_id FROM scenes WHERE video_id = ? AND scene_number = ?", (video_id, scene.get('cena_n')))
-                scene_id_result = cursor.fetchone()
-                if not scene_id_result: continue
-                scene_id = scene_id_result['scene_id']
-
-                for tag_name, score in scene.get('tags_principais', {}).items():
-                    tag_name_std = tag_name.replace(' ', '_')
-                    cursor.execute("INSERT OR IGNORE INTO tags (tag_name) VALUES (?)", (tag_name_std,))
-                    cursor.execute("SELECT tag_id FROM tags WHERE tag_name = ?", (tag_name_std,))
-                    tag_id_result = cursor.fetchone()
-                    if tag_id_result:
-                        tag_id = tag_id_result[0]
-                        cursor.execute("INSERT OR IGNORE INTO scene_tags (scene_id, tag_id, score) VALUES (?, ?, ?)",
-                                       (scene_id, tag_id, score))
-            added_count += 1
-        except Exception as e:
-            print(f"Erro ao adicionar o vídeo '{relative_path_str}': {e}")
-            continue
-            
-    db.commit()
-    return {"message": f"{added_count} de {len(payload.paths)} novos vídeos foram adicionados com sucesso.", "added_count": added_count}
\ No newline at end of file
+@router.get("/management/duplicates", tags=["Management"], summary="Lista os grupos de vídeos duplicados")
+def get_duplicate_clusters():
+    """
+    Grupos de vídeos com a mesma impressão perceptual (re-encodes e cópias),
+    entre os que já têm impressão calculada. 'has_scenes' indica quais já foram processados.
+    """
+    clusters = duplicate_clusters()
+    return {"cluster_count": len(clusters), "duplicate_video_count": sum(len(c["videos"]) - 1 for c in clusters),
+            "clusters": clusters}
+
+@router.post("/management/cleanup", status_code=202, tags=["Management"], summary="Remove registros órfãos do DB")
+async def cleanup_orphan_records(payload: PathList, background_tasks: BackgroundTasks):
+    """
+    Recebe uma lista de file_paths e agenda a remoção dos vídeos, das suas cenas e
+    tags de cena e das tags que ficarem sem cenas, numa única transação em lote.
+    O progresso é enviado pelo WebSocket do job e por GET /management/jobs/{job_id}.
+    """
+    _require_db()
+    return _start_maintenance_job("cleanup", cleanup_videos, payload.paths, background_tasks,
+                                  lambda result: f"{result['deleted_count']} vídeos removidos do banco.")
+
+@router.post("/management/scan_new", status_code=202, tags=["Management"], summary="Adiciona novos vídeos ao DB")
+async def scan_new_videos(payload: PathList, background_tasks: BackgroundTasks):
+    """
+    Recebe uma lista de file_paths de vídeos não catalogados e agenda sua inclusão
+    no DB, assumindo que seus arquivos de cenas (_cenas.npz ou _cenas.json) já existem.
+    Os arquivos são lidos em paralelo e gravados em lote; o progresso é enviado pelo WebSocket do job.
+    """
+    _require_db()
+    return _start_maintenance_job("scan_new", catalog_scan_new_videos, payload.paths, background_tasks,
+                                  lambda result: f"{result['added_count']} de {len(payload.paths)} novos vídeos foram adicionados.")
+
+@router.get("/management/jobs/{job_id}", tags=["Management"], summary="Consulta o estado de uma operação em lote")
+def get_maintenance_job(job_id: str):
+    job = maintenance_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Operação não encontrada")
+    return job
@@ -0,0 +1,46 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import FileResponse, PlainTextResponse
+
+from app.core.websockets import TERMINAL_STATUSES, manager
+from app.services.job_metrics import get_job_metrics, profile_path, render_prometheus
+from app.services.media_tools import get_running_counts
+from app.services.processing_service import get_models_status
+
+# ==============================================================================
+# --- CONFIGURAÇÃO DO ROTEADOR ---
+# ==============================================================================
+# Incluído sem prefixo: o Prometheus espera as métricas em /metrics
+router = APIRouter()
+
+def _live_gauges():
+    """Medidas instantâneas do processo, somadas às métricas históricas dos jobs."""
+    active_jobs = [job for job in manager.snapshot() if job.get("status") not in TERMINAL_STATUSES]
+    return {
+        "scene_jobs_active": ("Jobs em andamento ou na fila", {"": len(active_jobs)}),
+        "scene_models_loaded": ("Modelos de tagging em memória", {"": len(get_models_status()["models"])}),
+        "scene_media_tool_running": ("Processos ffmpeg/ffprobe em execução",
+                                     {f'tool="{tool}"': count for tool, count in get_running_counts().items()}),
+    }
+
+# ==============================================================================
+# --- ENDPOINTS DE MÉTRICAS ---
+# ==============================================================================
+
+@router.get("/metrics", tags=["Metrics"], summary="Métricas dos jobs no formato do Prometheus",
+            response_class=PlainTextResponse)
+def prometheus_metrics():
+    return PlainTextResponse(render_prometheus(_live_gauges()), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@router.get("/api/jobs/{job_id}/metrics", tags=["Metrics"], summary="Tempo por etapa, frames/s e pico de memória de um job")
+def get_job_metrics_endpoint(job_id: str):
+    metrics = get_job_metrics(job_id)
+    if metrics is None:
+        raise HTTPException(status_code=404, detail="Métricas não encontradas (job inexistente ou ainda em andamento)")
+    return metrics
+
+@router.get("/api/jobs/{job_id}/profile", tags=["Metrics"], summary="Pilhas amostradas de um job processado com profile=true")
+def get_job_profile(job_id: str):
+    path = profile_path(job_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile não encontrado para este job")
+    return FileResponse(path, media_type="text/plain", filename=path.name)
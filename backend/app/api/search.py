@@ -1,6 +1,8 @@
 import sqlite3
 from fastapi import APIRouter, Depends, HTTPException
-from app.core.schemas import SearchRequest
+from app.core.schemas import SearchRequest, TemporalSearchRequest
+from app.services.tag_query import QuerySyntaxError, query_search
+from app.services.temporal_search import temporal_search
 from pathlib import Path
 import json
 import os
@@ -11,21 +13,20 @@ BASE_DIR = Path(__file__).resolve().parent.parent.parent.parent
 DB_FILE = BASE_DIR / "cenas_database.db"
 
 def get_db():
-    db = sqlite3.connect(DB_FILE)
+    # O FastAPI abre a dependência e roda o endpoint em threads diferentes do pool;
+    # a conexão só é usada por uma requisição de cada vez
+    db = sqlite3.connect(DB_FILE, check_same_thread=False)
     db.row_factory = sqlite3.Row
     try:
         yield db
     finally:
         db.close()
 
-@router.post("/search", tags=["Search"], summary="Busca vídeos e retorna as cenas correspondentes")
-def search_videos(request: SearchRequest, db: sqlite3.Connection = Depends(get_db)):
+def build_matching_scenes_subquery(request: SearchRequest):
     """
-    Busca vídeos que contêm cenas com critérios específicos e retorna os dados
-    dessas cenas para navegação inteligente.
+    Monta a subquery SQL que seleciona os scene_ids que atendem aos critérios
+    da busca. Retorna a tupla (sql, params) para ser embutida em outras queries.
     """
-    
-    # --- Subquery para encontrar os scene_ids que correspondem ---
     subquery_conditions = []
     subquery_params = []
     
@@ -53,6 +54,27 @@ def search_videos(request: SearchRequest, db: sqlite3.Connection = Depends(get_d
         subquery_having = f"GROUP BY s.scene_id HAVING COUNT(DISTINCT t.tag_name) = ?"
         subquery_params.append(len(request.include_tags))
 
+    return f"SELECT s.scene_id {subquery_from_joins} WHERE {subquery_where} {subquery_having}", subquery_params
+
+@router.post("/search", tags=["Search"], summary="Busca vídeos e retorna as cenas correspondentes")
+def search_videos(request: SearchRequest, db: sqlite3.Connection = Depends(get_db)):
+    """
+    Busca vídeos que contêm cenas com critérios específicos e retorna os dados
+    dessas cenas para navegação inteligente. Com 'query' (ou explain), a busca
+    passa pelo planejador de expressões booleanas (ver tag_query.py).
+    """
+    if request.query or request.explain:
+        try:
+            return query_search(db, request)
+        except QuerySyntaxError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except sqlite3.Error as e:
+            print(f"Erro no banco de dados: {e}")
+            raise HTTPException(status_code=500, detail=f"Erro no banco de dados: {e}")
+    
+    # --- Subquery para encontrar os scene_ids que correspondem ---
+    subquery_sql, subquery_params = build_matching_scenes_subquery(request)
+
     # --- Query Principal para agrupar por vídeo e coletar cenas correspondentes ---
     query = f"""
     SELECT
@@ -66,7 +88,7 @@ def search_videos(request: SearchRequest, db: sqlite3.Connection = Depends(get_d
     FROM videos v
     JOIN scenes s_match ON v.video_id = s_match.video_id
     WHERE s_match.scene_id IN (
-        SELECT s.scene_id {subquery_from_joins} WHERE {subquery_where} {subquery_having}
+        {subquery_sql}
     )
     GROUP BY v.video_id
     ORDER BY COUNT(s_match.scene_id) DESC -- Ordena por vídeos com mais cenas correspondentes
@@ -95,4 +117,16 @@ def search_videos(request: SearchRequest, db: sqlite3.Connection = Depends(get_d
         return {"results": videos}
     except sqlite3.Error as e:
         print(f"Erro no banco de dados: {e}")
-        raise HTTPException(status_code=500, detail=f"Erro no banco de dados: {e}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Erro no banco de dados: {e}")
+
+@router.post("/search/temporal", tags=["Search"], summary="Busca sequências, coocorrências e cobertura de tags no tempo")
+def search_temporal(request: TemporalSearchRequest, db: sqlite3.Connection = Depends(get_db)):
+    """
+    Retorna, por vídeo, as faixas de tempo que atendem à consulta temporal, no
+    mesmo formato de matching_scenes da /search (o player pula para cada faixa).
+    """
+    try:
+        return temporal_search(db, request)
+    except sqlite3.Error as e:
+        print(f"Erro no banco de dados: {e}")
+        raise HTTPException(status_code=500, detail=f"Erro no banco de dados: {e}")
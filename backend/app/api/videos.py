@@ -1,18 +1,25 @@
 import os
 import shutil
-import subprocess
 import uuid
 from pathlib import Path
 import mimetypes
-import json
 import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Optional
 
-from fastapi import (APIRouter, BackgroundTasks, HTTPException, WebSocket,
-                     WebSocketDisconnect)
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Query, Request, Response, WebSocket
+from fastapi.responses import FileResponse, JSONResponse
 
+from app.core.streaming import RangeFileResponse, etag_matches
 from app.core.websockets import manager
-from app.services.processing_service import run_scene_detection
+from app.services.job_queue import PROCESSING_MODE, enqueue_job
+from app.services.keyframe_index import get_keyframe_index
+from app.services.media_info_service import get_media_info
+from app.services.media_tools import MediaToolError, run_tool
+from app.services.processing_service import MODEL_REPO, get_models_status, run_scene_detection
+from app.services.database_service import get_catalog_generation, get_video_scenes
+from app.services.scene_store import find_scene_file
 from app.core.schemas import ProcessRequest # Importe o novo modelo
 
 # ==============================================================================
@@ -29,6 +36,15 @@ DB_FILE = BASE_DIR.parent / "cenas_database.db"
 
 os.makedirs(THUMBNAIL_CACHE_PATH, exist_ok=True)
 
+# Cache das respostas de /scenes por (vídeo, top_tags), válido enquanto a geração do catálogo não mudar
+SCENE_CACHE_SIZE = 256
+_scene_cache = OrderedDict()
+_scene_cache_lock = threading.Lock()
+
+# Tipo MIME por container (format_name do ffprobe), usado quando a extensão não basta
+CONTAINER_MEDIA_TYPES = {"mp4": "video/mp4", "webm": "video/webm", "matroska": "video/x-matroska",
+                         "avi": "video/x-msvideo", "asf": "video/x-ms-asf", "mpeg": "video/mpeg"}
+
 # ==============================================================================
 # --- ENDPOINTS DE LISTAGEM ---
 # ==============================================================================
@@ -66,11 +82,11 @@ def get_videos_in_folder(folder_name: str):
         for filename in sorted(os.listdir(folder_path)):
             if filename.lower().endswith(supported_extensions):
                 base_name, _ = os.path.splitext(filename)
-                json_path = folder_path / f"{base_name}_cenas.json"
                 video_info = {
                     "filename": filename,
                     "folder": folder_name,
-                    "has_scenes_json": os.path.exists(json_path),
+                    # Mantém o nome do campo usado pelo frontend (o arquivo agora pode ser .npz ou .json)
+                    "has_scenes_json": find_scene_file(folder_path, base_name) is not None,
                 }
                 videos.append(video_info)
         return {"videos": videos}
@@ -82,7 +98,7 @@ def get_videos_in_folder(folder_name: str):
 # ==============================================================================
 
 @router.get("/thumbnail/{folder_name}/{filename}", tags=["Media"], summary="Gera e serve uma thumbnail")
-def get_thumbnail(folder_name: str, filename: str):
+async def get_thumbnail(folder_name: str, filename: str):
     """
     Gera uma thumbnail para um vídeo (se não existir no cache) e a serve como um arquivo de imagem.
     """
@@ -94,32 +110,72 @@ def get_thumbnail(folder_name: str, filename: str):
         raise HTTPException(status_code=404, detail="Vídeo não encontrado")
 
     if not os.path.exists(thumbnail_path):
+        # Busca o frame a 10% do vídeo (no máximo 5s), evitando pedir um instante além do fim
+        media_info = await get_media_info(video_path)
+        seek_time = 5
+        if media_info and media_info['duration']:
+            seek_time = round(min(5, media_info['duration'] * 0.1), 3)
         try:
-            command = ['ffmpeg', '-ss', '5', '-i', str(video_path),'-vframes', '1', '-q:v', '3', '-vf', 'scale=320:-1',str(thumbnail_path)]
-            subprocess.run(command, check=True, capture_output=True, text=True)
-        except subprocess.CalledProcessError:
+            await run_tool('ffmpeg', ['-ss', seek_time, '-i', video_path, '-vframes', '1', '-q:v', '3', '-vf', 'scale=320:-1', thumbnail_path], timeout=60)
+        except MediaToolError:
             try:
-                command = ['ffmpeg', '-i', str(video_path),'-vframes', '1', '-q:v', '3', '-vf', 'scale=320:-1',str(thumbnail_path)]
-                subprocess.run(command, check=True, capture_output=True, text=True)
+                await run_tool('ffmpeg', ['-i', video_path, '-vframes', '1', '-q:v', '3', '-vf', 'scale=320:-1', thumbnail_path], timeout=60)
             except Exception:
                 raise HTTPException(status_code=500, detail="Falha ao gerar thumbnail")
 
     return FileResponse(thumbnail_path)
 
-@router.get("/stream/{folder_name}/{filename}", tags=["Media"], summary="Serve um arquivo de vídeo")
-def stream_video(folder_name: str, filename: str):
+@router.api_route("/stream/{folder_name}/{filename}", methods=["GET", "HEAD"], tags=["Media"], summary="Serve um arquivo de vídeo")
+async def stream_video(folder_name: str, filename: str, request: Request, scene_id: Optional[int] = None):
     """
-    Serve um arquivo de vídeo para ser reproduzido no player do frontend.
+    Serve um arquivo de vídeo para o player do frontend, com suporte a Range
+    (único e múltiplo), ETag/Last-Modified e requisições condicionais.
+    Com 'scene_id', a resposta fica restrita aos bytes da cena, alinhados aos
+    keyframes que a envolvem (útil para pré-carregar o trecho antes do seek).
     """
     video_path = VIDEOS_BASE_PATH / folder_name / filename
-    print(f"Tentando servir o vídeo: {video_path}")
-    if not os.path.exists(video_path):
-        print(f"ERRO: Arquivo não encontrado em {video_path}")
-        raise HTTPException(status_code=404, detail=f"Vídeo não encontrado em {video_path}")
+    if not os.path.isfile(video_path):
+        raise HTTPException(status_code=404, detail="Vídeo não encontrado")
     media_type, _ = mimetypes.guess_type(video_path)
     if media_type is None:
-        media_type = "application/octet-stream"
-    return FileResponse(video_path, media_type=media_type, headers={"Accept-Ranges": "bytes"})
+        media_info = await get_media_info(video_path)
+        format_name = (media_info or {}).get('format_name') or ''
+        media_type = next((mime for fmt, mime in CONTAINER_MEDIA_TYPES.items() if fmt in format_name.split(',')),
+                          "application/octet-stream")
+
+    window = None
+    if scene_id is not None:
+        window = await _scene_byte_window(video_path, scene_id)
+
+    return RangeFileResponse(video_path, request, media_type=media_type, window=window)
+
+async def _scene_byte_window(video_path, scene_id: int):
+    conn = sqlite3.connect(DB_FILE)
+    try:
+        row = conn.execute("SELECT start_time, end_time FROM scenes WHERE scene_id = ?", (scene_id,)).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Cena não encontrada")
+    try:
+        index = await get_keyframe_index(video_path)
+    except (MediaToolError, OSError) as e:
+        raise HTTPException(status_code=500, detail=f"Falha ao indexar keyframes: {e}")
+    return index.byte_range_for(row[0], row[1])
+
+@router.get("/media_info/{folder_name}/{filename}", tags=["Media"], summary="Retorna os metadados técnicos de um vídeo")
+async def get_video_media_info(folder_name: str, filename: str):
+    """
+    Retorna codec, resolução, fps, bitrate, duração e intervalo de keyframes do vídeo.
+    O ffprobe só roda na primeira consulta (ou se o arquivo mudar); depois vem da tabela media_info.
+    """
+    video_path = VIDEOS_BASE_PATH / folder_name / filename
+    if not os.path.isfile(video_path):
+        raise HTTPException(status_code=404, detail="Vídeo não encontrado")
+    media_info = await get_media_info(video_path)
+    if media_info is None:
+        raise HTTPException(status_code=500, detail="Falha ao ler os metadados do vídeo")
+    return media_info
 
 # ==============================================================================
 # --- ENDPOINTS DE PROCESSAMENTO E WEBSOCKET ---
@@ -143,9 +199,20 @@ async def process_video(
         raise HTTPException(status_code=404, detail="Vídeo não encontrado")
 
     job_id = str(uuid.uuid4())
+    video_label = f"{folder_name}/{filename}"
 
     async def progress_callback(data: dict):
-        await manager.send_json(job_id, data)
+        # Não espera pela rede: o hub agrupa e envia as atualizações em segundo plano
+        await manager.send_json(job_id, {**data, "video": video_label})
+
+    if PROCESSING_MODE == "workers":
+        # Um worker remoto (app/worker.py) pega o job da fila; ver job_queue.py
+        enqueue_job(job_id, video_path, folder_name, filename,
+                    params.model_dump() | {"model_repo": params.model_repo or MODEL_REPO})
+        manager.publish(job_id, {"status": "queued", "progress": 0, "message": "Na fila (aguardando um worker)...", "video": video_label})
+        return {"job_id": job_id, "message": "Job enfileirado para os workers"}
+
+    manager.publish(job_id, {"status": "queued", "progress": 0, "message": "Na fila...", "video": video_label})
 
     # [MODIFICADO] Passa os parâmetros recebidos para a função de processamento
     background_tasks.add_task(
@@ -155,76 +222,73 @@ async def process_video(
         callback=progress_callback,
         fps=params.fps,
         limiar_similaridade=params.similarity_threshold,
-        batch_size=params.batch_size
+        batch_size=params.batch_size,
+        model_repo=params.model_repo or MODEL_REPO,
+        model_variant=params.model_variant,
+        similarity_metric=params.similarity_metric,
+        flicker_window=params.flicker_window,
+        min_scene_frames=params.min_scene_frames,
+        scene_top_k=params.scene_top_k,
+        min_tag_support=params.min_tag_support,
+        job_id=job_id,
+        profile=params.profile,
+        reuse_duplicates=params.reuse_duplicates
     )
     
     return {"job_id": job_id, "message": "Processamento iniciado com parâmetros customizados"}
 
+@router.get("/model/status", tags=["Processing"], summary="Modelos carregados e tempos de carregamento/aquecimento")
+def get_model_status():
+    return get_models_status()
+
+@router.websocket("/ws/progress/{job_id}")
+async def job_progress_websocket(websocket: WebSocket, job_id: str):
+    """Progresso de um job (processamento ou exportação); ao conectar, recebe o último estado."""
+    await manager.serve(websocket, job_id)
+
+@router.websocket("/ws/progress")
+async def all_jobs_progress_websocket(websocket: WebSocket):
+    """Progresso de todos os jobs; ao conectar, recebe o último estado de cada um."""
+    await manager.serve(websocket)
+
 # ==============================================================================
 # --- ENDPOINT DE DADOS DE CENAS (CORRIGIDO) ---
 # ==============================================================================
 
 @router.get("/scenes/{folder_name}/{filename}", tags=["Scenes"], summary="Retorna os dados das cenas de um vídeo processado")
-def get_scene_data(folder_name: str, filename: str):
+def get_scene_data(folder_name: str, filename: str, request: Request, top_tags: int = Query(0, ge=0, le=100)):
     """
-    Lê o arquivo _cenas.json e o enriquece com os scene_ids do banco de dados.
+    Cenas do vídeo direto do catálogo (uma consulta indexada), com os scene_ids.
+    top_tags > 0 inclui as N tags de maior score de cada cena.
+
+    A resposta leva uma ETag derivada da geração do catálogo: enquanto nenhum
+    vídeo ou cena mudar, o navegador revalida com If-None-Match e recebe 304.
     """
     base_name, _ = os.path.splitext(filename)
-    json_path = VIDEOS_BASE_PATH / folder_name / f"{base_name}_cenas.json"
-
-    print(f"\n[DEBUG] Tentando buscar cenas para o arquivo: {json_path}")
-
-    if not os.path.exists(json_path):
-        print("[DEBUG] Arquivo de cenas não encontrado. Retornando vazio.")
-        return {"scenes": [], "duration": 0}
-
     try:
-        with open(json_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-            if not content:
-                print("[DEBUG] O arquivo JSON está vazio. Retornando vazio.")
-                return {"scenes": [], "duration": 0}
-            scene_data_from_json = json.loads(content)
-
-        if not isinstance(scene_data_from_json, list) or not scene_data_from_json:
-            print(f"[DEBUG] Conteúdo do JSON não é uma lista válida.")
-            return {"scenes": [], "duration": 0}
-
         conn = sqlite3.connect(DB_FILE)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT video_id FROM videos WHERE video_name = ?", (base_name,))
-        video_row = cursor.fetchone()
-        if not video_row:
+        try:
+            generation = get_catalog_generation(conn)
+            etag = f'"{generation}-{top_tags}"'
+            headers = {"ETag": etag, "Cache-Control": "no-cache"}
+            if etag_matches(request.headers.get('if-none-match'), etag):
+                return Response(status_code=304, headers=headers)
+
+            cache_key = (base_name, top_tags)
+            with _scene_cache_lock:
+                cached = _scene_cache.get(cache_key)
+            if cached is not None and cached[0] == generation:
+                payload = cached[1]
+            else:
+                scenes = get_video_scenes(conn, base_name, top_tags)
+                payload = {"scenes": scenes, "duration": scenes[-1]['end_time'] if scenes else 0}
+                with _scene_cache_lock:
+                    _scene_cache[cache_key] = (generation, payload)
+                    _scene_cache.move_to_end(cache_key)
+                    while len(_scene_cache) > SCENE_CACHE_SIZE:
+                        _scene_cache.popitem(last=False)
+        finally:
             conn.close()
-            print(f"[DEBUG] Vídeo '{base_name}' não encontrado no banco de dados.")
-            return {"scenes": [], "duration": 0}
-        video_id = video_row['video_id']
-
-        cursor.execute("SELECT scene_id, scene_number FROM scenes WHERE video_id = ?", (video_id,))
-        scenes_from_db = {row['scene_number']: row['scene_id'] for row in cursor.fetchall()}
-        conn.close()
-
-        enriched_scenes = []
-        for scene in scene_data_from_json:
-            scene_num = scene.get('cena_n') or scene.get('scene_number')
-            if scene_num in scenes_from_db:
-                scene['scene_id'] = scenes_from_db[scene_num]
-                enriched_scenes.append(scene)
-
-        if not enriched_scenes:
-            print("[DEBUG] Nenhuma cena do JSON correspondeu às cenas no DB.")
-            return {"scenes": [], "duration": 0}
-            
-        total_duration = enriched_scenes[-1]['end_time']
-        
-        print(f"[DEBUG] Sucesso! Encontradas {len(enriched_scenes)} cenas. Duração: {total_duration}")
-        return {"scenes": enriched_scenes, "duration": total_duration}
-
-    except json.JSONDecodeError:
-        print(f"[DEBUG] ERRO: O arquivo JSON '{json_path}' está corrompido.")
-        return {"scenes": [], "duration": 0}
-    except Exception as e:
-        print(f"[DEBUG] ERRO Inesperado ao processar: {e}")
-        raise HTTPException(status_code=500, detail=f"Erro inesperado ao processar dados das cenas: {e}")
\ No newline at end of file
+    except sqlite3.Error as e:
+        raise HTTPException(status_code=500, detail=f"Erro inesperado ao processar dados das cenas: {e}")
+    return JSONResponse(payload, headers=headers)
\ No newline at end of file
@@ -0,0 +1,160 @@
+import asyncio
+from pathlib import Path
+from urllib.parse import quote
+
+from fastapi import APIRouter, HTTPException, Request, Response
+
+from app.core.schemas import WorkerFailure, WorkerProgress, WorkerRegistration
+from app.core.websockets import manager
+from app.services.job_metrics import JobMetrics
+from app.services.job_queue import (MAX_RESULT_BYTES, WORKER_LEASE_SECONDS, LeaseLostError, finish_job, get_worker,
+                                    lease_next_job, queue_status, register_worker, renew_lease)
+from app.services.processing_service import finalize_scene_detection
+from app.services.scene_store import SceneFileError, decode_frame_results
+
+# ==============================================================================
+# --- CONFIGURAÇÃO DO ROTEADOR ---
+# ==============================================================================
+# Endpoints usados pelos workers remotos (app/worker.py); ver job_queue.py
+router = APIRouter()
+
+def _require_worker(worker_id: str):
+    worker = get_worker(worker_id)
+    if worker is None:
+        # O worker deve se registrar de novo (ex.: banco recriado)
+        raise HTTPException(status_code=404, detail="Worker não registrado")
+    return worker
+
+async def _read_result_body(request: Request):
+    """Corpo do upload, recusado com 413 acima de MAX_RESULT_BYTES sem ler o resto."""
+    too_large = HTTPException(status_code=413, detail=f"Resultado maior que {MAX_RESULT_BYTES} bytes")
+    length = request.headers.get("content-length")
+    if length is not None and length.isdigit() and int(length) > MAX_RESULT_BYTES:
+        raise too_large
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > MAX_RESULT_BYTES:
+            raise too_large
+    return bytes(body)
+
+def _publish(job, data, worker_name=None):
+    manager.publish(job["job_id"], {**data, "video": f"{job['folder']}/{job['filename']}", "worker": worker_name})
+
+# ==============================================================================
+# --- ENDPOINTS DOS WORKERS ---
+# ==============================================================================
+
+@router.post("/workers/register", tags=["Workers"], summary="Registra um worker de tagging")
+def register(registration: WorkerRegistration):
+    worker_id = register_worker(registration.name, registration.host, registration.info)
+    return {"worker_id": worker_id, "lease_seconds": WORKER_LEASE_SECONDS,
+            "heartbeat_seconds": max(1.0, WORKER_LEASE_SECONDS / 3)}
+
+@router.post("/workers/{worker_id}/lease", tags=["Workers"], summary="Entrega o próximo job da fila ao worker (204 se vazia)")
+async def lease_job(worker_id: str):
+    worker = _require_worker(worker_id)
+    job, exhausted = lease_next_job(worker_id)
+    for job_id in exhausted:
+        manager.publish(job_id, {"status": "error", "progress": 0, "message": "Erro: o job esgotou as tentativas nos workers"})
+    if job is None:
+        return Response(status_code=204)
+
+    _publish(job, {"status": "processing", "stage": "LEASED", "progress": 1,
+                   "message": f"Enviado ao worker {worker['name']} (tentativa {job['attempts']})..."}, worker["name"])
+    return {"job_id": job["job_id"], "folder": job["folder"], "filename": job["filename"], "video_path": job["video_path"],
+            "video_url": f"/api/stream/{quote(job['folder'])}/{quote(job['filename'])}",
+            "params": job["params"], "attempt": job["attempts"], "lease_seconds": WORKER_LEASE_SECONDS}
+
+@router.post("/workers/{worker_id}/jobs/{job_id}/heartbeat", tags=["Workers"], summary="Renova o lease e informa o progresso")
+async def heartbeat(worker_id: str, job_id: str, progress: WorkerProgress):
+    worker = _require_worker(worker_id)
+    try:
+        job = renew_lease(job_id, worker_id)
+    except LeaseLostError:
+        raise HTTPException(status_code=409, detail="O job não pertence mais a este worker")
+    # Sem etapa o heartbeat só renova o lease (ex.: durante o envio do resultado)
+    if progress.stage is not None:
+        _publish(job, {"status": "processing", "stage": progress.stage, "progress": progress.progress,
+                       "message": progress.message}, worker["name"])
+    return {"lease_expires_at": job["lease_expires_at"]}
+
+@router.post("/workers/{worker_id}/jobs/{job_id}/result", tags=["Workers"], summary="Recebe as tags por frame e conclui o job")
+async def upload_result(worker_id: str, job_id: str, request: Request):
+    """
+    Corpo: .npz gerado por encode_frame_results (até MAX_RESULT_BYTES). A segmentação,
+    o arquivo de cenas e o banco são feitos aqui no servidor, como no processamento local.
+    """
+    worker = _require_worker(worker_id)
+    try:
+        job = renew_lease(job_id, worker_id)
+    except LeaseLostError:
+        raise HTTPException(status_code=409, detail="O job não pertence mais a este worker")
+    body = await _read_result_body(request)
+    try:
+        # Descompactar e validar a matriz é trabalho de CPU: fora do event loop
+        matriz, meta = await asyncio.to_thread(decode_frame_results, body)
+    except SceneFileError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def callback(data: dict):
+        _publish(job, data, worker["name"])
+
+    params = job["params"]
+    # O tempo gasto no worker entra nas métricas do job (etapas, frames e duração total)
+    metrics = JobMetrics(job_id, job["filename"], elapsed=float(meta.get("elapsed_seconds", 0.0)))
+    for name, seconds in meta.get("stages", {}).items():
+        metrics.add(name, float(seconds))
+    metrics.add_frames(int(meta.get("frames", matriz.n_frames)))
+    job_status = "error"
+    try:
+        try:
+            # O lease é conferido logo antes de gravar: um job já entregue a outro worker não é sobrescrito
+            cenas = await finalize_scene_detection(
+                job["video_path"], str(Path(job["video_path"]).parent), matriz, callback, params["fps"],
+                params["similarity_threshold"], params["similarity_metric"], params["flicker_window"],
+                params["min_scene_frames"], params["scene_top_k"], params["min_tag_support"], metrics,
+                params["model_repo"], params["model_variant"], before_save=lambda: renew_lease(job_id, worker_id))
+        except LeaseLostError:
+            raise HTTPException(status_code=409, detail="O job não pertence mais a este worker")
+        except Exception as e:
+            try:
+                finish_job(job_id, worker_id, error=str(e))
+            except LeaseLostError:
+                # O lease expirou enquanto isso: o job já voltou para a fila
+                raise HTTPException(status_code=409, detail="O job não pertence mais a este worker")
+            await callback({"status": "error", "progress": 0, "message": f"Erro: {str(e)}"})
+            raise HTTPException(status_code=500, detail=str(e))
+
+        # As cenas já estão gravadas: o job está concluído mesmo que o lease tenha expirado na gravação
+        job_status = "completed"
+        try:
+            finish_job(job_id, worker_id)
+        except LeaseLostError:
+            print(f"Aviso: o lease do job {job_id} expirou durante a gravação; o resultado foi mantido")
+    finally:
+        try:
+            metrics.finish(job_status)
+        except Exception as metrics_err:
+            print(f"Aviso: não foi possível gravar as métricas do job: {metrics_err}")
+
+    await callback({"status": "completed", "progress": 100, "message": "Processamento concluído!"})
+    return {"status": "completed", "scenes": len(cenas)}
+
+@router.post("/workers/{worker_id}/jobs/{job_id}/fail", tags=["Workers"], summary="Informa que o worker não conseguiu processar o job")
+async def fail_job(worker_id: str, job_id: str, failure: WorkerFailure):
+    worker = _require_worker(worker_id)
+    try:
+        job = renew_lease(job_id, worker_id)
+        status = finish_job(job_id, worker_id, error=failure.error, retry=failure.retry)
+    except LeaseLostError:
+        raise HTTPException(status_code=409, detail="O job não pertence mais a este worker")
+    if status == "queued":
+        _publish(job, {"status": "queued", "progress": 0, "message": f"Falha no worker {worker['name']}; aguardando nova tentativa..."})
+    else:
+        _publish(job, {"status": "error", "progress": 0, "message": f"Erro: {failure.error}"}, worker["name"])
+    return {"status": status}
+
+@router.get("/workers", tags=["Workers"], summary="Fila de processamento e workers conectados")
+def get_workers():
+    return queue_status()
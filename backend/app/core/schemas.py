@@ -1,5 +1,7 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import BaseModel, ConfigDict, Field, field_validator, model_validator
+from typing import List, Literal, Optional
+
+from app.services.model_variants import MODEL_FAMILY
 
 class SearchRequest(BaseModel):
     """
@@ -14,6 +16,38 @@ class SearchRequest(BaseModel):
     sort_by: Optional[str] = 'score' # Padrão para ordenar por score da tag (relevância)
     page: int = 1
     limit: int = 24
+    # Expressão booleana (ver tag_query.py), combinada com AND aos filtros acima
+    query: Optional[str] = Field(default=None, max_length=2000)
+    engine: Literal["auto", "sql", "memory"] = "auto" # Onde a expressão roda ('auto': QUERY_ENGINE)
+    explain: bool = False # Inclui o plano com as cardinalidades estimadas e reais
+
+class TemporalStep(BaseModel):
+    """Um passo de uma busca temporal: cenas que têm todas estas tags."""
+    tags: List[str] = Field(min_length=1, max_length=10)
+    min_score: float = Field(default=0.0, ge=0, le=1.0) # Score mínimo de cada tag na cena
+
+class TemporalSearchRequest(BaseModel):
+    """
+    Busca por relações no tempo entre cenas (ver temporal_search.py):
+    'sequence' (passo 1 seguido do passo 2... em até max_gap segundos),
+    'cooccurrence' (os passos a até max_gap segundos uns dos outros, em qualquer ordem)
+    e 'coverage' (vídeos em que o passo 1 soma pelo menos min_total_seconds).
+    """
+    mode: Literal["sequence", "cooccurrence", "coverage"] = "sequence"
+    steps: List[TemporalStep] = Field(min_length=1, max_length=5)
+    max_gap: float = Field(default=60.0, ge=0, le=3600) # Segundos entre um passo e o seguinte
+    min_total_seconds: float = Field(default=0.0, ge=0) # Só para 'coverage'
+    merge_gap: float = Field(default=1.0, ge=0) # 'coverage': cenas separadas por até N segundos viram uma faixa
+    page: int = Field(default=1, ge=1)
+    limit: int = Field(default=24, ge=1, le=200)
+
+    @model_validator(mode="after")
+    def check_steps(self):
+        if self.mode == "coverage" and len(self.steps) != 1:
+            raise ValueError("O modo 'coverage' usa exatamente um passo")
+        if self.mode != "coverage" and len(self.steps) < 2:
+            raise ValueError(f"O modo '{self.mode}' precisa de pelo menos dois passos")
+        return self
 
 class ProcessRequest(BaseModel):
     """
@@ -22,4 +56,41 @@ class ProcessRequest(BaseModel):
     """
     fps: float = Field(default=1.0, gt=0, le=30) # Frequência de frames por segundo
     similarity_threshold: float = Field(default=0.4, gt=0, lt=1.0) # Limiar de similaridade
-    batch_size: int = Field(default=32, gt=0, le=128) # Tamanho do lote para a GPU
\ No newline at end of file
+    batch_size: int = Field(default=32, gt=0, le=128) # Tamanho do lote para a GPU
+    similarity_metric: Literal["jaccard", "cosine"] = "jaccard" # 'cosine' pondera as tags pelo score
+    flicker_window: int = Field(default=0, ge=0, le=10) # Ignora quedas de similaridade que voltam em até N frames
+    min_scene_frames: int = Field(default=1, ge=1, le=300) # Tamanho mínimo de uma cena, em frames
+    scene_top_k: Optional[int] = Field(default=50, gt=0, le=1000) # Máximo de tags guardadas por cena (None = todas)
+    min_tag_support: float = Field(default=0.1, ge=0, le=1.0) # Fração mínima dos frames da cena em que a tag aparece
+    # Modelo usado no tagging: repositório da família wd-v3 (None = padrão do servidor)
+    # e variante (fp16/int8 precisam ter sido gerados com 'python -m app.services.model_variants convert')
+    model_repo: Optional[str] = None
+    model_variant: Literal["fp32", "fp16", "int8"] = "fp32"
+    # Grava as pilhas amostradas durante o job em profiles/{job_id}.collapsed (pesa um pouco no job)
+    profile: bool = False
+    # Copia as cenas de uma duplicata já processada (mesma impressão perceptual) em vez de rodar o modelo
+    reuse_duplicates: bool = True
+
+    model_config = ConfigDict(protected_namespaces=())
+
+    @field_validator("model_repo")
+    @classmethod
+    def check_model_repo(cls, value):
+        if value is not None and value not in MODEL_FAMILY:
+            raise ValueError(f"Repositório não suportado. Opções: {', '.join(MODEL_FAMILY)}")
+        return value
+class WorkerRegistration(BaseModel):
+    """Enviado por um worker (app/worker.py) ao se registrar no servidor."""
+    name: str = Field(min_length=1, max_length=100)
+    host: Optional[str] = None
+    info: dict = {} # Providers, sessões, threads etc., só para exibição
+
+class WorkerProgress(BaseModel):
+    """Heartbeat de um job em andamento: renova o lease e repassa o progresso aos clientes."""
+    stage: Optional[str] = None
+    progress: int = Field(default=0, ge=0, le=100)
+    message: Optional[str] = None
+
+class WorkerFailure(BaseModel):
+    error: str
+    retry: bool = True # Devolve o job à fila se ainda houver tentativas
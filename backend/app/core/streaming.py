@@ -0,0 +1,235 @@
+import os
+import stat
+import uuid
+from email.utils import formatdate, parsedate_to_datetime
+
+import anyio
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+# Blocos grandes reduzem o número de idas ao thread pool em arquivos de vários GB
+CHUNK_SIZE = 1024 * 1024
+# Acima disso, pedidos multi-range são tratados como o arquivo inteiro (evita abusos)
+MAX_RANGES = 16
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+def etag_matches(if_none_match, etag):
+    """Se o cabeçalho If-None-Match contém a ETag (comparação fraca, aceita '*')."""
+    if if_none_match is None:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in tags or etag in tags or f"W/{etag}" in tags
+
+def parse_range_header(range_header: str, size: int):
+    """
+    Interpreta um cabeçalho 'Range: bytes=...' e retorna a lista de intervalos
+    (início, fim) inclusivos, ordenados e mesclados. Retorna None se o cabeçalho
+    não for do tipo bytes (deve ser ignorado) e levanta RangeNotSatisfiable se
+    nenhum intervalo couber no arquivo.
+    """
+    unit, _, spec = range_header.partition('=')
+    if unit.strip().lower() != 'bytes' or not spec:
+        return None
+
+    ranges = []
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        start_str, sep, end_str = part.partition('-')
+        if not sep:
+            return None
+        try:
+            if start_str == '':
+                suffix = int(end_str)
+                if suffix <= 0:
+                    continue
+                start, end = max(size - suffix, 0), size - 1
+            else:
+                start = int(start_str)
+                end = int(end_str) if end_str else size - 1
+        except ValueError:
+            return None
+        if start >= size:
+            continue
+        if start > end:
+            return None
+        ranges.append((start, min(end, size - 1)))
+
+    if not ranges:
+        raise RangeNotSatisfiable()
+
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        last_start, last_end = merged[-1]
+        if start <= last_end + 1:
+            merged[-1] = (last_start, max(last_end, end))
+        else:
+            merged.append((start, end))
+    return merged
+
+class RangeFileResponse(Response):
+    """
+    Resposta de arquivo com suporte completo a HTTP Range:
+    - 200 (arquivo inteiro), 206 (um intervalo ou multipart/byteranges), 304 e 416;
+    - ETag e Last-Modified com If-None-Match, If-Modified-Since e If-Range;
+    - 'window' restringe a resposta a um trecho do arquivo (ex.: uma cena): o trecho
+      passa a ser o recurso, e os intervalos do Range e do Content-Range são
+      relativos a ele e limitados ao seu tamanho.
+    O corpo é enviado com 'http.response.zerocopy' (sendfile) quando o servidor
+    oferece essa extensão, ou em blocos de CHUNK_SIZE lidos fora do event loop.
+    """
+    def __init__(self, path, request: Request, media_type: str = "application/octet-stream", window=None):
+        self.path = str(path)
+        self.request = request
+        self.file_media_type = media_type
+        self.background = None
+        self.stat_result = os.stat(self.path)
+        if not stat.S_ISREG(self.stat_result.st_mode):
+            raise RuntimeError(f"'{self.path}' não é um arquivo.")
+        file_size = self.stat_result.st_size
+        self.window = window if window is not None else (0, file_size)
+        self.ranges = []
+        self.multipart_boundary = None
+        self.status_code = 200
+        self.raw_headers = []
+        self._prepare()
+
+    # --- Cabeçalhos e validação condicional ---
+
+    def _validators(self):
+        etag = f'"{self.stat_result.st_mtime_ns:x}-{self.stat_result.st_size:x}'
+        if self.window != (0, self.stat_result.st_size):
+            # Cada trecho é um recurso próprio: um If-Range não pode valer para outro
+            etag += f'-{self.window[0]:x}-{self.window[1]:x}'
+        etag += '"'
+        last_modified = formatdate(self.stat_result.st_mtime, usegmt=True)
+        return etag, last_modified
+
+    def _not_modified(self, etag):
+        headers = self.request.headers
+        if_none_match = headers.get('if-none-match')
+        if if_none_match is not None:
+            return etag_matches(if_none_match, etag)
+        if_modified_since = headers.get('if-modified-since')
+        if if_modified_since:
+            try:
+                return int(self.stat_result.st_mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def _if_range_matches(self, etag, last_modified):
+        if_range = self.request.headers.get('if-range')
+        return if_range is None or if_range.strip() in (etag, last_modified)
+
+    def _prepare(self):
+        etag, last_modified = self._validators()
+        window_start, window_end = self.window
+        window_size = window_end - window_start
+        headers = {
+            "accept-ranges": "bytes",
+            "etag": etag,
+            "last-modified": last_modified,
+        }
+
+        if self._not_modified(etag):
+            self.status_code = 304
+            self.init_headers(headers)
+            return
+
+        range_header = self.request.headers.get('range')
+        ranges = None
+        if range_header and self._if_range_matches(etag, last_modified):
+            try:
+                ranges = parse_range_header(range_header, window_size)
+            except RangeNotSatisfiable:
+                self.status_code = 416
+                headers["content-range"] = f"bytes */{window_size}"
+                headers["content-length"] = "0"
+                self.init_headers(headers)
+                return
+            if ranges is not None and len(ranges) > MAX_RANGES:
+                ranges = None
+
+        partial = ranges is not None
+        if ranges is None:
+            ranges = [(0, window_size - 1)] if window_size > 0 else []
+        self.status_code = 206 if partial else 200
+
+        # Converte para posições absolutas no arquivo (os cabeçalhos usam as relativas à janela)
+        self.ranges = [(window_start + start, window_start + end) for start, end in ranges]
+
+        if len(self.ranges) <= 1:
+            if partial:
+                start, end = ranges[0]
+                headers["content-range"] = f"bytes {start}-{end}/{window_size}"
+            headers["content-type"] = self.file_media_type
+            headers["content-length"] = str(sum(end - start + 1 for start, end in self.ranges))
+        else:
+            self.multipart_boundary = uuid.uuid4().hex
+            headers["content-type"] = f"multipart/byteranges; boundary={self.multipart_boundary}"
+            length = sum(len(self._part_header(start, end)) + (end - start + 1) + 2 for start, end in self.ranges)
+            length += len(self._closing_boundary())
+            headers["content-length"] = str(length)
+        self.init_headers(headers)
+
+    def _part_header(self, start, end):
+        """Cabeçalho de uma parte do multipart; start/end são posições absolutas no arquivo."""
+        window_start, window_end = self.window
+        return (f"--{self.multipart_boundary}\r\n"
+                f"Content-Type: {self.file_media_type}\r\n"
+                f"Content-Range: bytes {start - window_start}-{end - window_start}/{window_end - window_start}\r\n\r\n"
+                ).encode('latin-1')
+
+    def _closing_boundary(self):
+        return f"--{self.multipart_boundary}--\r\n".encode('latin-1')
+
+    # --- Envio do corpo ---
+
+    async def _send_range(self, send: Send, file, start, end, more_body_after, zerocopy):
+        count = end - start + 1
+        if zerocopy:
+            await send({"type": "http.response.zerocopy", "file": file.fileno(), "offset": start,
+                        "count": count, "more_body": more_body_after})
+            return
+        await file.seek(start)
+        remaining = count
+        while remaining > 0:
+            chunk = await file.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            await send({"type": "http.response.body", "body": chunk,
+                        "more_body": more_body_after or remaining > 0})
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope.get("method") == "HEAD" or self.status_code in (304, 416) or not self.ranges:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        zerocopy = "http.response.zerocopy" in scope.get("extensions", {})
+        if zerocopy:
+            file = open(self.path, 'rb')
+        else:
+            file = await anyio.open_file(self.path, 'rb')
+        try:
+            if self.multipart_boundary is None:
+                start, end = self.ranges[0]
+                await self._send_range(send, file, start, end, False, zerocopy)
+                return
+            for start, end in self.ranges:
+                await send({"type": "http.response.body", "body": self._part_header(start, end), "more_body": True})
+                await self._send_range(send, file, start, end, True, zerocopy)
+                await send({"type": "http.response.body", "body": b"\r\n", "more_body": True})
+            await send({"type": "http.response.body", "body": self._closing_boundary(), "more_body": False})
+        finally:
+            if zerocopy:
+                file.close()
+            else:
+                await file.aclose()
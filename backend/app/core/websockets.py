@@ -1,19 +1,150 @@
-from fastapi import WebSocket
+import os
+import time
+import asyncio
 
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: dict[str, WebSocket] = {}
+from fastapi import WebSocket, WebSocketDisconnect
 
-    async def connect(self, job_id: str, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections[job_id] = websocket
+# ==============================================================================
+# SEÇÃO 1: CONFIGURAÇÕES
+# ==============================================================================
+
+# Máximo de mensagens de progresso por segundo enviadas para cada job
+PROGRESS_MAX_RATE = float(os.environ.get("PROGRESS_MAX_RATE", 4))
+# Mensagens pendentes por conexão; acima disso as mais antigas são descartadas
+SUBSCRIBER_QUEUE_SIZE = 32
+# Por quanto tempo o último estado de um job concluído fica disponível para quem conectar depois
+FINISHED_JOB_RETENTION = 600
+TERMINAL_STATUSES = ("completed", "error")
+ALL_JOBS = "*"
+
+# ==============================================================================
+# SEÇÃO 2: CONEXÕES
+# ==============================================================================
+
+class _Subscriber:
+    """
+    Uma conexão WebSocket com sua própria fila de envio. Quem publica nunca espera
+    pela rede: a mensagem entra na fila e uma tarefa separada a envia.
+    """
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def push(self, message):
+        if self.queue.full():
+            # Cliente lento: descarta a mensagem mais antiga (a mais nova traz o estado atual)
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+    async def run(self):
+        try:
+            while True:
+                await self.websocket.send_json(await self.queue.get())
+        except (WebSocketDisconnect, RuntimeError, OSError):
+            pass
+
+# ==============================================================================
+# SEÇÃO 3: HUB DE PROGRESSO
+# ==============================================================================
+
+class ProgressHub:
+    """
+    Distribui o progresso dos jobs para quantos clientes estiverem conectados:
+    - cada job tem seu canal e há um canal com todos os jobs (ALL_JOBS);
+    - atualizações de um job são agrupadas em no máximo PROGRESS_MAX_RATE por segundo,
+      enviando sempre o estado mais recente; 'completed' e 'error' saem na hora;
+    - quem conecta depois recebe imediatamente o último estado conhecido.
+    """
+    def __init__(self, max_rate=PROGRESS_MAX_RATE):
+        self.min_interval = 1.0 / max_rate if max_rate > 0 else 0.0
+        self._subscribers: dict[str, set[_Subscriber]] = {}
+        self._latest: dict[str, dict] = {}
+        self._last_sent: dict[str, float] = {}
+        self._pending_flush: dict[str, asyncio.TimerHandle] = {}
+
+    # --- Publicação ---
+
+    def publish(self, job_id: str, data: dict):
+        """Registra o novo estado do job; deve ser chamado no event loop. Nunca bloqueia."""
+        message = {**data, "job_id": job_id}
+        self._latest[job_id] = message
+        loop = asyncio.get_running_loop()
+
+        if message.get("status") in TERMINAL_STATUSES:
+            self._cancel_flush(job_id)
+            self._broadcast(job_id, message)
+            loop.call_later(FINISHED_JOB_RETENTION, self._forget, job_id, message)
+            return
 
-    def disconnect(self, job_id: str):
-        if job_id in self.active_connections:
-            del self.active_connections[job_id]
+        wait = self._last_sent.get(job_id, 0.0) + self.min_interval - time.monotonic()
+        if wait <= 0:
+            self._cancel_flush(job_id)
+            self._broadcast(job_id, message)
+        elif job_id not in self._pending_flush:
+            self._pending_flush[job_id] = loop.call_later(wait, self._flush, job_id)
 
     async def send_json(self, job_id: str, data: dict):
-        if job_id in self.active_connections:
-            await self.active_connections[job_id].send_json(data)
+        # Mantido como corrotina para os callbacks de progresso existentes
+        self.publish(job_id, data)
+
+    def _flush(self, job_id):
+        self._pending_flush.pop(job_id, None)
+        message = self._latest.get(job_id)
+        if message is not None:
+            self._broadcast(job_id, message)
+
+    def _cancel_flush(self, job_id):
+        handle = self._pending_flush.pop(job_id, None)
+        if handle is not None:
+            handle.cancel()
+
+    def _broadcast(self, job_id, message):
+        self._last_sent[job_id] = time.monotonic()
+        for channel in (job_id, ALL_JOBS):
+            for subscriber in self._subscribers.get(channel, ()):
+                subscriber.push(message)
+
+    def _forget(self, job_id, message):
+        # Só remove se nenhum estado novo foi publicado para o mesmo job nesse meio tempo
+        if self._latest.get(job_id) is message:
+            self._latest.pop(job_id, None)
+            self._last_sent.pop(job_id, None)
+
+    # --- Assinatura ---
+
+    def snapshot(self, job_id: str = None):
+        """Último estado de um job, ou de todos os jobs conhecidos se job_id for None."""
+        if job_id is None:
+            return list(self._latest.values())
+        return self._latest.get(job_id)
+
+    async def serve(self, websocket: WebSocket, job_id: str = None):
+        """Atende uma conexão até o cliente desconectar (job_id None = canal de todos os jobs)."""
+        await websocket.accept()
+        channel = job_id or ALL_JOBS
+        subscriber = _Subscriber(websocket)
+        self._subscribers.setdefault(channel, set()).add(subscriber)
+
+        snapshots = self.snapshot() if channel == ALL_JOBS else [self.snapshot(job_id)]
+        for message in snapshots:
+            if message is not None:
+                subscriber.push(message)
+
+        sender = asyncio.create_task(subscriber.run())
+        try:
+            # Os clientes não enviam nada; a leitura serve só para detectar a desconexão
+            while True:
+                event = await websocket.receive()
+                if event["type"] == "websocket.disconnect":
+                    break
+        except (WebSocketDisconnect, RuntimeError):
+            pass
+        finally:
+            subscribers = self._subscribers.get(channel)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[channel]
+            sender.cancel()
 
-manager = ConnectionManager()
\ No newline at end of file
+manager = ProgressHub()
@@ -1,4 +1,6 @@
 import os
+import asyncio
+from contextlib import asynccontextmanager
 from pathlib import Path
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
@@ -7,6 +9,11 @@ from app.api import videos
 from app.api import search
 
 from app.api import management # 1. Importe o novo arquivo
+from app.api import clips
+from app.api import metrics
+from app.api import workers
+from app.services.database_service import init_database
+from app.services.processing_service import MODEL_WARMUP, warm_up_default_model
 
 # --- [NOVO] INICIALIZAÇÃO E CRIAÇÃO DE DIRETÓRIOS ---
 # Define o caminho base da pasta 'backend'
@@ -19,9 +26,20 @@ CLIPS_DIR = BASE_DIR / "clips"
 # Garante que as pastas essenciais existam ao iniciar a aplicação
 os.makedirs(VIDEOS_DIR, exist_ok=True)
 os.makedirs(CLIPS_DIR, exist_ok=True)
+
+# Cria as tabelas auxiliares (media_info etc.) caso ainda não existam
+init_database()
 # --- FIM DA NOVA SEÇÃO ---
 
-app = FastAPI(title="Video Scene Detector API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Com MODEL_WARMUP=startup o modelo é carregado e aquecido em segundo plano,
+    # sem atrasar o servidor de começar a responder
+    if MODEL_WARMUP == "startup":
+        app.state.warmup_task = asyncio.create_task(asyncio.to_thread(warm_up_default_model))
+    yield
+
+app = FastAPI(title="Video Scene Detector API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -39,6 +57,10 @@ app.mount("/clips", StaticFiles(directory=CLIPS_DIR), name="clips")
 app.include_router(videos.router, prefix="/api", tags=["Media & Processing"])
 app.include_router(search.router, prefix="/api", tags=["Search"])
 app.include_router(management.router, prefix="/api", tags=["Management"]) # 4. Adicione o novo roteador
+app.include_router(clips.router, prefix="/api", tags=["Clips"])
+app.include_router(workers.router, prefix="/api", tags=["Workers"])
+# Sem prefixo: /metrics na raiz e os detalhes por job em /api/jobs/...
+app.include_router(metrics.router, tags=["Metrics"])
 
 @app.get("/")
 def read_root():
@@ -0,0 +1,196 @@
+"""
+Operações em lote do gerenciamento do catálogo: limpeza de registros órfãos e
+catalogação de vídeos novos a partir dos arquivos de cenas já gerados.
+
+Em vez de um comando por caminho, os caminhos (e as cenas lidas) vão para
+tabelas temporárias e cada etapa é um único DELETE/INSERT com join, dentro de
+uma transação. As funções são síncronas e feitas para rodar fora do event loop
+(asyncio.to_thread); o progresso é reportado pelo callback 'progress(dict)'.
+"""
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from .database_service import DB_FILE, ensure_catalog_triggers
+from .scene_store import SceneFileError, find_scene_file, read_scenes
+
+# ==============================================================================
+# SEÇÃO 1: CONFIGURAÇÕES
+# ==============================================================================
+# Os file_path relativos da tabela 'videos' partem da raiz do projeto
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent.parent
+# Threads de leitura dos arquivos de cenas (leitura de disco + descompressão)
+SCAN_READ_WORKERS = int(os.environ.get("SCAN_READ_WORKERS", 8))
+# Arquivos lidos entre dois relatórios de progresso
+SCAN_BATCH_SIZE = 500
+
+def _connect():
+    # isolation_level=None: a transação é aberta explicitamente com BEGIN IMMEDIATE
+    conn = sqlite3.connect(DB_FILE, timeout=30, isolation_level=None)
+    # Gatilhos da geração e o índice idx_scene_tags_tag usado na coleta de tags órfãs
+    ensure_catalog_triggers(conn)
+    return conn
+
+def _report(progress, percent, message, **extra):
+    if progress is not None:
+        progress({"status": "processing", "progress": percent, "message": message, **extra})
+
+def _load_paths(conn, table, paths):
+    conn.execute(f"CREATE TEMP TABLE {table} (file_path TEXT PRIMARY KEY)")
+    conn.executemany(f"INSERT OR IGNORE INTO {table} (file_path) VALUES (?)", ((path,) for path in paths))
+
+def _delete_orphan_tags(conn):
+    """Apaga as tags que não estão em nenhuma cena (usa o índice idx_scene_tags_tag)."""
+    return conn.execute("""
+        DELETE FROM tags WHERE NOT EXISTS (SELECT 1 FROM scene_tags st WHERE st.tag_id = tags.tag_id)""").rowcount
+
+# ==============================================================================
+# SEÇÃO 2: LIMPEZA DE ÓRFÃOS
+# ==============================================================================
+
+def cleanup_videos(paths, progress=None):
+    """
+    Remove os vídeos com os file_paths dados, com suas cenas e tags de cena, e
+    depois as tags que ficaram sem nenhuma cena. A cascata é feita explicitamente
+    (as conexões não ativam PRAGMA foreign_keys). Tudo ou nada.
+    """
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            _load_paths(conn, "cleanup_paths", paths)
+            conn.execute("""
+                CREATE TEMP TABLE cleanup_videos AS
+                SELECT v.video_id FROM videos v JOIN cleanup_paths p ON p.file_path = v.file_path""")
+            conn.execute("""
+                CREATE TEMP TABLE cleanup_scenes AS
+                SELECT scene_id FROM scenes WHERE video_id IN (SELECT video_id FROM cleanup_videos)""")
+            _report(progress, 20, "Removendo as tags das cenas...")
+            scene_tags = conn.execute(
+                "DELETE FROM scene_tags WHERE scene_id IN (SELECT scene_id FROM cleanup_scenes)").rowcount
+            _report(progress, 50, "Removendo as cenas...")
+            scenes = conn.execute("DELETE FROM scenes WHERE scene_id IN (SELECT scene_id FROM cleanup_scenes)").rowcount
+            _report(progress, 70, "Removendo os vídeos...")
+            videos = conn.execute("DELETE FROM videos WHERE video_id IN (SELECT video_id FROM cleanup_videos)").rowcount
+            _report(progress, 85, "Removendo as tags sem cenas...")
+            tags = _delete_orphan_tags(conn)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+    return {"deleted_count": videos, "deleted_scenes": scenes, "deleted_scene_tags": scene_tags,
+            "deleted_tags": tags, "not_found_count": len(set(paths)) - videos}
+
+# ==============================================================================
+# SEÇÃO 3: CATALOGAÇÃO DE VÍDEOS NOVOS
+# ==============================================================================
+
+def _read_scene_file(relative_path):
+    """(file_path, nome, categoria, cenas) ou (file_path, None, None, motivo) se não der para ler."""
+    video_path = PROJECT_ROOT / relative_path
+    scene_path = find_scene_file(video_path.parent, video_path.stem)
+    if scene_path is None:
+        return relative_path, None, None, "arquivo de cenas não encontrado"
+    try:
+        return relative_path, video_path.stem, video_path.parent.name, read_scenes(scene_path)
+    except (SceneFileError, OSError) as e:
+        return relative_path, None, None, str(e)
+
+def _stage_scene_files(conn, paths, progress):
+    """
+    Lê os arquivos de cenas em paralelo e os grava nas tabelas temporárias
+    scan_videos/scan_scenes/scan_scene_tags. Tabelas temporárias não travam o
+    banco principal, então os outros escritores seguem livres durante a leitura.
+    """
+    conn.executescript("""
+        CREATE TEMP TABLE scan_videos (file_path TEXT PRIMARY KEY, video_name TEXT, category TEXT);
+        CREATE TEMP TABLE scan_scenes (scene_row INTEGER PRIMARY KEY, file_path TEXT, scene_number INTEGER,
+                                       start_time REAL, end_time REAL, duration REAL);
+        CREATE TEMP TABLE scan_scene_tags (scene_row INTEGER, tag_name TEXT, score REAL);
+    """)
+    skipped = []
+    scene_row = 0
+    unique_paths = list(dict.fromkeys(paths))
+    with ThreadPoolExecutor(max_workers=SCAN_READ_WORKERS) as pool:
+        for batch_start in range(0, len(unique_paths), SCAN_BATCH_SIZE):
+            batch = unique_paths[batch_start:batch_start + SCAN_BATCH_SIZE]
+            videos, scenes, scene_tags = [], [], []
+            for file_path, video_name, category, result in pool.map(_read_scene_file, batch):
+                if video_name is None:
+                    skipped.append({"path": file_path, "reason": result})
+                    continue
+                videos.append((file_path, video_name, category))
+                for scene in result:
+                    scene_row += 1
+                    scenes.append((scene_row, file_path, scene.get('cena_n'), scene.get('start_time'),
+                                   scene.get('end_time'), scene.get('duration')))
+                    scene_tags.extend((scene_row, tag_name.replace(' ', '_'), score)
+                                      for tag_name, score in scene.get('tags_principais', {}).items())
+            # BEGIN adiado: só o banco temporário é travado
+            conn.execute("BEGIN")
+            conn.executemany("INSERT INTO scan_videos VALUES (?, ?, ?)", videos)
+            conn.executemany("INSERT INTO scan_scenes VALUES (?, ?, ?, ?, ?, ?)", scenes)
+            conn.executemany("INSERT INTO scan_scene_tags VALUES (?, ?, ?)", scene_tags)
+            conn.execute("COMMIT")
+            done = batch_start + len(batch)
+            _report(progress, int(done / len(unique_paths) * 70),
+                    f"Lendo os arquivos de cenas ({done}/{len(unique_paths)})...")
+    return skipped
+
+def scan_new_videos(paths, progress=None):
+    """
+    Cataloga os vídeos (file_paths relativos à raiz do projeto) a partir dos
+    seus arquivos de cenas (_cenas.npz ou _cenas.json). Vídeos que já têm cenas
+    no banco são mantidos como estão, então rodar de novo não duplica cenas.
+    """
+    conn = _connect()
+    try:
+        skipped = _stage_scene_files(conn, paths, progress)
+        _report(progress, 75, "Gravando os vídeos...")
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("""
+                INSERT OR IGNORE INTO videos (video_name, category, file_path)
+                SELECT video_name, category, file_path FROM scan_videos
+                WHERE file_path NOT IN (SELECT file_path FROM videos)""")
+            # Só recebem cenas os vídeos (novos ou não) que ainda não têm nenhuma
+            conn.execute("CREATE TEMP TABLE scan_targets (file_path TEXT PRIMARY KEY, video_id INTEGER)")
+            conn.execute("""
+                INSERT INTO scan_targets
+                SELECT file_path, video_id FROM (
+                    SELECT sv.file_path, MIN(v.video_id) AS video_id
+                    FROM scan_videos sv JOIN videos v ON v.file_path = sv.file_path GROUP BY sv.file_path) AS found
+                WHERE NOT EXISTS (SELECT 1 FROM scenes s WHERE s.video_id = found.video_id)""")
+
+            # Os scene_ids novos vêm depois do maior existente (BEGIN IMMEDIATE impede concorrentes)
+            _report(progress, 80, "Gravando as cenas...")
+            base_id = conn.execute("SELECT COALESCE(MAX(scene_id), 0) FROM scenes").fetchone()[0]
+            scenes = conn.execute("""
+                INSERT INTO scenes (scene_id, video_id, scene_number, start_time, end_time, duration)
+                SELECT ? + ss.scene_row, t.video_id, ss.scene_number, ss.start_time, ss.end_time, ss.duration
+                FROM scan_scenes ss JOIN scan_targets t ON t.file_path = ss.file_path""", (base_id,)).rowcount
+
+            _report(progress, 90, "Gravando as tags...")
+            conn.execute("""
+                CREATE TEMP TABLE scan_target_tags AS
+                SELECT sst.scene_row, sst.tag_name, sst.score FROM scan_scene_tags sst
+                JOIN scan_scenes ss ON ss.scene_row = sst.scene_row
+                JOIN scan_targets t ON t.file_path = ss.file_path""")
+            conn.execute("INSERT OR IGNORE INTO tags (tag_name) SELECT DISTINCT tag_name FROM scan_target_tags")
+            scene_tags = conn.execute("""
+                INSERT OR IGNORE INTO scene_tags (scene_id, tag_id, score)
+                SELECT ? + stt.scene_row, tg.tag_id, stt.score
+                FROM scan_target_tags stt JOIN tags tg ON tg.tag_name = stt.tag_name""", (base_id,)).rowcount
+            added = conn.execute("SELECT COUNT(*) FROM scan_targets").fetchone()[0]
+            staged = conn.execute("SELECT COUNT(*) FROM scan_videos").fetchone()[0]
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+    return {"added_count": added, "added_scenes": scenes, "added_scene_tags": scene_tags,
+            "already_cataloged_count": staged - added, "skipped": skipped}
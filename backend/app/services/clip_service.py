@@ -0,0 +1,306 @@
+import os
+import json
+import sqlite3
+import tempfile
+import asyncio
+import threading
+from pathlib import Path
+
+from .database_service import DB_FILE, resolve_video_path
+from .keyframe_index import get_keyframe_index
+from .media_tools import MediaToolError, run_tool
+
+# ==============================================================================
+# SEÇÃO 1: CONFIGURAÇÕES
+# ==============================================================================
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+CLIPS_DIR = BASE_DIR / "clips"
+
+# Número máximo de clipes sendo gerados ao mesmo tempo (o total de processos
+# ffmpeg do servidor continua limitado pelo media_tools)
+CLIP_WORKERS = int(os.environ.get("CLIP_WORKERS", 2))
+# Espaço máximo em disco ocupado pela pasta de clipes (padrão: 5 GB)
+CLIPS_MAX_BYTES = int(os.environ.get("CLIPS_MAX_BYTES", 5 * 1024 ** 3))
+# Se o keyframe estiver a menos disso do início da cena, o corte é feito só com cópia
+KEYFRAME_TOLERANCE = 0.5
+
+# Smart cut (reencodar só o trecho inicial e copiar o resto): o trecho reencodado
+# precisa ter os mesmos parâmetros da fonte (perfil, nível, formato de pixel,
+# resolução, time base, áudio), senão os frames copiados depois do corte são
+# decodificados com os parâmetros errados
+SMART_CUT_VIDEO_CODECS = ('h264',)
+SMART_CUT_AUDIO_CODECS = ('aac', None)
+# Perfis H.264 do ffprobe -> '-profile:v' do libx264
+X264_PROFILES = {
+    'Constrained Baseline': 'baseline', 'Baseline': 'baseline', 'Main': 'main', 'High': 'high',
+    'High 10': 'high10', 'High 4:2:2': 'high422', 'High 4:4:4 Predictive': 'high444',
+}
+# Formatos de pixel que o libx264 produz (os 10 bits dependem do build; se falhar, o clipe é reencodado inteiro)
+X264_PIX_FMTS = ('yuv420p', 'yuvj420p', 'yuv422p', 'yuvj422p', 'yuv444p', 'yuvj444p',
+                 'yuv420p10le', 'yuv422p10le', 'yuv444p10le')
+
+_clip_slots = None
+_in_flight: dict[int, asyncio.Future] = {}
+_quota_lock = threading.Lock()
+
+class ClipError(Exception):
+    """Erro ao gerar o clipe de uma cena."""
+
+# ==============================================================================
+# SEÇÃO 2: FUNÇÕES AUXILIARES DE FFMPEG/FFPROBE
+# ==============================================================================
+
+async def probe_stream_params(video_path):
+    """
+    Parâmetros do primeiro stream de vídeo e do primeiro de áudio (ou None), como
+    dicts do ffprobe: codec_name, profile, level, pix_fmt, width, height, time_base,
+    sample_rate, channels, channel_layout.
+    """
+    result = await run_tool('ffprobe', ['-v', 'error', '-show_entries',
+                                        'stream=codec_type,codec_name,profile,level,pix_fmt,width,height,time_base,'
+                                        'sample_rate,channels,channel_layout', '-of', 'json', video_path])
+    streams = json.loads(result.stdout or '{}').get('streams', [])
+    video = next((stream for stream in streams if stream.get('codec_type') == 'video'), None)
+    audio = next((stream for stream in streams if stream.get('codec_type') == 'audio'), None)
+    return video, audio
+
+def matching_head_args(video, audio):
+    """
+    Argumentos de encode do trecho inicial de um smart cut com os mesmos parâmetros
+    da fonte, ou None se o libx264/aac não conseguem reproduzi-los.
+    """
+    if video is None or video.get('codec_name') not in SMART_CUT_VIDEO_CODECS:
+        return None
+    profile = X264_PROFILES.get(video.get('profile'))
+    level = video.get('level')
+    pix_fmt = video.get('pix_fmt')
+    time_base = str(video.get('time_base', ''))
+    if profile is None or pix_fmt not in X264_PIX_FMTS or not level or level < 10 or not time_base.startswith('1/'):
+        return None
+    args = ['-c:v', 'libx264', '-preset', 'veryfast', '-crf', '20', '-profile:v', profile,
+            '-level:v', f'{level / 10:g}', '-pix_fmt', pix_fmt,
+            '-s', f"{video['width']}x{video['height']}", '-video_track_timescale', time_base[2:]]
+    if audio is None:
+        return args + ['-an']
+    # O encoder aac do ffmpeg só gera AAC-LC
+    if audio.get('codec_name') not in SMART_CUT_AUDIO_CODECS or audio.get('profile') not in ('LC', None):
+        return None
+    if not audio.get('sample_rate') or not audio.get('channels'):
+        return None
+    args += ['-c:a', 'aac', '-b:a', '160k', '-ar', str(audio['sample_rate']), '-ac', str(audio['channels'])]
+    if audio.get('channel_layout'):
+        args += ['-af', f"aformat=channel_layouts={audio['channel_layout']}"]
+    return args
+
+async def _run_ffmpeg(args):
+    try:
+        await run_tool('ffmpeg', ['-y', '-hide_banner', '-loglevel', 'error', *args])
+    except MediaToolError as e:
+        raise ClipError(f"Falha no FFmpeg. stderr: {e.stderr[-2000:]}")
+
+async def _copy_segment(video_path, start_time, end_time, output_path):
+    await _run_ffmpeg(['-ss', f'{start_time:.3f}', '-i', video_path, '-t', f'{end_time - start_time:.3f}',
+                       '-map', '0:v:0', '-map', '0:a:0?', '-c', 'copy',
+                       '-avoid_negative_ts', 'make_zero', output_path])
+
+async def _encode_segment(video_path, start_time, end_time, output_path, encode_args=None):
+    """Reencoda o trecho; sem 'encode_args' usa o formato padrão dos clipes (H.264 8 bits 4:2:0 + AAC)."""
+    encode_args = encode_args or ['-c:v', 'libx264', '-preset', 'veryfast', '-crf', '20', '-pix_fmt', 'yuv420p',
+                                  '-c:a', 'aac', '-b:a', '160k']
+    await _run_ffmpeg(['-ss', f'{start_time:.3f}', '-i', video_path, '-t', f'{end_time - start_time:.3f}',
+                       '-map', '0:v:0', '-map', '0:a:0?', *encode_args, output_path])
+
+async def _concat_segments(segment_paths, output_path):
+    with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False, encoding='utf-8') as f:
+        for segment in segment_paths:
+            f.write(f"file '{Path(segment).as_posix()}'\n")
+        list_path = f.name
+    try:
+        await _run_ffmpeg(['-f', 'concat', '-safe', '0', '-i', list_path, '-c', 'copy', output_path])
+    finally:
+        os.remove(list_path)
+
+async def cut_clip(video_path, start_time, end_time, output_path):
+    """
+    Corta o intervalo [start_time, end_time] do vídeo escolhendo a estratégia mais barata:
+    - 'copy': o início da cena coincide com um keyframe, basta copiar os pacotes;
+    - 'smart': reencoda apenas do início da cena até o primeiro keyframe, com os
+      mesmos parâmetros da fonte, e copia o resto;
+    - 'encode': reencoda a cena inteira (parâmetros que o encoder não reproduz,
+      falha no smart cut ou cena sem keyframes).
+    Retorna o nome da estratégia utilizada.
+    """
+    index = await get_keyframe_index(video_path)
+    keyframes = index.keyframes_between(start_time, end_time)
+    next_keyframe = next((k for k in keyframes if k >= start_time - 0.001), None)
+
+    if next_keyframe is None or next_keyframe >= end_time:
+        await _encode_segment(video_path, start_time, end_time, output_path)
+        return 'encode'
+
+    if next_keyframe - start_time <= KEYFRAME_TOLERANCE:
+        await _copy_segment(video_path, next_keyframe, end_time, output_path)
+        return 'copy'
+
+    head_args = matching_head_args(*await probe_stream_params(video_path))
+    if head_args is not None:
+        try:
+            with tempfile.TemporaryDirectory(dir=CLIPS_DIR) as temp_dir:
+                head_path = Path(temp_dir) / "head.mp4"
+                tail_path = Path(temp_dir) / "tail.mp4"
+                await _encode_segment(video_path, start_time, next_keyframe, head_path, head_args)
+                await _copy_segment(video_path, next_keyframe, end_time, tail_path)
+                await _concat_segments([head_path, tail_path], output_path)
+            return 'smart'
+        except ClipError as e:
+            # Ex.: libx264 sem suporte a 10 bits neste build
+            print(f"Aviso: smart cut falhou, reencodando o clipe inteiro: {e}")
+
+    await _encode_segment(video_path, start_time, end_time, output_path)
+    return 'encode'
+
+# ==============================================================================
+# SEÇÃO 3: CACHE DE CLIPES (LRU COM COTA DE DISCO)
+# ==============================================================================
+
+def _touch(path):
+    """Marca o clipe como usado recentemente (a ordem LRU é dada pelo mtime)."""
+    try:
+        os.utime(path, None)
+    except OSError:
+        pass
+
+def enforce_clip_quota(keep=None):
+    """
+    Remove os clipes usados há mais tempo até que a pasta caiba em CLIPS_MAX_BYTES,
+    limpando o clip_path das cenas correspondentes. 'keep' nunca é removido.
+    Retorna a lista de arquivos removidos.
+    """
+    with _quota_lock:
+        clips = []
+        for entry in os.scandir(CLIPS_DIR):
+            if entry.is_file() and entry.name.endswith('.mp4') and not entry.name.startswith('.'):
+                stat = entry.stat()
+                clips.append((stat.st_mtime, stat.st_size, entry.name))
+
+        total_size = sum(size for _, size, _ in clips)
+        evicted = []
+        for _, size, name in sorted(clips):
+            if total_size <= CLIPS_MAX_BYTES:
+                break
+            if keep is not None and name == Path(keep).name:
+                continue
+            try:
+                os.remove(CLIPS_DIR / name)
+            except OSError:
+                continue
+            total_size -= size
+            evicted.append(name)
+
+        if evicted:
+            conn = sqlite3.connect(DB_FILE)
+            try:
+                conn.executemany("UPDATE scenes SET clip_path = NULL WHERE clip_path = ?", [(name,) for name in evicted])
+                conn.commit()
+            finally:
+                conn.close()
+        return evicted
+
+# ==============================================================================
+# SEÇÃO 4: EXTRAÇÃO DE CLIPES POR CENA
+# ==============================================================================
+
+def _load_scene(scene_id):
+    conn = sqlite3.connect(DB_FILE)
+    conn.row_factory = sqlite3.Row
+    try:
+        return conn.execute("""
+            SELECT s.scene_id, s.start_time, s.end_time, s.clip_path, v.file_path
+            FROM scenes s JOIN videos v ON s.video_id = v.video_id
+            WHERE s.scene_id = ?""", (scene_id,)).fetchone()
+    finally:
+        conn.close()
+
+async def extract_scene_clip(scene_id: int):
+    """
+    Gera (ou reaproveita do cache) o clipe de uma cena e registra o clip_path no DB.
+    No máximo CLIP_WORKERS clipes são gerados ao mesmo tempo.
+    """
+    global _clip_slots
+    if _clip_slots is None:
+        _clip_slots = asyncio.Semaphore(CLIP_WORKERS)
+
+    scene = _load_scene(scene_id)
+    if scene is None:
+        raise LookupError(f"Cena {scene_id} não encontrada.")
+
+    if scene['clip_path'] and (CLIPS_DIR / scene['clip_path']).exists():
+        _touch(CLIPS_DIR / scene['clip_path'])
+        return {"scene_id": scene_id, "clip_path": scene['clip_path'], "strategy": "cached"}
+
+    video_path = resolve_video_path(scene['file_path'])
+    if not video_path.exists():
+        raise FileNotFoundError(f"Vídeo de origem não encontrado: {video_path}")
+
+    clip_name = f"scene_{scene_id}.mp4"
+    final_path = CLIPS_DIR / clip_name
+    temp_path = CLIPS_DIR / f".scene_{scene_id}.part.mp4"
+    try:
+        async with _clip_slots:
+            try:
+                strategy = await cut_clip(video_path, scene['start_time'], scene['end_time'], temp_path)
+            except MediaToolError as e:
+                # ffprobe (codecs, keyframes) também pode falhar, não só o ffmpeg do corte
+                raise ClipError(str(e))
+        os.replace(temp_path, final_path)
+    finally:
+        if temp_path.exists():
+            os.remove(temp_path)
+
+    conn = sqlite3.connect(DB_FILE)
+    try:
+        conn.execute("UPDATE scenes SET clip_path = ? WHERE scene_id = ?", (clip_name, scene_id))
+        conn.commit()
+    finally:
+        conn.close()
+
+    await asyncio.to_thread(enforce_clip_quota, clip_name)
+    return {"scene_id": scene_id, "clip_path": clip_name, "strategy": strategy}
+
+async def get_or_create_clip(scene_id: int):
+    """
+    Agenda a extração da cena. Pedidos simultâneos para a mesma cena
+    compartilham o mesmo trabalho em vez de disparar dois ffmpeg.
+    """
+    future = _in_flight.get(scene_id)
+    if future is None:
+        future = asyncio.ensure_future(extract_scene_clip(scene_id))
+        _in_flight[scene_id] = future
+        future.add_done_callback(lambda _: _in_flight.pop(scene_id, None))
+    return await asyncio.shield(future)
+
+async def export_clips(scene_ids, callback):
+    """
+    Exporta em lote os clipes de uma lista de cenas, respeitando o limite do pool.
+    Retorna a lista de resultados (um por cena) com clip_path ou a mensagem de erro.
+    """
+    results = []
+    total = len(scene_ids)
+    if total == 0:
+        await callback({"status": "completed", "progress": 100, "message": "Nenhuma cena para exportar."})
+        return results
+
+    async def export_one(scene_id):
+        try:
+            return await get_or_create_clip(scene_id)
+        except Exception as e:
+            return {"scene_id": scene_id, "error": str(e)}
+
+    tasks = [asyncio.ensure_future(export_one(scene_id)) for scene_id in scene_ids]
+    for done_count, task in enumerate(asyncio.as_completed(tasks), start=1):
+        results.append(await task)
+        await callback({"status": "processing", "progress": int(done_count / total * 100),
+                        "message": f"Exportando clipes ({done_count}/{total})"})
+
+    await callback({"status": "completed", "progress": 100, "message": "Exportação concluída!"})
+    return results
@@ -6,12 +6,198 @@ import os
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
 DB_FILE = BASE_DIR.parent / "cenas_database.db"
 
+def resolve_video_path(file_path: str) -> Path:
+    """
+    Converte o file_path salvo na tabela 'videos' em um caminho absoluto.
+    Os scripts de catalogação salvam caminhos relativos à raiz do projeto,
+    enquanto o pipeline de processamento salva caminhos absolutos.
+    """
+    path = Path(file_path)
+    if not path.is_absolute():
+        path = BASE_DIR.parent / path
+    return path
+
+def init_database():
+    """
+    Cria as tabelas auxiliares usadas pelo backend (as tabelas principais são
+    criadas por 'construir_banco_de_cenas.py'). Seguro para rodar a cada inicialização.
+    """
+    conn = sqlite3.connect(DB_FILE)
+    try:
+        conn.executescript(CATALOG_META_TABLE + """
+        CREATE TABLE IF NOT EXISTS media_info (
+            file_path TEXT PRIMARY KEY,
+            file_size INTEGER NOT NULL,
+            mtime REAL NOT NULL,
+            format_name TEXT,
+            duration REAL,
+            bit_rate INTEGER,
+            video_codec TEXT,
+            width INTEGER,
+            height INTEGER,
+            fps REAL,
+            audio_codec TEXT,
+            keyframe_interval REAL,
+            probed_at REAL NOT NULL
+        );
+
+        -- Uma linha por job de processamento (ver job_metrics.py); stages_json guarda os segundos por etapa
+        CREATE TABLE IF NOT EXISTS job_metrics (
+            job_id TEXT PRIMARY KEY,
+            video TEXT,
+            status TEXT NOT NULL,
+            started_at REAL NOT NULL,
+            total_seconds REAL NOT NULL,
+            frames INTEGER NOT NULL,
+            frames_per_second REAL,
+            peak_rss_bytes INTEGER,
+            stages_json TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_job_metrics_started_at ON job_metrics (started_at);
+
+        -- Fila de processamento para workers remotos (ver job_queue.py)
+        CREATE TABLE IF NOT EXISTS processing_jobs (
+            job_id TEXT PRIMARY KEY,
+            video_path TEXT NOT NULL,
+            folder TEXT NOT NULL,
+            filename TEXT NOT NULL,
+            params_json TEXT NOT NULL,
+            status TEXT NOT NULL,
+            worker_id TEXT,
+            lease_expires_at REAL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_processing_jobs_status ON processing_jobs (status, created_at);
+        CREATE TABLE IF NOT EXISTS workers (
+            worker_id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            host TEXT,
+            info_json TEXT,
+            registered_at REAL NOT NULL,
+            last_seen REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS scene_checkpoints (
+            video_path TEXT PRIMARY KEY,
+            signature TEXT NOT NULL,
+            next_frame INTEGER NOT NULL,
+            state_json TEXT NOT NULL,
+            updated_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS scene_checkpoint_scenes (
+            video_path TEXT NOT NULL,
+            scene_number INTEGER NOT NULL,
+            scene_json TEXT NOT NULL,
+            PRIMARY KEY (video_path, scene_number)
+        );
+        CREATE TABLE IF NOT EXISTS video_fingerprints (
+            file_path TEXT PRIMARY KEY,
+            file_size INTEGER NOT NULL,
+            mtime REAL NOT NULL,
+            duration REAL NOT NULL,
+            frame_hashes TEXT NOT NULL,
+            fingerprinted_at REAL NOT NULL
+        );
+        """)
+        conn.commit()
+        ensure_catalog_triggers(conn)
+    finally:
+        conn.close()
+
+CATALOG_META_TABLE = """
+-- Contador incrementado a cada mudança no catálogo de cenas (usado em caches e ETags)
+CREATE TABLE IF NOT EXISTS catalog_meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO catalog_meta (key, value) VALUES ('generation', 0);
+-- Identifica este arquivo de banco: um DB recriado não reaproveita ETags antigas
+INSERT OR IGNORE INTO catalog_meta (key, value) VALUES ('catalog_id', abs(random()) % 4294967296);
+"""
+
+# Só criados quando as tabelas principais já existem. As tags de uma cena só mudam
+# junto com a própria cena (todos os escritores apagam e reinserem a cena), então
+# os gatilhos em videos/scenes bastam para detectar qualquer mudança visível.
+CATALOG_INDEXES_AND_TRIGGERS = """
+CREATE INDEX IF NOT EXISTS idx_scenes_video_number ON scenes (video_id, scene_number);
+-- Lista de cenas de cada tag (a chave primária de scene_tags começa pela cena)
+CREATE INDEX IF NOT EXISTS idx_scene_tags_tag ON scene_tags (tag_id, scene_id);
+
+CREATE TRIGGER IF NOT EXISTS catalog_generation_videos_insert AFTER INSERT ON videos
+BEGIN UPDATE catalog_meta SET value = value + 1 WHERE key = 'generation'; END;
+CREATE TRIGGER IF NOT EXISTS catalog_generation_videos_update AFTER UPDATE OF video_name ON videos
+BEGIN UPDATE catalog_meta SET value = value + 1 WHERE key = 'generation'; END;
+CREATE TRIGGER IF NOT EXISTS catalog_generation_videos_delete AFTER DELETE ON videos
+BEGIN UPDATE catalog_meta SET value = value + 1 WHERE key = 'generation'; END;
+CREATE TRIGGER IF NOT EXISTS catalog_generation_scenes_insert AFTER INSERT ON scenes
+BEGIN UPDATE catalog_meta SET value = value + 1 WHERE key = 'generation'; END;
+CREATE TRIGGER IF NOT EXISTS catalog_generation_scenes_update
+AFTER UPDATE OF video_id, scene_number, start_time, end_time, duration ON scenes
+BEGIN UPDATE catalog_meta SET value = value + 1 WHERE key = 'generation'; END;
+CREATE TRIGGER IF NOT EXISTS catalog_generation_scenes_delete AFTER DELETE ON scenes
+BEGIN UPDATE catalog_meta SET value = value + 1 WHERE key = 'generation'; END;
+"""
+
+def ensure_catalog_triggers(conn) -> bool:
+    """
+    Instala os índices e gatilhos do catálogo assim que as tabelas principais
+    existirem. Elas costumam ser criadas pelo 'construir_banco_de_cenas.py' depois
+    que o backend já iniciou, então isto é verificado a cada leitura da geração.
+    Retorna True se instalou agora (e então avança a geração: o que foi gravado
+    antes dos gatilhos não tinha sido contado).
+    """
+    names = {row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE name IN ('videos', 'scenes', 'scene_tags', 'catalog_generation_scenes_delete')")}
+    if 'catalog_generation_scenes_delete' in names or not {'videos', 'scenes', 'scene_tags'} <= names:
+        return False
+    conn.executescript(CATALOG_META_TABLE + CATALOG_INDEXES_AND_TRIGGERS +
+                       "UPDATE catalog_meta SET value = value + 1 WHERE key = 'generation';")
+    return True
+
+def get_catalog_generation(conn) -> str:
+    """Versão atual do catálogo (muda sempre que vídeos ou cenas mudam), como texto curto."""
+    ensure_catalog_triggers(conn)
+    values = dict(conn.execute("SELECT key, value FROM catalog_meta WHERE key IN ('catalog_id', 'generation')").fetchall())
+    return f"{values.get('catalog_id', 0):x}.{values.get('generation', 0):x}"
+
+def get_video_scenes(conn, video_name: str, top_tags: int = 0):
+    """
+    Cenas de um vídeo (com scene_id) em uma única consulta indexada, em ordem.
+    Com top_tags > 0, cada cena traz também suas top_tags tags de maior score.
+    """
+    params = []
+    tags_column = ""
+    if top_tags > 0:
+        tags_column = """,
+            (SELECT json_group_object(tag_name, score) FROM (
+                SELECT t.tag_name, st.score FROM scene_tags st JOIN tags t ON t.tag_id = st.tag_id
+                WHERE st.scene_id = s.scene_id ORDER BY st.score DESC LIMIT ?)) AS top_tags"""
+        params.append(top_tags)
+    params.append(video_name)
+    rows = conn.execute(f"""
+        SELECT s.scene_id, s.scene_number, s.start_time, s.end_time, s.duration{tags_column}
+        FROM videos v JOIN scenes s ON s.video_id = v.video_id
+        WHERE v.video_name = ?
+        ORDER BY s.scene_number
+    """, params).fetchall()
+
+    scenes = []
+    for row in rows:
+        scene = {"cena_n": row[1], "start_time": row[2], "end_time": row[3], "duration": row[4], "scene_id": row[0]}
+        if top_tags > 0:
+            scene["tags_principais"] = json.loads(row[5]) if row[5] else {}
+        scenes.append(scene)
+    return scenes
+
 def add_video_to_database(video_path_str: str, category_name: str, scenes_data: list):
     """
     Adiciona um único vídeo e suas cenas ao banco de dados.
     Esta é uma versão focada de 'construir_banco_de_cenas.py'.
     """
     conn = sqlite3.connect(DB_FILE)
+    ensure_catalog_triggers(conn)
     cursor = conn.cursor()
 
     base_video_name = Path(video_path_str).stem
@@ -0,0 +1,340 @@
+"""
+Impressões digitais perceptuais de vídeos, para achar duplicatas (re-encodes,
+cópias em outras pastas) sem rodar o modelo de novo.
+
+A impressão de um vídeo é o pHash (64 bits) de FINGERPRINT_FRAMES frames em
+posições fixas da duração, mais a duração do ffprobe. Duas impressões batem se
+as durações são próximas e a distância de Hamming somada dos frames fica abaixo
+de DUPLICATE_MAX_BITS por frame. A busca usa uma BK-tree sobre os hashes concatenados.
+
+Uso (a partir da pasta 'backend'):
+    python -m app.services.fingerprint_service --scan       # calcula as impressões da pasta de vídeos
+    python -m app.services.fingerprint_service --clusters   # lista os grupos de duplicatas
+"""
+import os
+import json
+import time
+import shutil
+import sqlite3
+import asyncio
+import argparse
+import tempfile
+import threading
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from .database_service import BASE_DIR, DB_FILE
+from .media_info_service import get_media_info
+from .media_tools import MediaToolError, run_tool
+from .scene_store import SceneFileError, find_scene_file, read_scene_params, read_scenes
+
+# ==============================================================================
+# SEÇÃO 1: CONFIGURAÇÕES
+# ==============================================================================
+FINGERPRINT_FRAMES = int(os.environ.get("FINGERPRINT_FRAMES", 8))
+# Bits diferentes tolerados por frame (em média) entre duas cópias do mesmo vídeo
+DUPLICATE_MAX_BITS = int(os.environ.get("DUPLICATE_MAX_BITS", 6))
+# Diferença de duração tolerada: o maior entre o valor absoluto e a fração da duração
+DURATION_TOLERANCE_SECONDS = 1.0
+DURATION_TOLERANCE_RATIO = 0.005
+
+VIDEOS_ROOT_FOLDER = BASE_DIR / "videos"
+SUPPORTED_EXTENSIONS = ('.mp4', '.mkv', '.mov', '.avi', '.webm', '.mpg', '.wmv')
+
+HASH_SIZE = 8
+_DCT_SIZE = 32
+
+# ==============================================================================
+# SEÇÃO 2: PHASH DOS FRAMES
+# ==============================================================================
+
+def _dct_matrix(n):
+    k = np.arange(n)[:, None]
+    matrix = np.cos(np.pi * (2 * np.arange(n)[None, :] + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+_DCT = _dct_matrix(_DCT_SIZE)
+
+def phash(image):
+    """
+    pHash de 64 bits: DCT da imagem em 32x32 tons de cinza; cada bit diz se o
+    coeficiente de baixa frequência está acima da mediana (sem o termo DC).
+    Resiste a mudança de resolução, bitrate e codec.
+    """
+    pixels = np.asarray(image.convert("L").resize((_DCT_SIZE, _DCT_SIZE), Image.LANCZOS), dtype=np.float64)
+    coefficients = (_DCT @ pixels @ _DCT.T)[:HASH_SIZE, :HASH_SIZE].ravel()
+    bits = coefficients > np.median(coefficients[1:])
+    return int(np.packbits(bits).view('>u8')[0])
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+def combined_hash(frame_hashes):
+    """Hashes dos frames concatenados em um inteiro (a distância de Hamming vira a soma por frame)."""
+    value = 0
+    for frame_hash in frame_hashes:
+        value = (value << 64) | frame_hash
+    return value
+
+async def _grab_frame(video_path, timestamp, output_path):
+    # -ss antes do -i: busca rápida pelo keyframe; um frame pequeno basta para o hash
+    await run_tool('ffmpeg', ['-ss', f'{timestamp:.3f}', '-i', video_path, '-frames:v', '1', '-vf', 'scale=128:-2',
+                              '-hide_banner', '-loglevel', 'error', '-y', output_path])
+    with Image.open(output_path) as image:
+        return phash(image)
+
+async def compute_fingerprint(video_path, duration):
+    """pHash de FINGERPRINT_FRAMES frames espalhados pelo vídeo (evitando o início e o fim)."""
+    temp_dir = tempfile.mkdtemp(prefix="fingerprint_")
+    try:
+        timestamps = [duration * (i + 1) / (FINGERPRINT_FRAMES + 1) for i in range(FINGERPRINT_FRAMES)]
+        return list(await asyncio.gather(*(_grab_frame(video_path, t, os.path.join(temp_dir, f"{i}.png"))
+                                           for i, t in enumerate(timestamps))))
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+# ==============================================================================
+# SEÇÃO 3: CACHE NA TABELA video_fingerprints
+# ==============================================================================
+
+def _file_key(video_path):
+    path = str(Path(video_path).resolve())
+    stat = os.stat(path)
+    return path, stat.st_size, stat.st_mtime
+
+async def get_fingerprint(video_path):
+    """
+    Impressão do vídeo {'file_path', 'duration', 'frame_hashes'}, calculada só se o
+    arquivo for novo ou tiver mudado. None se o ffprobe/ffmpeg falhar.
+    """
+    path, size, mtime = _file_key(video_path)
+    conn = sqlite3.connect(DB_FILE)
+    try:
+        row = conn.execute("SELECT duration, frame_hashes FROM video_fingerprints WHERE file_path = ? AND file_size = ? AND mtime = ?",
+                           (path, size, mtime)).fetchone()
+    finally:
+        conn.close()
+    if row is not None:
+        return {"file_path": path, "duration": row[0], "frame_hashes": [int(h, 16) for h in json.loads(row[1])]}
+
+    media_info = await get_media_info(video_path)
+    if not media_info or not media_info['duration']:
+        return None
+    try:
+        frame_hashes = await compute_fingerprint(path, media_info['duration'])
+    except (MediaToolError, OSError) as e:
+        print(f"Aviso: não foi possível calcular a impressão de '{path}': {e}")
+        return None
+
+    conn = sqlite3.connect(DB_FILE)
+    try:
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO video_fingerprints (file_path, file_size, mtime, duration, frame_hashes, fingerprinted_at) "
+                         "VALUES (?, ?, ?, ?, ?, ?)", (path, size, mtime, media_info['duration'],
+                                                       json.dumps([f"{h:016x}" for h in frame_hashes]), time.time()))
+    finally:
+        conn.close()
+    return {"file_path": path, "duration": media_info['duration'], "frame_hashes": frame_hashes}
+
+# ==============================================================================
+# SEÇÃO 4: ÍNDICE (BK-TREE)
+# ==============================================================================
+
+class BKTree:
+    """
+    Árvore de Burkhard-Keller para a distância de Hamming: cada filho fica na
+    aresta com a sua distância ao pai e, pela desigualdade triangular, a busca
+    com raio r só desce nas arestas entre d - r e d + r.
+    """
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, key, item):
+        self.size += 1
+        if self.root is None:
+            self.root = (key, [item], {})
+            return
+        node = self.root
+        while True:
+            distance = hamming(key, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            if distance not in node[2]:
+                node[2][distance] = (key, [item], {})
+                return
+            node = node[2][distance]
+
+    def search(self, key, radius):
+        """[(distância, item)] com distância <= radius, em ordem crescente."""
+        results = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node_key, items, children = stack.pop()
+            distance = hamming(key, node_key)
+            if distance <= radius:
+                results.extend((distance, item) for item in items)
+            stack.extend(child for edge, child in children.items() if distance - radius <= edge <= distance + radius)
+        results.sort(key=lambda result: result[0])
+        return results
+
+_index_lock = threading.Lock()
+_index = {"signature": None, "tree": None}
+
+def _load_index(conn):
+    """BK-tree com todas as impressões; refeita quando a tabela muda (também por outros processos)."""
+    signature = conn.execute("SELECT COUNT(*), MAX(fingerprinted_at) FROM video_fingerprints").fetchone()
+    with _index_lock:
+        if _index["signature"] != signature:
+            tree = BKTree()
+            for path, duration, frame_hashes in conn.execute("SELECT file_path, duration, frame_hashes FROM video_fingerprints"):
+                hashes = [int(h, 16) for h in json.loads(frame_hashes)]
+                if len(hashes) == FINGERPRINT_FRAMES:
+                    tree.add(combined_hash(hashes), (path, duration))
+            _index.update(signature=signature, tree=tree)
+        return _index["tree"]
+
+def _durations_match(a, b):
+    return abs(a - b) <= max(DURATION_TOLERANCE_SECONDS, DURATION_TOLERANCE_RATIO * max(a, b))
+
+def find_duplicates(fingerprint):
+    """Outros vídeos (ainda existentes) com a mesma impressão: [(caminho, distância)] do mais parecido ao menos."""
+    if len(fingerprint["frame_hashes"]) != FINGERPRINT_FRAMES:
+        return []
+    conn = sqlite3.connect(DB_FILE)
+    try:
+        tree = _load_index(conn)
+    finally:
+        conn.close()
+    matches = tree.search(combined_hash(fingerprint["frame_hashes"]), DUPLICATE_MAX_BITS * FINGERPRINT_FRAMES)
+    return [(path, distance) for distance, (path, duration) in matches
+            if path != fingerprint["file_path"] and _durations_match(duration, fingerprint["duration"]) and os.path.exists(path)]
+
+def _scenes_of(video_path, params):
+    """Cenas do vídeo, só se o arquivo foi gerado com exatamente os mesmos parâmetros."""
+    scene_path = find_scene_file(Path(video_path).parent, Path(video_path).stem)
+    if scene_path is None:
+        return None
+    try:
+        if read_scene_params(scene_path) != params:
+            return None
+        return read_scenes(scene_path)
+    except SceneFileError:
+        return None
+
+def find_processed_duplicate(fingerprint, params):
+    """
+    Primeira duplicata já processada com os mesmos parâmetros ('params', como
+    gravados no arquivo de cenas): (caminho, cenas), ou None. Arquivos sem
+    parâmetros (JSON antigo) não são reaproveitados. As cenas voltam ajustadas
+    à duração deste vídeo.
+    """
+    # Mesma normalização da gravação (tuplas viram listas no JSON)
+    params = json.loads(json.dumps(params, sort_keys=True))
+    for path, _ in find_duplicates(fingerprint):
+        scenes = _scenes_of(path, params)
+        if not scenes:
+            continue
+        duration = fingerprint["duration"]
+        adjusted = []
+        for scene in scenes:
+            if scene["start_time"] >= duration:
+                break
+            end_time = min(scene["end_time"], duration)
+            adjusted.append({**scene, "end_time": round(end_time, 3), "duration": round(end_time - scene["start_time"], 3)})
+        if adjusted:
+            adjusted[-1]["end_time"] = round(duration, 3)
+            adjusted[-1]["duration"] = round(duration - adjusted[-1]["start_time"], 3)
+            return path, adjusted
+    return None
+
+def duplicate_clusters():
+    """Grupos de vídeos com a mesma impressão (componentes conexos das correspondências)."""
+    conn = sqlite3.connect(DB_FILE)
+    try:
+        tree = _load_index(conn)
+        rows = conn.execute("SELECT file_path, duration, frame_hashes FROM video_fingerprints").fetchall()
+    finally:
+        conn.close()
+
+    parent = {}
+    def find(path):
+        while parent.setdefault(path, path) != path:
+            parent[path] = parent[parent[path]]
+            path = parent[path]
+        return path
+
+    edges = []
+    for path, duration, frame_hashes in rows:
+        hashes = [int(h, 16) for h in json.loads(frame_hashes)]
+        if len(hashes) != FINGERPRINT_FRAMES or not os.path.exists(path):
+            continue
+        for distance, (other, other_duration) in tree.search(combined_hash(hashes), DUPLICATE_MAX_BITS * FINGERPRINT_FRAMES):
+            if other != path and _durations_match(duration, other_duration) and os.path.exists(other):
+                edges.append((path, other, distance))
+                parent[find(path)] = find(other)
+
+    max_distance = {}
+    for path, _, distance in edges:
+        root = find(path)
+        max_distance[root] = max(max_distance.get(root, 0), distance)
+
+    durations = {path: duration for path, duration, _ in rows}
+    groups = {}
+    for path in parent:
+        groups.setdefault(find(path), []).append(path)
+    clusters = []
+    for root, members in groups.items():
+        if len(members) < 2:
+            continue
+        clusters.append({
+            "max_distance": max_distance.get(root, 0),
+            "videos": [{"file_path": _display_path(path), "duration": durations[path],
+                        "has_scenes": find_scene_file(Path(path).parent, Path(path).stem) is not None}
+                       for path in sorted(members)],
+        })
+    clusters.sort(key=lambda cluster: -len(cluster["videos"]))
+    return clusters
+
+def _display_path(path):
+    # Mesmo formato da tabela 'videos' (relativo à raiz do projeto) quando possível
+    try:
+        return Path(path).relative_to(BASE_DIR.parent).as_posix()
+    except ValueError:
+        return path
+
+# ==============================================================================
+# SEÇÃO 5: VARREDURA DA PASTA DE VÍDEOS
+# ==============================================================================
+
+def library_videos(root=VIDEOS_ROOT_FOLDER):
+    return [str(Path(folder) / file) for folder, _, files in os.walk(root)
+            for file in files if file.lower().endswith(SUPPORTED_EXTENSIONS)]
+
+async def fingerprint_library(root=VIDEOS_ROOT_FOLDER):
+    """Calcula as impressões que faltam; os processos de ffmpeg são limitados pelo media_tools."""
+    video_paths = library_videos(root)
+    fingerprints = await asyncio.gather(*(get_fingerprint(path) for path in video_paths))
+    failed = sorted(path for path, fingerprint in zip(video_paths, fingerprints) if fingerprint is None)
+    return {"video_count": len(video_paths), "fingerprint_count": len(video_paths) - len(failed), "failed": failed}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scan", action="store_true", help="Calcula as impressões dos vídeos da pasta")
+    parser.add_argument("--clusters", action="store_true", help="Lista os grupos de duplicatas")
+    parser.add_argument("--root", default=str(VIDEOS_ROOT_FOLDER), help="Pasta de vídeos (padrão: backend/videos)")
+    args = parser.parse_args()
+
+    from .database_service import init_database
+    init_database()
+    if args.scan:
+        print(json.dumps(asyncio.run(fingerprint_library(args.root)), indent=2, ensure_ascii=False))
+    if args.clusters or not args.scan:
+        print(json.dumps(duplicate_clusters(), indent=2, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+import os
+import queue
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, asdict, field
+
+# ==============================================================================
+# SEÇÃO 1: CONFIGURAÇÃO DO BACKEND DE INFERÊNCIA
+# ==============================================================================
+
+# Todos os valores podem ser sobrescritos por variáveis de ambiente; 0 = automático
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "threads")  # 'threads' ou 'processes'
+INFERENCE_SESSIONS = int(os.environ.get("INFERENCE_SESSIONS", 0))
+INFERENCE_INTRA_THREADS = int(os.environ.get("INFERENCE_INTRA_THREADS", 0))
+INFERENCE_INTER_THREADS = int(os.environ.get("INFERENCE_INTER_THREADS", 1))
+INFERENCE_GRAPH_OPTIMIZATION = os.environ.get("INFERENCE_GRAPH_OPTIMIZATION", "all")
+INFERENCE_CPU_MEM_ARENA = os.environ.get("INFERENCE_CPU_MEM_ARENA", "1") == "1"
+
+# Nomes dos níveis do onnxruntime, resolvidos só quando o primeiro modelo é carregado
+GRAPH_OPTIMIZATION_LEVELS = {
+    "disable": "ORT_DISABLE_ALL",
+    "basic": "ORT_ENABLE_BASIC",
+    "extended": "ORT_ENABLE_EXTENDED",
+    "all": "ORT_ENABLE_ALL",
+}
+
+def _ort():
+    # O onnxruntime é importado sob demanda para não pesar na inicialização do servidor
+    import onnxruntime
+    return onnxruntime
+
+def available_providers():
+    """Providers de execução na ordem de preferência (GPU primeiro, se o build tiver suporte)."""
+    providers = _ort().get_available_providers()
+    if 'CUDAExecutionProvider' in providers:
+        return ['CUDAExecutionProvider', 'CPUExecutionProvider']
+    return ['CPUExecutionProvider']
+
+@dataclass
+class InferenceConfig:
+    backend: str = "threads"
+    sessions: int = 1
+    intra_op_threads: int = 1
+    inter_op_threads: int = 1
+    graph_optimization: str = "all"
+    cpu_mem_arena: bool = True
+    providers: list = field(default_factory=lambda: ['CPUExecutionProvider'])
+
+def auto_config(providers, sessions=INFERENCE_SESSIONS, intra_op_threads=INFERENCE_INTRA_THREADS,
+                backend=INFERENCE_BACKEND) -> InferenceConfig:
+    """
+    Dimensiona o pool a partir do número de núcleos. Na GPU uma sessão basta;
+    na CPU usamos ~4 threads por sessão, que costuma ser o ponto em que o ganho
+    de mais threads intra-op deixa de compensar frente a lotes em paralelo.
+    """
+    cores = os.cpu_count() or 1
+    if 'CUDAExecutionProvider' in providers:
+        sessions = sessions or 1
+        intra_op_threads = intra_op_threads or 1
+    else:
+        sessions = sessions or max(1, cores // 4)
+        intra_op_threads = intra_op_threads or max(1, cores // sessions)
+    return InferenceConfig(backend=backend, sessions=sessions, intra_op_threads=intra_op_threads,
+                           inter_op_threads=INFERENCE_INTER_THREADS, graph_optimization=INFERENCE_GRAPH_OPTIMIZATION,
+                           cpu_mem_arena=INFERENCE_CPU_MEM_ARENA, providers=list(providers))
+
+def build_session_options(config: InferenceConfig):
+    rt = _ort()
+    options = rt.SessionOptions()
+    options.intra_op_num_threads = config.intra_op_threads
+    options.inter_op_num_threads = config.inter_op_threads
+    options.execution_mode = rt.ExecutionMode.ORT_SEQUENTIAL
+    level = GRAPH_OPTIMIZATION_LEVELS.get(config.graph_optimization, "ORT_ENABLE_ALL")
+    options.graph_optimization_level = getattr(rt.GraphOptimizationLevel, level)
+    options.enable_cpu_mem_arena = config.cpu_mem_arena
+    return options
+
+def create_session(model_path, config: InferenceConfig):
+    return _ort().InferenceSession(model_path, sess_options=build_session_options(config), providers=config.providers)
+
+# ==============================================================================
+# SEÇÃO 2: POOL DE SESSÕES EM THREADS
+# ==============================================================================
+
+class ThreadSessionPool:
+    """
+    K sessões no mesmo processo. O onnxruntime libera o GIL durante o run(),
+    então até K lotes rodam de fato em paralelo, cada um com suas threads intra-op.
+    """
+    def __init__(self, model_path, config: InferenceConfig):
+        self.config = config
+        self.size = config.sessions
+        self._sessions = [create_session(model_path, config) for _ in range(self.size)]
+        self._idle = queue.Queue()
+        for session in self._sessions:
+            self._idle.put(session)
+        first = self._sessions[0]
+        self.input_name = first.get_inputs()[0].name
+        self.input_shape = first.get_inputs()[0].shape
+        self.output_name = first.get_outputs()[0].name
+
+    def run(self, batch_array):
+        session = self._idle.get()
+        try:
+            return session.run([self.output_name], {self.input_name: batch_array})[0]
+        finally:
+            self._idle.put(session)
+
+    def warm_up(self, batch_array):
+        """Roda o lote uma vez em cada sessão."""
+        for session in self._sessions:
+            session.run([self.output_name], {self.input_name: batch_array})
+
+    def close(self):
+        self._sessions = []
+
+# ==============================================================================
+# SEÇÃO 3: POOL DE SESSÕES EM PROCESSOS
+# ==============================================================================
+
+_worker_session = None
+
+def _init_worker(model_path, config_dict):
+    global _worker_session
+    _worker_session = create_session(model_path, InferenceConfig(**config_dict))
+
+def _worker_run(batch_array):
+    inputs = _worker_session.get_inputs()
+    outputs = _worker_session.get_outputs()
+    return _worker_session.run([outputs[0].name], {inputs[0].name: batch_array})[0]
+
+class ProcessSessionPool:
+    """
+    K processos, cada um com sua própria sessão. Isola completamente os workers
+    (útil quando o pré/pós-processamento em Python disputa o GIL), ao custo de
+    copiar cada lote entre processos.
+    """
+    def __init__(self, model_path, config: InferenceConfig):
+        self.config = config
+        self.size = config.sessions
+        self._executor = ProcessPoolExecutor(max_workers=self.size, initializer=_init_worker,
+                                             initargs=(model_path, asdict(config)))
+        # Os metadados de entrada/saída vêm de uma sessão leve no processo principal
+        probe = _ort().InferenceSession(model_path, providers=['CPUExecutionProvider'])
+        self.input_name = probe.get_inputs()[0].name
+        self.input_shape = probe.get_inputs()[0].shape
+        self.output_name = probe.get_outputs()[0].name
+        del probe
+
+    def run(self, batch_array):
+        return self._executor.submit(_worker_run, batch_array).result()
+
+    def warm_up(self, batch_array):
+        # Um lote por processo (os processos ociosos pegam as tarefas, então cada um recebe ~1)
+        futures = [self._executor.submit(_worker_run, batch_array) for _ in range(self.size)]
+        for future in futures:
+            future.result()
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+def create_pool(model_path, config: InferenceConfig):
+    if config.backend == "processes":
+        return ProcessSessionPool(model_path, config)
+    return ThreadSessionPool(model_path, config)
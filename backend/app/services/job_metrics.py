@@ -0,0 +1,261 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import resource
+import threading
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+from .database_service import DB_FILE
+
+# ==============================================================================
+# SEÇÃO 1: CONFIGURAÇÕES
+# ==============================================================================
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+PROFILES_DIR = BASE_DIR / "profiles"
+
+# Etapas do pipeline, na ordem em que aparecem em um job
+PIPELINE_STAGES = ("fingerprint", "model_load", "extraction", "image_load", "preprocessing", "inference",
+                   "thresholding", "segmentation", "checkpoint", "scene_write", "db_write")
+
+RSS_SAMPLE_INTERVAL = 0.5
+PROFILER_INTERVAL = float(os.environ.get("PROFILER_INTERVAL", 0.005))
+
+def _current_rss():
+    """RSS atual do processo em bytes (Linux); fora dele, o pico informado pelo getrusage."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+# ==============================================================================
+# SEÇÃO 2: MÉTRICAS DE UM JOB
+# ==============================================================================
+
+class JobMetrics:
+    """
+    Tempo acumulado por etapa, frames processados e pico de memória de um job.
+    Etapas que rodam em várias threads ao mesmo tempo (leitura de imagens,
+    pré-processamento, inferência) somam o tempo de todas as threads.
+    """
+    def __init__(self, job_id, video, elapsed=0.0):
+        # 'elapsed': segundos já gastos no job antes desta medição (ex.: no worker)
+        self.job_id = job_id
+        self.video = video
+        self.started_at = time.time() - elapsed
+        self.stages = {}
+        self.frames = 0
+        self.peak_rss = _current_rss()
+        self._lock = threading.Lock()
+        self._start = time.perf_counter() - elapsed
+        # SamplingProfiler do job, quando ligado (ver job_thread)
+        self.profiler = None
+        self._stop_sampler = threading.Event()
+        self._sampler = threading.Thread(target=self._sample_rss, daemon=True, name=f"rss-{job_id[:8]}")
+        self._sampler.start()
+
+    def _sample_rss(self):
+        while not self._stop_sampler.wait(RSS_SAMPLE_INTERVAL):
+            self.peak_rss = max(self.peak_rss, _current_rss())
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def add_frames(self, count):
+        with self._lock:
+            self.frames += count
+
+    def stop(self):
+        """Encerra a medição (sem gravar nada) e retorna a duração total em segundos."""
+        self._stop_sampler.set()
+        self.peak_rss = max(self.peak_rss, _current_rss())
+        return time.perf_counter() - self._start
+
+    def finish(self, status):
+        """Encerra a medição e grava a linha do job na tabela job_metrics."""
+        total = self.stop()
+        tagging_time = sum(self.stages.get(name, 0.0) for name in ("image_load", "preprocessing", "inference", "thresholding"))
+        row = {
+            "job_id": self.job_id, "video": self.video, "status": status, "started_at": self.started_at,
+            "total_seconds": round(total, 4), "frames": self.frames,
+            "frames_per_second": round(self.frames / total, 3) if total > 0 else None,
+            "peak_rss_bytes": self.peak_rss,
+            "stages_json": json.dumps({name: round(seconds, 4) for name, seconds in self.stages.items()}),
+        }
+        conn = sqlite3.connect(DB_FILE)
+        try:
+            conn.execute(f"INSERT OR REPLACE INTO job_metrics ({', '.join(row)}) VALUES ({', '.join('?' for _ in row)})",
+                         list(row.values()))
+            conn.commit()
+        finally:
+            conn.close()
+        print(f"Job {self.job_id}: {total:.1f}s, {self.frames} frames, tagging {tagging_time:.1f}s (soma das threads), "
+              f"pico de RSS {self.peak_rss / 2**20:.0f} MiB")
+        return row
+
+def stage(metrics, name):
+    """Mede a etapa se houver um JobMetrics (as funções do pipeline também rodam sem ele)."""
+    return metrics.stage(name) if metrics is not None else nullcontext()
+
+def job_thread(metrics, func):
+    """'func' marcada como trabalho do job para o profiler, se houver um ligado no JobMetrics."""
+    profiler = metrics.profiler if metrics is not None else None
+    return profiler.track(func) if profiler is not None else func
+
+def get_job_metrics(job_id):
+    conn = sqlite3.connect(DB_FILE)
+    conn.row_factory = sqlite3.Row
+    try:
+        row = conn.execute("SELECT * FROM job_metrics WHERE job_id = ?", (job_id,)).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        return None
+    result = dict(row)
+    result["stages"] = json.loads(result.pop("stages_json") or "{}")
+    return result
+
+# ==============================================================================
+# SEÇÃO 3: EXPOSIÇÃO NO FORMATO DO PROMETHEUS
+# ==============================================================================
+
+DURATION_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600)
+STAGE_BUCKETS = (0.1, 0.5, 1, 5, 15, 30, 60, 120, 300, 600, 1800)
+FPS_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+def _histogram(lines, name, help_text, samples, buckets, labels=""):
+    """Acrescenta um histograma (buckets cumulativos, _sum e _count) à exposição."""
+    if not any(line.startswith(f"# TYPE {name} ") for line in lines):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+    separator = "," if labels else ""
+    for bound in buckets:
+        count = sum(1 for value in samples if value <= bound)
+        lines.append(f'{name}_bucket{{{labels}{separator}le="{bound}"}} {count}')
+    lines.append(f'{name}_bucket{{{labels}{separator}le="+Inf"}} {len(samples)}')
+    label_block = f"{{{labels}}}" if labels else ""
+    lines.append(f"{name}_sum{label_block} {sum(samples):.6f}")
+    lines.append(f"{name}_count{label_block} {len(samples)}")
+
+def render_prometheus(live_gauges=None):
+    """
+    Texto no formato de exposição do Prometheus agregando todos os jobs gravados
+    em job_metrics, mais medidas instantâneas do processo ('live_gauges').
+    """
+    conn = sqlite3.connect(DB_FILE)
+    try:
+        rows = conn.execute("SELECT status, total_seconds, frames_per_second, peak_rss_bytes, stages_json FROM job_metrics").fetchall()
+    finally:
+        conn.close()
+
+    lines = ["# HELP scene_jobs_total Jobs de processamento concluídos, por status",
+             "# TYPE scene_jobs_total counter"]
+    for status, count in sorted(Counter(row[0] for row in rows).items()):
+        lines.append(f'scene_jobs_total{{status="{status}"}} {count}')
+
+    completed = [row for row in rows if row[0] == "completed"]
+    _histogram(lines, "scene_job_duration_seconds", "Duração total dos jobs concluídos",
+               [row[1] for row in completed], DURATION_BUCKETS)
+    _histogram(lines, "scene_job_frames_per_second", "Frames analisados por segundo nos jobs concluídos",
+               [row[2] for row in completed if row[2] is not None], FPS_BUCKETS)
+
+    per_stage = {name: [] for name in PIPELINE_STAGES}
+    for row in completed:
+        for name, seconds in json.loads(row[4] or "{}").items():
+            per_stage.setdefault(name, []).append(seconds)
+    for name, samples in per_stage.items():
+        _histogram(lines, "scene_job_stage_seconds", "Tempo por etapa do pipeline (soma das threads nas etapas paralelas)",
+                   samples, STAGE_BUCKETS, labels=f'stage="{name}"')
+
+    lines.append("# HELP scene_job_peak_rss_bytes Maior pico de RSS registrado em um job")
+    lines.append("# TYPE scene_job_peak_rss_bytes gauge")
+    lines.append(f"scene_job_peak_rss_bytes {max((row[3] or 0 for row in rows), default=0)}")
+
+    for name, (help_text, values) in (live_gauges or {}).items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        for labels, value in values.items():
+            lines.append(f"{name}{{{labels}}} {value}" if labels else f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+# ==============================================================================
+# SEÇÃO 4: PROFILER POR AMOSTRAGEM
+# ==============================================================================
+
+class SamplingProfiler:
+    """
+    Amostra periodicamente as pilhas das threads do job (sys._current_frames) e
+    conta as pilhas no formato "collapsed" (uma linha 'f1;f2;f3 N' por pilha),
+    aceito pelo flamegraph.pl e pelo speedscope. Custo baixo o bastante para um
+    job isolado, mas só é ligado quando pedido.
+    Só entram as threads enquanto executam uma função marcada com track() (as
+    do pool do asyncio.to_thread são compartilhadas com outros jobs); o event
+    loop, que atende o servidor inteiro, fica de fora.
+    """
+    def __init__(self, interval=PROFILER_INTERVAL):
+        self.interval = interval
+        self.samples = Counter()
+        self._job_threads = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="sampling-profiler")
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def track(self, func):
+        """Envolve 'func' para que a thread que a executa seja amostrada durante a chamada."""
+        def tracked(*args, **kwargs):
+            thread_id = threading.get_ident()
+            with self._lock:
+                self._job_threads.add(thread_id)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._job_threads.discard(thread_id)
+        return tracked
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                job_threads = set(self._job_threads)
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id not in job_threads:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{Path(code.co_filename).name}:{code.co_name}")
+                    frame = frame.f_back
+                self.samples[";".join(reversed(stack))] += 1
+
+    def stop_and_dump(self, job_id):
+        """Para a amostragem e grava profiles/{job_id}.collapsed; retorna o caminho."""
+        self._stop.set()
+        self._thread.join()
+        os.makedirs(PROFILES_DIR, exist_ok=True)
+        path = PROFILES_DIR / f"{job_id}.collapsed"
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+def profile_path(job_id):
+    path = PROFILES_DIR / f"{Path(job_id).name}.collapsed"
+    return path if path.exists() else None
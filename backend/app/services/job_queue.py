@@ -0,0 +1,169 @@
+"""
+Fila de jobs de processamento para workers remotos (app/worker.py).
+
+Com PROCESSING_MODE=workers o /process só enfileira o job na tabela
+processing_jobs. Cada worker pega um job por vez com um lease de
+WORKER_LEASE_SECONDS, renovado pelos heartbeats. Se o worker sumir, o lease
+expira e o job volta a ser entregue (até MAX_JOB_ATTEMPTS tentativas).
+"""
+import os
+import json
+import time
+import uuid
+import sqlite3
+
+from .database_service import DB_FILE
+
+# ==============================================================================
+# SEÇÃO 1: CONFIGURAÇÕES
+# ==============================================================================
+# 'local': o próprio servidor processa (padrão); 'workers': jobs vão para a fila
+PROCESSING_MODE = os.environ.get("PROCESSING_MODE", "local")
+WORKER_LEASE_SECONDS = float(os.environ.get("WORKER_LEASE_SECONDS", 60))
+MAX_JOB_ATTEMPTS = int(os.environ.get("MAX_JOB_ATTEMPTS", 3))
+# Maior resultado (.npz de tags por frame) aceito de um worker; horas de vídeo a 1 FPS ocupam poucos MB
+MAX_RESULT_BYTES = int(os.environ.get("MAX_RESULT_BYTES", 256 * 1024 ** 2))
+
+class LeaseLostError(Exception):
+    """O job não está mais com este worker (lease expirado e entregue a outro, ou job encerrado)."""
+
+def _connect():
+    # isolation_level=None: as transações são abertas explicitamente com BEGIN IMMEDIATE
+    conn = sqlite3.connect(DB_FILE, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+# ==============================================================================
+# SEÇÃO 2: JOBS
+# ==============================================================================
+
+def enqueue_job(job_id, video_path, folder, filename, params):
+    now = time.time()
+    conn = _connect()
+    try:
+        conn.execute("""INSERT INTO processing_jobs (job_id, video_path, folder, filename, params_json, status, created_at, updated_at)
+                        VALUES (?, ?, ?, ?, ?, 'queued', ?, ?)""",
+                     (job_id, video_path, folder, filename, json.dumps(params), now, now))
+    finally:
+        conn.close()
+
+def _job_dict(row):
+    job = dict(row)
+    job["params"] = json.loads(job.pop("params_json"))
+    return job
+
+def lease_next_job(worker_id):
+    """
+    Entrega ao worker o job mais antigo na fila (ou com lease expirado).
+    Retorna (job ou None, ids dos jobs que esgotaram as tentativas nesta chamada).
+    """
+    now = time.time()
+    exhausted = []
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("UPDATE workers SET last_seen = ? WHERE worker_id = ?", (now, worker_id))
+        while True:
+            row = conn.execute("""SELECT * FROM processing_jobs
+                                  WHERE status = 'queued' OR (status = 'leased' AND lease_expires_at < ?)
+                                  ORDER BY created_at LIMIT 1""", (now,)).fetchone()
+            if row is None or row["attempts"] < MAX_JOB_ATTEMPTS:
+                break
+            conn.execute("UPDATE processing_jobs SET status = 'error', error = ?, worker_id = NULL, updated_at = ? WHERE job_id = ?",
+                         (f"Lease expirado em {row['attempts']} tentativas", now, row["job_id"]))
+            exhausted.append(row["job_id"])
+        if row is not None:
+            conn.execute("""UPDATE processing_jobs SET status = 'leased', worker_id = ?, lease_expires_at = ?,
+                            attempts = attempts + 1, updated_at = ? WHERE job_id = ?""",
+                         (worker_id, now + WORKER_LEASE_SECONDS, now, row["job_id"]))
+            row = conn.execute("SELECT * FROM processing_jobs WHERE job_id = ?", (row["job_id"],)).fetchone()
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    return (_job_dict(row) if row is not None else None), exhausted
+
+def renew_lease(job_id, worker_id, seconds=WORKER_LEASE_SECONDS):
+    """Estende o lease do job; LeaseLostError se ele não pertence mais ao worker."""
+    now = time.time()
+    conn = _connect()
+    try:
+        cursor = conn.execute("""UPDATE processing_jobs SET lease_expires_at = ?, updated_at = ?
+                                 WHERE job_id = ? AND worker_id = ? AND status = 'leased'""",
+                              (now + seconds, now, job_id, worker_id))
+        conn.execute("UPDATE workers SET last_seen = ? WHERE worker_id = ?", (now, worker_id))
+        if cursor.rowcount == 0:
+            raise LeaseLostError(job_id)
+        row = conn.execute("SELECT * FROM processing_jobs WHERE job_id = ?", (job_id,)).fetchone()
+    finally:
+        conn.close()
+    return _job_dict(row)
+
+def finish_job(job_id, worker_id, error=None, retry=False):
+    """
+    Encerra o job do worker: concluído (error=None), de volta à fila (retry=True,
+    se ainda houver tentativas) ou com erro. Retorna o novo status.
+    """
+    now = time.time()
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute("SELECT attempts FROM processing_jobs WHERE job_id = ? AND worker_id = ? AND status = 'leased'",
+                           (job_id, worker_id)).fetchone()
+        if row is None:
+            conn.execute("ROLLBACK")
+            raise LeaseLostError(job_id)
+        if error is None:
+            status = "completed"
+        elif retry and row["attempts"] < MAX_JOB_ATTEMPTS:
+            status = "queued"
+        else:
+            status = "error"
+        conn.execute("""UPDATE processing_jobs SET status = ?, error = ?, worker_id = NULL, lease_expires_at = NULL,
+                        updated_at = ? WHERE job_id = ?""", (status, error, now, job_id))
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+    return status
+
+# ==============================================================================
+# SEÇÃO 3: WORKERS
+# ==============================================================================
+
+def register_worker(name, host=None, info=None):
+    worker_id = uuid.uuid4().hex
+    now = time.time()
+    conn = _connect()
+    try:
+        conn.execute("INSERT INTO workers (worker_id, name, host, info_json, registered_at, last_seen) VALUES (?, ?, ?, ?, ?, ?)",
+                     (worker_id, name, host, json.dumps(info or {}), now, now))
+    finally:
+        conn.close()
+    return worker_id
+
+def get_worker(worker_id):
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT * FROM workers WHERE worker_id = ?", (worker_id,)).fetchone()
+    finally:
+        conn.close()
+    return dict(row) if row is not None else None
+
+def queue_status(recent_workers_seconds=3600):
+    """Jobs por status, jobs em andamento e workers vistos recentemente."""
+    now = time.time()
+    conn = _connect()
+    try:
+        counts = dict(conn.execute("SELECT status, COUNT(*) FROM processing_jobs GROUP BY status").fetchall())
+        leased = [{"job_id": row["job_id"], "video": f"{row['folder']}/{row['filename']}", "worker_id": row["worker_id"],
+                   "attempts": row["attempts"], "lease_seconds_left": round(row["lease_expires_at"] - now, 1)}
+                  for row in conn.execute("SELECT * FROM processing_jobs WHERE status = 'leased' ORDER BY created_at")]
+        workers = [{"worker_id": row["worker_id"], "name": row["name"], "host": row["host"],
+                    "seconds_since_seen": round(now - row["last_seen"], 1), "info": json.loads(row["info_json"] or "{}")}
+                   for row in conn.execute("SELECT * FROM workers WHERE last_seen > ? ORDER BY name", (now - recent_workers_seconds,))]
+    finally:
+        conn.close()
+    return {"mode": PROCESSING_MODE, "lease_seconds": WORKER_LEASE_SECONDS, "jobs": counts,
+            "leased": leased, "workers": workers}
@@ -0,0 +1,121 @@
+import os
+import json
+import asyncio
+import bisect
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from .media_tools import run_tool
+
+# ==============================================================================
+# SEÇÃO 1: CONFIGURAÇÕES
+# ==============================================================================
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+KEYFRAME_CACHE_PATH = BASE_DIR / "videos" / ".keyframes"
+# Quantos índices manter em memória (cada um tem alguns KB por hora de vídeo)
+MEMORY_CACHE_SIZE = 64
+
+_memory_cache: "OrderedDict[str, KeyframeIndex]" = OrderedDict()
+_cache_lock = threading.Lock()
+# Índices sendo montados agora, por chave: pedidos simultâneos do mesmo vídeo esperam o mesmo ffprobe
+_in_flight: dict[str, asyncio.Future] = {}
+
+# ==============================================================================
+# SEÇÃO 2: ÍNDICE DE KEYFRAMES
+# ==============================================================================
+
+class KeyframeIndex:
+    """
+    Lista ordenada dos keyframes de vídeo de um arquivo, com o timestamp (s)
+    e a posição em bytes de cada um dentro do container.
+    """
+    def __init__(self, times, positions, file_size):
+        self.times = times
+        self.positions = positions
+        self.file_size = file_size
+
+    def keyframes_between(self, start_time, end_time):
+        """Timestamps dos keyframes no intervalo [start_time, end_time]."""
+        lo = bisect.bisect_left(self.times, start_time)
+        hi = bisect.bisect_right(self.times, end_time)
+        return self.times[lo:hi]
+
+    def byte_offset_at(self, time):
+        """Posição do último keyframe em ou antes de 'time' (início do arquivo se não houver)."""
+        i = bisect.bisect_right(self.times, time) - 1
+        return self.positions[i] if i >= 0 else 0
+
+    def byte_offset_after(self, time):
+        """Posição do primeiro keyframe depois de 'time' (fim do arquivo se não houver)."""
+        i = bisect.bisect_right(self.times, time)
+        return self.positions[i] if i < len(self.positions) else self.file_size
+
+    def byte_range_for(self, start_time, end_time):
+        """Intervalo de bytes [início, fim) que cobre a cena alinhado a keyframes."""
+        return self.byte_offset_at(start_time), self.byte_offset_after(end_time)
+
+async def _probe_keyframes(video_path):
+    result = await run_tool('ffprobe', ['-v', 'error', '-select_streams', 'v:0',
+                                        '-show_entries', 'packet=pts_time,pos,flags', '-of', 'csv=p=0', video_path])
+    keyframes = []
+    for line in result.stdout.splitlines():
+        parts = line.strip().split(',')
+        if len(parts) < 3 or 'K' not in parts[2] or 'N/A' in parts[:2] or '' in parts[:2]:
+            continue
+        keyframes.append((float(parts[0]), int(parts[1])))
+    keyframes.sort()
+    return [t for t, _ in keyframes], [p for _, p in keyframes]
+
+def _cache_key(video_path, stat):
+    raw = f"{Path(video_path).resolve()}|{stat.st_size}|{stat.st_mtime_ns}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+async def _load_keyframe_index(video_path, stat, key):
+    """Lê o índice do cache em disco ou, na falta dele, roda o ffprobe e grava o cache."""
+    cache_file = KEYFRAME_CACHE_PATH / f"{key}.json"
+    index = None
+    if cache_file.exists():
+        try:
+            with open(cache_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            index = KeyframeIndex(data['times'], data['positions'], stat.st_size)
+        except (OSError, ValueError, KeyError):
+            index = None
+
+    if index is None:
+        times, positions = await _probe_keyframes(video_path)
+        index = KeyframeIndex(times, positions, stat.st_size)
+        os.makedirs(KEYFRAME_CACHE_PATH, exist_ok=True)
+        with open(cache_file, 'w', encoding='utf-8') as f:
+            json.dump({"times": times, "positions": positions}, f)
+
+    with _cache_lock:
+        _memory_cache[key] = index
+        _memory_cache.move_to_end(key)
+        while len(_memory_cache) > MEMORY_CACHE_SIZE:
+            _memory_cache.popitem(last=False)
+    return index
+
+async def get_keyframe_index(video_path) -> KeyframeIndex:
+    """
+    Retorna o índice de keyframes do vídeo, consultando primeiro o cache em memória,
+    depois o cache em disco e só então o ffprobe. A chave inclui tamanho e mtime,
+    então um arquivo substituído gera um novo índice. Pedidos simultâneos do mesmo
+    vídeo compartilham a mesma leitura em vez de disparar dois ffprobe.
+    """
+    stat = os.stat(video_path)
+    key = _cache_key(video_path, stat)
+
+    with _cache_lock:
+        if key in _memory_cache:
+            _memory_cache.move_to_end(key)
+            return _memory_cache[key]
+
+    future = _in_flight.get(key)
+    if future is None:
+        future = asyncio.ensure_future(_load_keyframe_index(video_path, stat, key))
+        _in_flight[key] = future
+        future.add_done_callback(lambda _: _in_flight.pop(key, None))
+    return await asyncio.shield(future)
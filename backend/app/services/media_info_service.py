@@ -0,0 +1,147 @@
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import statistics
+from pathlib import Path
+
+from .database_service import DB_FILE
+from .media_tools import MediaToolError, run_tool
+
+# ==============================================================================
+# SEÇÃO 1: CONFIGURAÇÕES
+# ==============================================================================
+
+# Quantos segundos iniciais do vídeo são lidos para estimar o intervalo entre keyframes
+KEYFRAME_SAMPLE_SECONDS = 60
+
+MEDIA_INFO_FIELDS = ('file_path', 'file_size', 'mtime', 'format_name', 'duration', 'bit_rate',
+                     'video_codec', 'width', 'height', 'fps', 'audio_codec', 'keyframe_interval', 'probed_at')
+
+# ==============================================================================
+# SEÇÃO 2: PROBE COM FFPROBE
+# ==============================================================================
+
+def _media_key(video_path):
+    """Chave do cache: caminho absoluto + tamanho + mtime do arquivo."""
+    path = str(Path(video_path).resolve())
+    stat = os.stat(path)
+    return path, stat.st_size, stat.st_mtime
+
+def _parse_rate(rate):
+    try:
+        num, _, den = str(rate).partition('/')
+        den = float(den) if den else 1.0
+        return round(float(num) / den, 3) if den else None
+    except ValueError:
+        return None
+
+def _to_number(value, cast=float):
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        return None
+
+async def probe_media(video_path):
+    """
+    Lê formato, streams e os pacotes dos primeiros segundos do vídeo em um único
+    processo ffprobe e devolve um dicionário com as colunas da tabela media_info.
+    """
+    result = await run_tool('ffprobe', [
+        '-v', 'error', '-read_intervals', f'%+{KEYFRAME_SAMPLE_SECONDS}',
+        '-show_entries', 'format=format_name,duration,bit_rate'
+                         ':stream=index,codec_type,codec_name,width,height,avg_frame_rate'
+                         ':packet=stream_index,pts_time,flags',
+        '-of', 'json', video_path])
+    data = json.loads(result.stdout or '{}')
+    fmt = data.get('format', {})
+    streams = data.get('streams', [])
+    video = next((st for st in streams if st.get('codec_type') == 'video'), {})
+    audio = next((st for st in streams if st.get('codec_type') == 'audio'), {})
+
+    keyframe_times = [float(pkt['pts_time']) for pkt in data.get('packets', [])
+                      if pkt.get('stream_index') == video.get('index') and 'K' in pkt.get('flags', '')
+                      and pkt.get('pts_time') not in (None, 'N/A')]
+    keyframe_times.sort()
+    gaps = [b - a for a, b in zip(keyframe_times, keyframe_times[1:]) if b > a]
+
+    return {
+        'format_name': fmt.get('format_name'),
+        'duration': _to_number(fmt.get('duration')),
+        'bit_rate': _to_number(fmt.get('bit_rate'), int),
+        'video_codec': video.get('codec_name'),
+        'width': video.get('width'),
+        'height': video.get('height'),
+        'fps': _parse_rate(video.get('avg_frame_rate')),
+        'audio_codec': audio.get('codec_name'),
+        'keyframe_interval': round(statistics.median(gaps), 3) if gaps else None,
+    }
+
+# ==============================================================================
+# SEÇÃO 3: CACHE NA TABELA media_info
+# ==============================================================================
+
+def _load_cached(conn, keys):
+    """Retorna {file_path: linha} apenas para as entradas cujo tamanho e mtime ainda batem."""
+    conn.row_factory = sqlite3.Row
+    cached = {}
+    paths = [key[0] for key in keys]
+    for i in range(0, len(paths), 500):
+        chunk = paths[i:i + 500]
+        placeholders = ', '.join('?' for _ in chunk)
+        for row in conn.execute(f"SELECT * FROM media_info WHERE file_path IN ({placeholders})", chunk):
+            cached[row['file_path']] = dict(row)
+    return {path: row for path, row in cached.items()
+            if (path, row['file_size'], row['mtime']) in keys}
+
+async def get_media_info_batch(video_paths):
+    """
+    Retorna a media_info de vários vídeos, rodando o ffprobe só para os arquivos
+    novos ou modificados (em paralelo, limitado pelo media_tools) e gravando
+    todos os resultados no DB em uma única transação.
+    O resultado é indexado pelo caminho informado pelo chamador.
+    """
+    keys_by_input = {}
+    for video_path in video_paths:
+        try:
+            keys_by_input[video_path] = _media_key(video_path)
+        except OSError:
+            continue
+    keys = set(keys_by_input.values())
+
+    conn = sqlite3.connect(DB_FILE)
+    try:
+        cached = _load_cached(conn, keys)
+        missing = [key for key in keys if key[0] not in cached]
+
+        async def probe_one(key):
+            try:
+                return key, await probe_media(key[0])
+            except (MediaToolError, ValueError) as e:
+                print(f"Aviso: ffprobe falhou para '{key[0]}': {e}")
+                return key, None
+
+        probed = await asyncio.gather(*(probe_one(key) for key in missing))
+        now = time.time()
+        new_rows = []
+        for (path, size, mtime), info in probed:
+            if info is None:
+                continue
+            row = {'file_path': path, 'file_size': size, 'mtime': mtime, **info, 'probed_at': now}
+            cached[path] = row
+            new_rows.append(tuple(row[field] for field in MEDIA_INFO_FIELDS))
+
+        if new_rows:
+            placeholders = ', '.join('?' for _ in MEDIA_INFO_FIELDS)
+            conn.executemany(f"INSERT OR REPLACE INTO media_info ({', '.join(MEDIA_INFO_FIELDS)}) VALUES ({placeholders})", new_rows)
+            conn.commit()
+    finally:
+        conn.close()
+
+    return {video_path: cached[key[0]] for video_path, key in keys_by_input.items() if key[0] in cached}
+
+async def get_media_info(video_path):
+    """media_info de um único vídeo (None se o arquivo não existir ou o ffprobe falhar)."""
+    results = await get_media_info_batch([video_path])
+    return results.get(video_path)
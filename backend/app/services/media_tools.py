@@ -0,0 +1,132 @@
+import os
+import asyncio
+import subprocess
+import weakref
+from dataclasses import dataclass
+
+# ==============================================================================
+# SEÇÃO 1: CONFIGURAÇÕES
+# ==============================================================================
+
+# Limite de processos simultâneos por ferramenta, válido para o servidor inteiro.
+# O ffmpeg é pesado (decodifica/encoda vídeo), o ffprobe só lê cabeçalhos.
+TOOL_CONCURRENCY = {
+    "ffmpeg": int(os.environ.get("MAX_FFMPEG_PROCS", max(1, (os.cpu_count() or 2) // 2))),
+    "ffprobe": int(os.environ.get("MAX_FFPROBE_PROCS", 8)),
+}
+# Timeout padrão (segundos) quando o chamador não informa um; None = sem limite
+DEFAULT_TIMEOUTS = {
+    "ffmpeg": None,
+    "ffprobe": 120,
+}
+# Quantos caracteres finais do stderr entram na mensagem de erro
+STDERR_TAIL = 2000
+
+# Um conjunto de semáforos por event loop (scripts podem criar vários loops)
+_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict]" = weakref.WeakKeyDictionary()
+_running = {tool: 0 for tool in TOOL_CONCURRENCY}
+
+@dataclass
+class ToolResult:
+    returncode: int
+    stdout: str
+    stderr: str
+
+class MediaToolError(Exception):
+    """O processo terminou com código de saída diferente de zero."""
+    def __init__(self, tool, returncode, stderr):
+        self.tool = tool
+        self.returncode = returncode
+        self.stderr = stderr
+        super().__init__(f"{tool} falhou (código {returncode}). stderr: {stderr[-STDERR_TAIL:]}")
+
+class MediaToolTimeout(MediaToolError):
+    """O processo excedeu o timeout e foi encerrado."""
+    def __init__(self, tool, timeout):
+        self.tool = tool
+        self.returncode = None
+        self.stderr = ""
+        self.timeout = timeout
+        Exception.__init__(self, f"{tool} excedeu o timeout de {timeout}s e foi encerrado.")
+
+# ==============================================================================
+# SEÇÃO 2: EXECUÇÃO
+# ==============================================================================
+
+def _get_semaphore(tool):
+    loop = asyncio.get_running_loop()
+    per_loop = _semaphores.setdefault(loop, {})
+    if tool not in per_loop:
+        per_loop[tool] = asyncio.Semaphore(TOOL_CONCURRENCY.get(tool, 4))
+    return per_loop[tool]
+
+def _decode(data):
+    return data.decode('utf-8', errors='replace') if data else ""
+
+async def _run_with_asyncio(command, timeout):
+    process = await asyncio.create_subprocess_exec(
+        *command, stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+    except (asyncio.TimeoutError, asyncio.CancelledError):
+        # Garante que o filho não sobreviva ao cancelamento/timeout
+        if process.returncode is None:
+            process.kill()
+        await asyncio.shield(process.wait())
+        raise
+    return process.returncode, stdout, stderr
+
+async def _run_with_thread(command, timeout):
+    """
+    Alternativa para event loops sem suporte a subprocessos
+    (ex.: SelectorEventLoop do uvicorn --reload no Windows).
+    """
+    process = subprocess.Popen(command, stdin=subprocess.DEVNULL,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        stdout, stderr = await asyncio.to_thread(process.communicate, None, timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.communicate()
+        raise asyncio.TimeoutError()
+    except asyncio.CancelledError:
+        process.kill()
+        raise
+    return process.returncode, stdout, stderr
+
+async def run_tool(tool: str, args, timeout=None, check: bool = True) -> ToolResult:
+    """
+    Executa 'tool' (ffmpeg, ffprobe...) com os argumentos dados sem bloquear o event loop.
+    - respeita o limite de processos simultâneos da ferramenta;
+    - encerra o processo filho em caso de timeout ou cancelamento da task;
+    - captura stdout/stderr e, com check=True, levanta MediaToolError se o código de saída != 0.
+    """
+    command = [tool, *[str(arg) for arg in args]]
+    if timeout is None:
+        timeout = DEFAULT_TIMEOUTS.get(tool)
+
+    async with _get_semaphore(tool):
+        _running[tool] = _running.get(tool, 0) + 1
+        try:
+            try:
+                returncode, stdout, stderr = await _run_with_asyncio(command, timeout)
+            except NotImplementedError:
+                returncode, stdout, stderr = await _run_with_thread(command, timeout)
+        except asyncio.TimeoutError:
+            raise MediaToolTimeout(tool, timeout)
+        finally:
+            _running[tool] -= 1
+
+    result = ToolResult(returncode, _decode(stdout), _decode(stderr))
+    if check and result.returncode != 0:
+        raise MediaToolError(tool, result.returncode, result.stderr)
+    return result
+
+def run_tool_sync(tool: str, args, timeout=None, check: bool = True) -> ToolResult:
+    """Versão síncrona de run_tool para scripts de linha de comando (fora do servidor)."""
+    return asyncio.run(run_tool(tool, args, timeout=timeout, check=check))
+
+def get_running_counts():
+    """Quantos processos de cada ferramenta estão rodando agora."""
+    return dict(_running)
@@ -0,0 +1,276 @@
+"""
+Variantes do modelo de tagging (float32 original, float16 e INT8 dinâmico) e
+a avaliação delas contra o float32.
+
+Uso (a partir da pasta 'backend'):
+    python -m app.services.model_variants fetch
+    python -m app.services.model_variants convert --variant int8
+    python -m app.services.model_variants convert --variant fp16 --repo SmilingWolf/wd-vit-tagger-v3
+    python -m app.services.model_variants evaluate --variant int8 --video videos/Pasta/video.mp4 --fps 0.5
+    python -m app.services.model_variants evaluate --variant fp16 --frames pasta_com_imagens
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+from pathlib import Path
+
+# ==============================================================================
+# SEÇÃO 1: CONFIGURAÇÕES
+# ==============================================================================
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+# Pasta local com os modelos (model.onnx, selected_tags.csv e variantes) de cada repositório.
+# É consultada antes do Hugging Face, então um servidor sem rede funciona com ela preenchida.
+MODEL_CACHE_DIR = Path(os.environ.get("MODEL_CACHE_DIR", BASE_DIR / "models"))
+# Com MODEL_OFFLINE=1 (ou HF_HUB_OFFLINE=1) nada é baixado: só a pasta local e o cache do Hugging Face
+MODEL_OFFLINE = os.environ.get("MODEL_OFFLINE", os.environ.get("HF_HUB_OFFLINE", "0")) == "1"
+# Tabela de tags versionada na raiz do projeto, usada se a do repositório não estiver disponível
+FALLBACK_LABELS_PATH = BASE_DIR.parent / "selected_tags.csv"
+
+# Repositórios da mesma família (mesmo selected_tags.csv e mesmo formato de entrada/saída)
+MODEL_FAMILY = (
+    "SmilingWolf/wd-swinv2-tagger-v3",
+    "SmilingWolf/wd-vit-tagger-v3",
+    "SmilingWolf/wd-convnext-tagger-v3",
+    "SmilingWolf/wd-vit-large-tagger-v3",
+    "SmilingWolf/wd-eva02-large-tagger-v3",
+)
+MODEL_VARIANTS = ("fp32", "fp16", "int8")
+
+def model_dir(model_repo):
+    return MODEL_CACHE_DIR / model_repo.replace('/', '__')
+
+def variant_path(model_repo, variant):
+    """Onde o modelo (ou a variante convertida) de um repositório fica salvo localmente."""
+    if variant == "fp32":
+        return model_dir(model_repo) / "model.onnx"
+    return model_dir(model_repo) / f"model.{variant}.onnx"
+
+def fetch_model_file(model_repo, filename):
+    """
+    Caminho de um arquivo do repositório: pasta local, depois o cache do Hugging Face
+    sem rede e, por último (fora do modo offline), o download.
+    """
+    local_path = model_dir(model_repo) / filename
+    if local_path.exists():
+        return str(local_path)
+    try:
+        import huggingface_hub
+    except ImportError:
+        raise FileNotFoundError(f"'{filename}' de {model_repo} não está em {local_path} e o huggingface_hub não está instalado.")
+    try:
+        return huggingface_hub.hf_hub_download(model_repo, filename, local_files_only=True)
+    except Exception:
+        if MODEL_OFFLINE:
+            raise FileNotFoundError(f"'{filename}' de {model_repo} não está em {local_path} nem no cache do Hugging Face (modo offline).")
+    return huggingface_hub.hf_hub_download(model_repo, filename)
+
+def resolve_labels_path(model_repo):
+    """selected_tags.csv do repositório ou, se não for possível obtê-lo, o da raiz do projeto."""
+    try:
+        return fetch_model_file(model_repo, "selected_tags.csv")
+    except Exception as e:
+        if FALLBACK_LABELS_PATH.exists():
+            print(f"Aviso: usando {FALLBACK_LABELS_PATH} como tabela de tags ({e})")
+            return str(FALLBACK_LABELS_PATH)
+        raise
+
+def resolve_model_path(model_repo, variant="fp32"):
+    """
+    Caminho do .onnx a carregar. O float32 vem da pasta local ou do Hugging Face;
+    as demais variantes precisam ter sido geradas antes com o comando 'convert'.
+    """
+    if variant not in MODEL_VARIANTS:
+        raise ValueError(f"Variante desconhecida: {variant}")
+    if variant == "fp32":
+        return fetch_model_file(model_repo, "model.onnx")
+    path = variant_path(model_repo, variant)
+    if not path.exists():
+        raise FileNotFoundError(
+            f"Variante '{variant}' de {model_repo} não encontrada em {path}. "
+            f"Gere-a com: python -m app.services.model_variants convert --repo {model_repo} --variant {variant}")
+    return str(path)
+
+# ==============================================================================
+# SEÇÃO 2: PREPARAÇÃO OFFLINE (DOWNLOAD E CONVERSÃO)
+# ==============================================================================
+
+def fetch_to_local(model_repo):
+    """Copia model.onnx e selected_tags.csv para a pasta local, para uso sem rede."""
+    os.makedirs(model_dir(model_repo), exist_ok=True)
+    copied = []
+    for filename in ("model.onnx", "selected_tags.csv"):
+        target = model_dir(model_repo) / filename
+        source = fetch_model_file(model_repo, filename)
+        if Path(source) != target:
+            shutil.copy2(source, target)
+        copied.append(str(target))
+    return copied
+
+def convert_variant(model_repo, variant):
+    """Gera a variante a partir do modelo float32 e retorna o caminho do arquivo criado."""
+    if variant == "fp32":
+        return resolve_model_path(model_repo, "fp32")
+
+    source_path = resolve_model_path(model_repo, "fp32")
+    output_path = variant_path(model_repo, variant)
+    os.makedirs(output_path.parent, exist_ok=True)
+    temp_path = output_path.with_suffix(".tmp.onnx")
+
+    if variant == "int8":
+        # Quantização dinâmica: pesos em INT8, ativações quantizadas em tempo de execução
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(source_path, str(temp_path), weight_type=QuantType.QInt8)
+    elif variant == "fp16":
+        try:
+            import onnx
+            from onnxconverter_common import float16
+        except ImportError:
+            raise RuntimeError("A conversão para float16 requer os pacotes 'onnx' e 'onnxconverter-common'.")
+        model = onnx.load(source_path)
+        # Mantém entrada/saída em float32 para o Predictor não precisar mudar
+        model_fp16 = float16.convert_float_to_float16(model, keep_io_types=True)
+        onnx.save(model_fp16, str(temp_path))
+    else:
+        raise ValueError(f"Variante desconhecida: {variant}")
+
+    os.replace(temp_path, output_path)
+    return str(output_path)
+
+# ==============================================================================
+# SEÇÃO 3: AVALIAÇÃO CONTRA O FLOAT32
+# ==============================================================================
+
+def _jaccard(tags_a, tags_b):
+    set_a, set_b = set(tags_a), set(tags_b)
+    union = set_a | set_b
+    return len(set_a & set_b) / len(union) if union else 1.0
+
+def _boundary_f1(reference, candidate, tolerance):
+    """F1 das trocas de cena do candidato contra as de referência (casamento guloso com tolerância)."""
+    reference, candidate = sorted(reference), sorted(candidate)
+    matched = 0
+    used = set()
+    for boundary in candidate:
+        match = next((i for i, ref in enumerate(reference) if i not in used and abs(ref - boundary) <= tolerance), None)
+        if match is not None:
+            used.add(match)
+            matched += 1
+    precision = matched / len(candidate) if candidate else 1.0
+    recall = matched / len(reference) if reference else 1.0
+    return 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+
+def _tag_frames(predictor, frame_files, batch_size):
+    from PIL import Image
+    from .processing_service import CHARACTER_THRESHOLD, GENERAL_THRESHOLD
+    results = {}
+    start = time.perf_counter()
+    for i in range(0, len(frame_files), batch_size):
+        batch = frame_files[i:i + batch_size]
+        images = [Image.open(path) for path in batch]
+        for path, tags in zip(batch, predictor.predict_batch(images, GENERAL_THRESHOLD, CHARACTER_THRESHOLD)):
+            results[os.path.basename(path)] = tags
+    elapsed = time.perf_counter() - start
+    return results, len(frame_files) / elapsed if elapsed else 0.0
+
+def evaluate_variant(model_repo, variant, frame_files, fps=1.0, similarity_threshold=0.4, batch_size=8,
+                     baseline_repo=None):
+    """
+    Compara uma variante (ou outro repositório da família) com o float32 de referência
+    nos mesmos frames: concordância de tags por frame e das trocas de cena detectadas.
+    """
+    from .processing_service import Predictor, detectar_trocas_de_cena
+
+    baseline_repo = baseline_repo or model_repo
+    baseline = Predictor()
+    baseline.load_model(baseline_repo, "fp32")
+    candidate = Predictor()
+    candidate.load_model(model_repo, variant)
+
+    reference_tags, reference_fps = _tag_frames(baseline, frame_files, batch_size)
+    candidate_tags, candidate_fps = _tag_frames(candidate, frame_files, batch_size)
+
+    jaccards, precisions, recalls = [], [], []
+    for frame, ref in reference_tags.items():
+        cand = candidate_tags.get(frame, {})
+        jaccards.append(_jaccard(ref, cand))
+        if cand:
+            precisions.append(len(set(ref) & set(cand)) / len(cand))
+        if ref:
+            recalls.append(len(set(ref) & set(cand)) / len(ref))
+
+    reference_cuts, _ = detectar_trocas_de_cena(reference_tags, fps, similarity_threshold)
+    candidate_cuts, _ = detectar_trocas_de_cena(candidate_tags, fps, similarity_threshold)
+
+    mean = lambda values: round(sum(values) / len(values), 4) if values else None
+    return {
+        "baseline": f"{baseline_repo}:fp32",
+        "candidate": f"{model_repo}:{variant}",
+        "frames": len(frame_files),
+        "tag_jaccard_mean": mean(jaccards),
+        "tag_precision_mean": mean(precisions),
+        "tag_recall_mean": mean(recalls),
+        "scene_count_baseline": len(reference_cuts),
+        "scene_count_candidate": len(candidate_cuts),
+        "scene_boundary_f1": round(_boundary_f1(reference_cuts[1:], candidate_cuts[1:], 1.0 / fps), 4),
+        "frames_per_second_baseline": round(reference_fps, 2),
+        "frames_per_second_candidate": round(candidate_fps, 2),
+    }
+
+def _collect_frames(args, temp_dir):
+    if args.frames:
+        extensions = ('.png', '.jpg', '.jpeg', '.webp')
+        return sorted(str(Path(args.frames) / f) for f in os.listdir(args.frames) if f.lower().endswith(extensions))
+    from .media_tools import run_tool_sync
+    run_tool_sync('ffmpeg', ['-i', args.video, '-vf', f'fps={args.fps}', '-frames:v', str(args.max_frames),
+                             '-hide_banner', '-loglevel', 'error', os.path.join(temp_dir, 'frame_%06d.png')])
+    return sorted(os.path.join(temp_dir, f) for f in os.listdir(temp_dir))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    fetch = subparsers.add_parser("fetch", help="Baixa o modelo para a pasta local (uso offline)")
+    fetch.add_argument("--repo", default=MODEL_FAMILY[0], choices=MODEL_FAMILY)
+
+    convert = subparsers.add_parser("convert", help="Gera uma variante a partir do float32")
+    convert.add_argument("--repo", default=MODEL_FAMILY[0], choices=MODEL_FAMILY)
+    convert.add_argument("--variant", required=True, choices=MODEL_VARIANTS[1:])
+
+    evaluate = subparsers.add_parser("evaluate", help="Compara uma variante com o float32 em uma amostra local")
+    evaluate.add_argument("--repo", default=MODEL_FAMILY[0], choices=MODEL_FAMILY)
+    evaluate.add_argument("--variant", default="int8", choices=MODEL_VARIANTS)
+    evaluate.add_argument("--baseline-repo", choices=MODEL_FAMILY, help="Referência (padrão: o mesmo repositório)")
+    source = evaluate.add_mutually_exclusive_group(required=True)
+    source.add_argument("--video", help="Vídeo local usado como amostra")
+    source.add_argument("--frames", help="Pasta com imagens já extraídas")
+    evaluate.add_argument("--fps", type=float, default=1.0)
+    evaluate.add_argument("--max-frames", type=int, default=300)
+    evaluate.add_argument("--threshold", type=float, default=0.4)
+    evaluate.add_argument("--batch-size", type=int, default=8)
+
+    args = parser.parse_args()
+    if args.command == "fetch":
+        for path in fetch_to_local(args.repo):
+            print(f"Arquivo local: {path}")
+        return
+    if args.command == "convert":
+        print(f"Variante gerada: {convert_variant(args.repo, args.variant)}")
+        return
+
+    temp_dir = tempfile.mkdtemp(prefix="model_eval_")
+    try:
+        frame_files = _collect_frames(args, temp_dir)
+        if not frame_files:
+            sys.exit("Nenhum frame encontrado na amostra.")
+        report = evaluate_variant(args.repo, args.variant, frame_files, args.fps, args.threshold,
+                                  args.batch_size, args.baseline_repo)
+        for key, value in report.items():
+            print(f"{key:>30}: {value}")
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,27 @@
 import os
-import subprocess
+import csv
 import shutil
-import huggingface_hub
+import tempfile
 import numpy as np
-import onnxruntime as rt
-import pandas as pd
 from PIL import Image
-import json
-import re
-import torch
+import time
+import uuid
 import asyncio
+import threading
+from collections import OrderedDict
 from pathlib import Path
 
 from .database_service import add_video_to_database
+from .fingerprint_service import find_processed_duplicate, get_fingerprint
+# onnxruntime e huggingface_hub só são importados quando o primeiro modelo é carregado
+from .inference_pool import auto_config, available_providers, create_pool
+from .job_metrics import JobMetrics, SamplingProfiler, job_thread, stage
+from .media_info_service import get_media_info
+from .media_tools import MediaToolError, run_tool
+from .model_variants import model_dir, resolve_labels_path, resolve_model_path
+from .scene_checkpoints import CHECKPOINT_SECONDS, checkpoint_signature, delete_checkpoint, load_checkpoint, save_checkpoint
+from .scene_detection import FrameTagMatrix, OnlineSegmenter, aggregate_scene_tags, detect_boundaries
+from .scene_store import scene_file_for, write_scenes
 
 # ==============================================================================
 # SEÇÃO 1: CONSTANTES E CONFIGURAÇÕES DO MODELO
@@ -21,6 +30,14 @@ MODEL_REPO = "SmilingWolf/wd-swinv2-tagger-v3"
 GENERAL_THRESHOLD = 0.35
 CHARACTER_THRESHOLD = 0.85
 BATCH_SIZE = 4 # Tamanho de lote padrão, pode ser sobrescrito
+# Quantos modelos (repositório + variante) ficam carregados ao mesmo tempo
+MAX_LOADED_MODELS = int(os.environ.get("MAX_LOADED_MODELS", 2))
+# Aquecimento do modelo com um lote fictício: 'startup' (ao subir o servidor),
+# 'first_use' (ao carregar no primeiro job) ou 'off'
+MODEL_WARMUP = os.environ.get("MODEL_WARMUP", "first_use")
+WARMUP_BATCH_SIZE = int(os.environ.get("WARMUP_BATCH_SIZE", 1))
+# Versão do formato da tabela de tags compilada (selected_tags.npz)
+LABELS_CACHE_VERSION = 1
 
 # ==============================================================================
 # SEÇÃO 2: CLASSE E FUNÇÕES AUXILIARES DE MACHINE LEARNING
@@ -29,32 +46,115 @@ BATCH_SIZE = 4 # Tamanho de lote padrão, pode ser sobrescrito
 # (Estas são as funções do seu script do Colab, praticamente inalteradas)
 kaomojis = ["0_0", "(o)_(o)", "+_+", "+_-", "._.", "<o>_<o>", "<|>_<|>", "=_=", ">_<", "3_3", "6_9", ">_o", "@_@", "^_^", "o_o", "u_u", "x_x", "|_|", "||_||"]
 
-def load_labels(dataframe):
-    name_series = dataframe["name"].map(lambda x: x.replace("_", " ") if x not in kaomojis else x)
-    return name_series.tolist(), list(np.where(dataframe["category"] == 9)[0]), list(np.where(dataframe["category"] == 0)[0]), list(np.where(dataframe["category"] == 4)[0])
+def load_labels(csv_path):
+    # Lido com o módulo csv: o pandas custava segundos de import só para esta tabela
+    with open(csv_path, 'r', encoding='utf-8', newline='') as f:
+        rows = list(csv.DictReader(f))
+    names = [row["name"].replace("_", " ") if row["name"] not in kaomojis else row["name"] for row in rows]
+    categories = np.array([int(row["category"]) for row in rows])
+    return names, list(np.where(categories == 9)[0]), list(np.where(categories == 0)[0]), list(np.where(categories == 4)[0])
+
+def compile_labels(csv_path, cache_path):
+    """Grava a tabela de tags já processada (nomes + categorias) em um .npz compacto."""
+    names, rating, general, character = load_labels(csv_path)
+    categories = np.full(len(names), -1, dtype=np.int8)
+    categories[rating], categories[general], categories[character] = 9, 0, 4
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    temp_path = f"{cache_path}.tmp.npz"
+    np.savez(temp_path, version=np.int32(LABELS_CACHE_VERSION), names=np.array(names, dtype=np.str_),
+             categories=categories, source=np.array(str(csv_path)))
+    os.replace(temp_path, cache_path)
+    return names, rating, general, character
+
+def load_label_table(model_repo):
+    """
+    Tabela de tags do repositório: lê o selected_tags.npz ao lado do modelo ou,
+    na primeira vez (ou se o formato mudou), compila-o a partir do CSV.
+    Retorna (nomes, índices rating, índices general, índices character, origem).
+    """
+    cache_path = model_dir(model_repo) / "selected_tags.npz"
+    try:
+        with np.load(cache_path) as data:
+            if int(data["version"]) == LABELS_CACHE_VERSION:
+                categories = data["categories"]
+                return (data["names"].tolist(), list(np.where(categories == 9)[0]), list(np.where(categories == 0)[0]),
+                        list(np.where(categories == 4)[0]), "cache")
+    except (OSError, KeyError, ValueError):
+        pass
+    return (*compile_labels(resolve_labels_path(model_repo), cache_path), "csv")
 
 class Predictor:
     def __init__(self):
         self.model = None
+        self.pool = None
+        self.inference_config = None
         self.tag_names = None
         self.rating_indexes = None
         self.general_indexes = None
         self.character_indexes = None
         self.model_target_size = None
         self.last_loaded_repo = None
-
-    def load_model(self, model_repo=MODEL_REPO):
-        if self.last_loaded_repo == model_repo: return
-        
-        csv_path = huggingface_hub.hf_hub_download(model_repo, "selected_tags.csv")
-        model_path = huggingface_hub.hf_hub_download(model_repo, "model.onnx")
-        
-        self.tag_names, self.rating_indexes, self.general_indexes, self.character_indexes = load_labels(pd.read_csv(csv_path))
-        providers = ['CUDAExecutionProvider'] if torch.cuda.is_available() else ['CPUExecutionProvider']
-        self.model = rt.InferenceSession(model_path, providers=providers)
-        _, height, _, _ = self.model.get_inputs()[0].shape
-        self.model_target_size = height
-        self.last_loaded_repo = model_repo
+        self.last_loaded_variant = None
+        self.timings = {}
+        # Jobs usando este predictor agora; um predictor saído do LRU só fecha quando chega a zero
+        self.users = 0
+        self.evicted = False
+        # O carregamento pode vir do aquecimento na inicialização e de um job ao mesmo tempo
+        self._load_lock = threading.Lock()
+
+    def load_model(self, model_repo=MODEL_REPO, variant="fp32", inference_config=None, warmup=None):
+        with self._load_lock:
+            if (self.last_loaded_repo, self.last_loaded_variant) == (model_repo, variant): return
+
+            start = time.perf_counter()
+            self.tag_names, self.rating_indexes, self.general_indexes, self.character_indexes, labels_source = load_label_table(model_repo)
+            labels_seconds = time.perf_counter() - start
+
+            # Pasta local de modelos primeiro, depois o Hugging Face (ver model_variants.py)
+            start = time.perf_counter()
+            model_path = resolve_model_path(model_repo, variant)
+            providers = available_providers()
+            # Pool de K sessões com threads ajustadas ao número de núcleos (ver inference_pool.py)
+            self.inference_config = inference_config or auto_config(providers)
+            if self.pool is not None:
+                self.pool.close()
+            self.pool = create_pool(model_path, self.inference_config)
+            self.model = self.pool
+            _, height, _, _ = self.pool.input_shape
+            self.model_target_size = height
+            self.last_loaded_repo = model_repo
+            self.last_loaded_variant = variant
+            self.timings = {"labels_seconds": round(labels_seconds, 4), "labels_source": labels_source,
+                            "session_seconds": round(time.perf_counter() - start, 4),
+                            "warmup_seconds": None, "loaded_at": time.time()}
+
+            if warmup is None:
+                warmup = MODEL_WARMUP != "off"
+            if warmup:
+                self.warm_up()
+
+    def warm_up(self):
+        """
+        Roda um lote fictício em cada sessão do pool, para que a inicialização do grafo
+        (alocações, escolha de kernels) não caia no meio do primeiro job.
+        """
+        start = time.perf_counter()
+        size = self.model_target_size
+        self.pool.warm_up(np.zeros((WARMUP_BATCH_SIZE, size, size, 3), dtype=np.float32))
+        self.timings["warmup_seconds"] = round(time.perf_counter() - start, 4)
+
+    def status(self):
+        return {"model_repo": self.last_loaded_repo, "variant": self.last_loaded_variant,
+                "loaded": self.model is not None, "input_size": self.model_target_size,
+                "tags": len(self.tag_names) if self.tag_names else 0,
+                "sessions": self.pool.size if self.pool else 0, "timings": self.timings}
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+        self.pool = self.model = None
+        self.last_loaded_repo = self.last_loaded_variant = None
+        self.timings = {}
 
     def prepare_image(self, image):
         image = image.convert("RGB")
@@ -66,38 +166,47 @@ class Predictor:
         image_array = np.asarray(padded_image, dtype=np.float32)[:, :, ::-1]
         return np.expand_dims(image_array, axis=0)
 
-    def predict_batch(self, images, general_thresh, character_thresh):
-        batch_array = np.vstack([self.prepare_image(img) for img in images])
-        input_name = self.model.get_inputs()[0].name
-        label_name = self.model.get_outputs()[0].name
-        preds_batch = self.model.run([label_name], {input_name: batch_array})[0]
+    def predict_batch(self, images, general_thresh, character_thresh, metrics=None):
+        with stage(metrics, "preprocessing"):
+            batch_array = np.vstack([self.prepare_image(img) for img in images])
+        # Seguro para chamar de várias threads: cada lote pega uma sessão livre do pool
+        with stage(metrics, "inference"):
+            preds_batch = self.pool.run(batch_array)
         batch_results = []
-        for preds in preds_batch:
-            labels = list(zip(self.tag_names, preds.astype(float)))
-            general_names = [labels[i] for i in self.general_indexes]
-            character_names = [labels[i] for i in self.character_indexes]
-            general_res = {x[0]: float(x[1]) for x in general_names if x[1] > general_thresh}
-            character_res = {x[0]: float(x[1]) for x in character_names if x[1] > character_thresh}
-            batch_results.append({**general_res, **character_res})
+        with stage(metrics, "thresholding"):
+            for preds in preds_batch:
+                labels = list(zip(self.tag_names, preds.astype(float)))
+                general_names = [labels[i] for i in self.general_indexes]
+                character_names = [labels[i] for i in self.character_indexes]
+                general_res = {x[0]: float(x[1]) for x in general_names if x[1] > general_thresh}
+                character_res = {x[0]: float(x[1]) for x in character_names if x[1] > character_thresh}
+                batch_results.append({**general_res, **character_res})
         return batch_results
 
 # ==============================================================================
 # SEÇÃO 3: FUNÇÕES DO PIPELINE DE PROCESSAMENTO (ADAPTADAS COM CALLBACK)
 # ==============================================================================
 
-# [MODIFICADO] A função extrair_frames agora é síncrona
-def extrair_frames(caminho_video, diretorio_saida, fps):
+# A extração roda pelo media_tools: não bloqueia o event loop e respeita o limite de ffmpeg do servidor.
+# Com inicio/duracao (segundos) extrai só esse trecho; a numeração dos frames recomeça em 1.
+async def extrair_frames(caminho_video, diretorio_saida, fps, inicio=None, duracao=None, max_frames=None):
     os.makedirs(diretorio_saida, exist_ok=True)
     caminho_saida_frames = os.path.join(diretorio_saida, 'frame_%06d.png')
-    comando = ['ffmpeg', '-i', caminho_video, '-vf', f'fps={fps}', '-hide_banner', '-loglevel', 'error', caminho_saida_frames]
-    
-    # Usando o subprocess.run síncrono e confiável
-    result = subprocess.run(comando, capture_output=True, text=True)
+    trecho = []
+    if inicio:
+        trecho += ['-ss', f'{inicio:.3f}']
+    if duracao is not None:
+        trecho += ['-t', f'{duracao:.3f}']
+    limite = ['-frames:v', str(max_frames)] if max_frames is not None else []
+    comando = trecho + ['-i', caminho_video, '-vf', f'fps={fps}', *limite, '-hide_banner', '-loglevel', 'error',
+                        caminho_saida_frames]
 
-    if result.returncode != 0:
+    try:
+        await run_tool('ffmpeg', comando)
+    except MediaToolError as e:
         # Imprime o erro do ffmpeg para ajudar na depuração
-        print("Erro no FFmpeg (extrair_frames):", result.stderr)
-        raise Exception(f"Falha na extração de frames. FFmpeg stderr: {result.stderr}")
+        print("Erro no FFmpeg (extrair_frames):", e.stderr)
+        raise Exception(f"Falha na extração de frames. FFmpeg stderr: {e.stderr}")
     
     return len([f for f in os.listdir(diretorio_saida) if f.endswith('.png')])
 
@@ -121,94 +230,300 @@ async def gerar_tags_para_frames(predictor, pasta_frames, total_frames, batch_si
 
     return results
 
-def detectar_trocas_de_cena(dados_tags, fps, limiar_similaridade):
-    def calcular_similaridade_jaccard(tags1, tags2):
-        set1, set2 = set(tags1.keys()), set(tags2.keys())
-        intersecao = set1.intersection(set2)
-        uniao = set1.union(set2)
-        return len(intersecao) / len(uniao) if uniao else 1.0
-
-    frames_ordenados = sorted(dados_tags.keys(), key=lambda x: int(re.search(r'(\d+)', x).group(1)))
-    trocas_de_cena = [0.0]
-    for i in range(len(frames_ordenados) - 1):
-        similaridade = calcular_similaridade_jaccard(dados_tags[frames_ordenados[i]], dados_tags[frames_ordenados[i+1]])
-        if similaridade < limiar_similaridade:
-            trocas_de_cena.append((i + 1) / fps)
-    return trocas_de_cena, frames_ordenados
-
-def agrupar_cenas_com_tags(trocas_de_cena, frames_ordenados, dados_tags, fps, video_duration):
-    cenas_agrupadas = []
-    trocas_de_cena.append(video_duration)
-    for i in range(len(trocas_de_cena) - 1):
-        start_time, end_time = trocas_de_cena[i], trocas_de_cena[i+1]
-        start_frame_idx = int(start_time * fps)
-        end_frame_idx = int(end_time * fps)
-        frames_da_cena = frames_ordenados[start_frame_idx:end_frame_idx]
-        tags_agregadas = {}
-        for frame_nome in frames_da_cena:
-            for tag, score in dados_tags.get(frame_nome, {}).items():
-                tags_agregadas.setdefault(tag, []).append(score)
-        tags_medias = {tag: np.mean(scores) for tag, scores in tags_agregadas.items()}
-        tags_principais = sorted(tags_medias.items(), key=lambda item: item[1], reverse=True)
-        cenas_agrupadas.append({
-            "cena_n": i + 1, "start_time": round(start_time, 3), "end_time": round(end_time, 3),
-            "duration": round(end_time - start_time, 3),
-            "tags_principais": {tag: round(score, 3) for tag, score in tags_principais}
-        })
-    return cenas_agrupadas
+def detectar_trocas_de_cena(dados_tags, fps, limiar_similaridade, metrica="jaccard", janela_flicker=0,
+                            min_frames_cena=1, matriz=None):
+    # A similaridade entre frames consecutivos é calculada de uma vez sobre a
+    # matriz esparsa frame x tag (ver scene_detection.py)
+    if matriz is None:
+        matriz = FrameTagMatrix.from_tag_dict(dados_tags)
+    inicios = detect_boundaries(matriz, limiar_similaridade, metrica, janela_flicker, min_frames_cena)
+    trocas_de_cena = [int(frame) / fps for frame in inicios] or [0.0]
+    return trocas_de_cena, matriz.frame_names
+
+def agrupar_cenas_com_tags(trocas_de_cena, frames_ordenados, dados_tags, fps, video_duration,
+                           top_k=None, min_suporte=0.0, matriz=None):
+    # Agregação por segmentos sobre a matriz frame x tag (ver scene_detection.py);
+    # top_k e min_suporte limitam as tags guardadas por cena
+    if matriz is None:
+        matriz = FrameTagMatrix.from_tag_dict(dados_tags)
+    inicios = [int(round(t * fps)) for t in trocas_de_cena]
+    tags_por_cena = aggregate_scene_tags(matriz, inicios, top_k, min_suporte)
+    limites = list(trocas_de_cena) + [video_duration]
+    return [_montar_cena(i + 1, limites[i], limites[i+1], tags_principais) for i, tags_principais in enumerate(tags_por_cena)]
+
+def _montar_cena(numero, start_time, end_time, tags_principais):
+    return {
+        "cena_n": numero, "start_time": round(start_time, 3), "end_time": round(end_time, 3),
+        "duration": round(end_time - start_time, 3),
+        "tags_principais": {tag: round(score, 3) for tag, score in tags_principais}
+    }
 
 # ==============================================================================
 # SEÇÃO 4: FUNÇÃO ORQUESTRADORA PRINCIPAL
 # ==============================================================================
 
-# Instância única do predictor para evitar recarregar o modelo
-predictor = Predictor()
+# Um predictor por (repositório, variante), para evitar recarregar o modelo.
+# Os menos usados recentemente são descarregados acima de MAX_LOADED_MODELS.
+# Um predictor ainda em uso por outro job não é fechado na hora: sai do LRU e
+# fecha quando o último job o devolve (release_predictor).
+_predictors: "OrderedDict[tuple, Predictor]" = OrderedDict()
+_predictors_lock = threading.Lock()
+
+def _get_predictor(model_repo, variant):
+    key = (model_repo, variant)
+    if key not in _predictors:
+        _predictors[key] = Predictor()
+    _predictors.move_to_end(key)
+    while len(_predictors) > MAX_LOADED_MODELS:
+        _, evicted = _predictors.popitem(last=False)
+        evicted.evicted = True
+        if evicted.users == 0:
+            evicted.close()
+    return _predictors[key]
+
+def get_predictor(model_repo=MODEL_REPO, variant="fp32"):
+    """Predictor (ainda não necessariamente carregado) para o modelo pedido, sem reservá-lo."""
+    with _predictors_lock:
+        return _get_predictor(model_repo, variant)
+
+def acquire_predictor(model_repo=MODEL_REPO, variant="fp32"):
+    """Predictor reservado para um job: não é fechado pelo LRU até o release_predictor."""
+    with _predictors_lock:
+        predictor = _get_predictor(model_repo, variant)
+        predictor.users += 1
+        return predictor
+
+def release_predictor(predictor):
+    with _predictors_lock:
+        predictor.users -= 1
+        if predictor.users == 0 and predictor.evicted:
+            predictor.close()
+
+def get_models_status():
+    """Modelos em memória com os tempos de carregamento e aquecimento de cada um."""
+    with _predictors_lock:
+        predictors = list(_predictors.values())
+    return {"warmup_mode": MODEL_WARMUP, "max_loaded_models": MAX_LOADED_MODELS,
+            "models": [predictor.status() for predictor in predictors]}
+
+def warm_up_default_model():
+    """Carrega e aquece o modelo padrão (usado na inicialização com MODEL_WARMUP=startup)."""
+    predictor = acquire_predictor(MODEL_REPO, "fp32")
+    try:
+        predictor.load_model(MODEL_REPO, "fp32", warmup=True)
+        print(f"Modelo {MODEL_REPO} carregado e aquecido: {predictor.timings}")
+    except Exception as e:
+        print(f"Aviso: não foi possível pré-carregar o modelo na inicialização: {e}")
+    finally:
+        release_predictor(predictor)
+
+def _load_frame(path):
+    image = Image.open(path)
+    # Decodifica aqui: sem isso o PNG só seria lido no pré-processamento
+    image.load()
+    return image
+
+def tag_frame_batch(predictor, pasta_frames, batch_file_names, metrics=None):
+    """
+    Carrega e classifica um lote de frames (roda em uma thread do pool).
+    Retorna (nomes, tags) ou (nomes, None) se algum frame do lote estiver corrompido.
+    """
+    # Envolve o carregamento de imagens em um try-except para lidar com frames corrompidos
+    try:
+        with stage(metrics, "image_load"):
+            batch_images = [_load_frame(os.path.join(pasta_frames, f)) for f in batch_file_names]
+    except Exception as img_err:
+        print(f"Aviso: Falha ao carregar um frame no lote. Pulando. Erro: {img_err}")
+        return batch_file_names, None
+    return batch_file_names, predictor.predict_batch(batch_images, GENERAL_THRESHOLD, CHARACTER_THRESHOLD, metrics)
+
+async def tag_extracted_frames(predictor, pasta_frames, batch_size, on_progress, metrics=None):
+    """
+    Classifica todos os frames extraídos em 'pasta_frames'. Mantém um lote em
+    andamento por sessão do pool, executados fora do event loop, e aguarda
+    on_progress(frames_concluidos, total) a cada lote concluído.
+    Retorna {nome_do_frame: {tag: score}}; frames de lotes corrompidos ficam de fora.
+    """
+    dados_tags = {}
+    img_files = sorted([f for f in os.listdir(pasta_frames) if f.lower().endswith('.png')])
+    batches = [img_files[i:i + batch_size] for i in range(0, len(img_files), batch_size)]
+    max_in_flight = max(1, predictor.pool.size)
+    pending = set()
+    frames_done = 0
+
+    async def collect(done_tasks):
+        nonlocal frames_done
+        for task in done_tasks:
+            batch_file_names, batch_tags_result = task.result()
+            if batch_tags_result is not None:
+                for file_name, tags in zip(batch_file_names, batch_tags_result):
+                    dados_tags[file_name] = tags
+            frames_done += len(batch_file_names)
+            if metrics is not None:
+                metrics.add_frames(len(batch_file_names))
+        await on_progress(frames_done, len(img_files))
+
+    try:
+        for batch_file_names in batches:
+            pending.add(asyncio.ensure_future(asyncio.to_thread(job_thread(metrics, tag_frame_batch), predictor, pasta_frames, batch_file_names, metrics)))
+            if len(pending) >= max_in_flight:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                await collect(done)
+        if pending:
+            done, pending = await asyncio.wait(pending)
+            await collect(done)
+    finally:
+        # Se o progresso abortar o job, espera os lotes em andamento antes de a pasta ser apagada
+        if pending:
+            await asyncio.wait(pending)
+    return dados_tags
+
+def scene_params(fps, model_repo, model_variant, segmenter_params):
+    """
+    Tudo o que muda o resultado de um processamento: gravado com o arquivo de
+    cenas (só se reaproveita uma duplicata processada com os mesmos valores) e
+    usado na assinatura dos checkpoints.
+    """
+    return {"fps": fps, "segmenter": list(segmenter_params), "model_repo": model_repo, "model_variant": model_variant}
+
+async def finalize_scene_detection(video_path: str, output_folder: str, matriz, callback, fps: float,
+                                   limiar_similaridade: float = 0.4, similarity_metric: str = "jaccard",
+                                   flicker_window: int = 0, min_scene_frames: int = 1,
+                                   scene_top_k: int = None, min_tag_support: float = 0.0, metrics=None,
+                                   model_repo: str = MODEL_REPO, model_variant: str = "fp32", before_save=None):
+    """
+    Etapas depois do tagging para os jobs feitos por workers, executadas no
+    servidor sobre a matriz completa: segmentação, arquivo de cenas e banco de dados.
+    'before_save' é chamado logo antes da gravação (uma exceção nele cancela tudo).
+    Retorna a lista de cenas gravada.
+    """
+    # Etapa 3: Analisar Cenas
+    await callback({"status": "processing", "stage": "ANALYZING", "progress": 85, "message": "Analisando transições de cena..."})
+    media_info = await get_media_info(video_path)
+    if not media_info or not media_info['duration']:
+        raise Exception("Não foi possível obter a duração do vídeo (ffprobe).")
+    video_duration = media_info['duration']
+
+    def segment():
+        trocas_de_cena, frames_ordenados = detectar_trocas_de_cena(None, fps, limiar_similaridade, similarity_metric,
+                                                                   flicker_window, min_scene_frames, matriz=matriz)
+        return agrupar_cenas_com_tags(trocas_de_cena, frames_ordenados, None, fps, video_duration,
+                                      scene_top_k, min_tag_support, matriz=matriz)
+
+    # Segmentação e gravações rodam em threads: o servidor segue atendendo enquanto isso
+    with stage(metrics, "segmentation"):
+        cenas_agrupadas = await asyncio.to_thread(segment)
+    params = scene_params(fps, model_repo, model_variant, (limiar_similaridade, similarity_metric, flicker_window,
+                                                           min_scene_frames, scene_top_k, min_tag_support))
+    if before_save is not None:
+        await asyncio.to_thread(before_save)
+    await save_scene_results(video_path, output_folder, cenas_agrupadas, callback, metrics, params)
+    return cenas_agrupadas
+
+async def save_scene_results(video_path: str, output_folder: str, cenas_agrupadas: list, callback, metrics=None,
+                             params=None):
+    """Etapas 4 e 5: grava o arquivo de cenas (com os parâmetros do processamento) e atualiza o banco de dados."""
+    base_name = os.path.splitext(os.path.basename(video_path))[0]
+
+    # Etapa 4: Salvar o arquivo de cenas (formato binário, ver scene_store.py)
+    await callback({"status": "processing", "stage": "SAVING", "progress": 95, "message": "Salvando arquivo de cenas..."})
+    with stage(metrics, "scene_write"):
+        await asyncio.to_thread(write_scenes, scene_file_for(output_folder, base_name), cenas_agrupadas, params)
+    # Um JSON antigo do mesmo vídeo ficaria desatualizado
+    legacy_json_path = os.path.join(output_folder, f"{base_name}_cenas.json")
+    if os.path.exists(legacy_json_path):
+        os.remove(legacy_json_path)
+
+    # --- [ETAPA INTEGRADA 5] Adicionar ao Banco de Dados ---
+    await callback({"status": "processing", "stage": "DATABASE", "progress": 98, "message": "Atualizando banco de dados..."})
+
+    category_name = Path(video_path).parent.name
+    with stage(metrics, "db_write"):
+        await asyncio.to_thread(add_video_to_database, video_path, category_name, cenas_agrupadas)
 
 async def run_scene_detection(video_path: str, output_folder: str, callback,
-                              fps: float = 1.0, limiar_similaridade: float = 0.4, batch_size: int = BATCH_SIZE):
+                              fps: float = 1.0, limiar_similaridade: float = 0.4, batch_size: int = BATCH_SIZE,
+                              model_repo: str = MODEL_REPO, model_variant: str = "fp32",
+                              similarity_metric: str = "jaccard", flicker_window: int = 0, min_scene_frames: int = 1,
+                              scene_top_k: int = None, min_tag_support: float = 0.0,
+                              job_id: str = None, profile: bool = False, reuse_duplicates: bool = True):
     """
     Função orquestradora que executa todo o pipeline de detecção de cena,
     incluindo a atualização final do banco de dados.
+    O tempo de cada etapa, os frames/s e o pico de memória vão para a tabela
+    job_metrics; com profile=True as pilhas amostradas do job vão para profiles/.
+    O vídeo é processado em trechos com checkpoint (ver scene_checkpoints.py):
+    repetir o job de um vídeo interrompido continua do último trecho concluído.
+    Com reuse_duplicates, um vídeo com a mesma impressão perceptual de outro já
+    processado (re-encode, cópia em outra pasta) com os mesmos parâmetros recebe as
+    cenas dele, sem inferência.
     """
     base_name = os.path.splitext(os.path.basename(video_path))[0]
-    # Usa uma pasta temporária na raiz do backend para velocidade máxima
-    temp_frames_path = os.path.join("temp_processing", f"temp_{base_name}_{os.getpid()}")
-    os.makedirs(temp_frames_path, exist_ok=True)
+    # Usa uma pasta temporária na raiz do backend para velocidade máxima. O nome é único
+    # por job: jobs simultâneos de vídeos com o mesmo nome (em pastas diferentes) não se misturam
+    os.makedirs("temp_processing", exist_ok=True)
+    temp_frames_path = tempfile.mkdtemp(prefix=f"temp_{base_name}_", dir="temp_processing")
+    metrics = JobMetrics(job_id or uuid.uuid4().hex, os.path.basename(video_path))
+    profiler = metrics.profiler = SamplingProfiler().start() if profile else None
+    job_status = "error"
+    predictor = None
+    segmenter_params = (limiar_similaridade, similarity_metric, flicker_window, min_scene_frames,
+                        scene_top_k, min_tag_support)
+    params = scene_params(fps, model_repo, model_variant, segmenter_params)
     
     try:
+        media_info = await get_media_info(video_path)
+        if not media_info or not media_info['duration']:
+            raise Exception("Não foi possível obter a duração do vídeo (ffprobe).")
+        video_duration = media_info['duration']
+
+        # A impressão é gravada mesmo sem reuse_duplicates, para as próximas cópias acharem este vídeo
+        await callback({"status": "processing", "stage": "FINGERPRINT", "progress": 1, "message": "Procurando duplicatas já processadas..."})
+        with metrics.stage("fingerprint"):
+            fingerprint = await get_fingerprint(video_path)
+            duplicate = find_processed_duplicate(fingerprint, params) if fingerprint and reuse_duplicates else None
+        if duplicate is not None:
+            source_path, cenas_agrupadas = duplicate
+            await callback({"status": "processing", "stage": "DUPLICATE", "progress": 90,
+                            "message": f"Duplicata de '{Path(source_path).name}': copiando {len(cenas_agrupadas)} cenas..."})
+            await save_scene_results(video_path, output_folder, cenas_agrupadas, callback, metrics, params)
+            job_status = "completed"
+            await callback({"status": "completed", "progress": 100, "message": "Processamento concluído (cenas copiadas da duplicata)!"})
+            return
+
         # Etapa 0: Carregando o modelo de IA
+        predictor = acquire_predictor(model_repo, model_variant)
         if predictor.model is None:
-            await callback({"status": "processing", "stage": "LOADING_MODEL", "progress": 2, "message": "Carregando modelo de IA..."})
-            predictor.load_model()
-
-        # Etapa 1: Extrair Frames
-        await callback({"status": "processing", "stage": "EXTRACTING", "progress": 5, "message": f"Extraindo frames ({fps} FPS)..."})
-        num_frames = extrair_frames(video_path, temp_frames_path, fps)
-        if num_frames == 0:
-            raise Exception("Nenhum frame foi extraído do vídeo.")
-
-        # Etapa 2: Gerar Tags
-        await callback({"status": "processing", "stage": "TAGGING", "progress": 15, "message": "Iniciando tagging..."})
-        
-        # A lógica de tagging com progresso granular
-        dados_tags = {}
-        img_files = sorted([f for f in os.listdir(temp_frames_path) if f.lower().endswith('.png')])
-
-        for i in range(0, len(img_files), batch_size):
-            batch_file_names = img_files[i:i + batch_size]
-            # Envolve o carregamento de imagens em um try-except para lidar com frames corrompidos
-            try:
-                batch_images = [Image.open(os.path.join(temp_frames_path, f)) for f in batch_file_names]
-            except Exception as img_err:
-                print(f"Aviso: Falha ao carregar um frame no lote. Pulando. Erro: {img_err}")
-                continue
-
-            batch_tags_result = predictor.predict_batch(batch_images, GENERAL_THRESHOLD, CHARACTER_THRESHOLD)
-            for file_name, tags in zip(batch_file_names, batch_tags_result):
-                dados_tags[file_name] = tags
-            
-            tagging_progress_percent = int(((i + len(batch_file_names)) / num_frames) * 100)
-            overall_progress = 15 + int(0.70 * tagging_progress_percent)
+            await callback({"status": "processing", "stage": "LOADING_MODEL", "progress": 2, "message": f"Carregando modelo de IA ({model_repo}, {model_variant})..."})
+            # Em uma thread: ler o modelo e aquecer as sessões não pode travar o event loop
+            with metrics.stage("model_load"):
+                await asyncio.to_thread(job_thread(metrics, predictor.load_model), model_repo, model_variant)
+
+        # Etapas 1 a 3 em trechos de CHECKPOINT_SECONDS: extração, tagging e segmentação
+        # incremental. Só as tags do trecho atual ficam em memória; ao fim de cada trecho
+        # o estado vai para um checkpoint, de onde um job interrompido é retomado.
+        signature = checkpoint_signature(video_path, params)
+        checkpoint = load_checkpoint(video_path, signature)
+        if checkpoint is not None:
+            segmenter = OnlineSegmenter.from_state(checkpoint["state"], *segmenter_params)
+            cenas_agrupadas, next_frame = checkpoint["scenes"], checkpoint["next_frame"]
+            await callback({"status": "processing", "stage": "RESUMING", "progress": 5,
+                            "message": f"Retomando do checkpoint em {next_frame / fps:.0f}s..."})
+        else:
+            segmenter = OnlineSegmenter(*segmenter_params)
+            cenas_agrupadas, next_frame = [], 0
+        saved_scenes = len(cenas_agrupadas)
+        chunk_frames = max(1, int(round(CHECKPOINT_SECONDS * fps)))
+        total_frames = max(1, int(np.ceil(video_duration * fps)))
+
+        def add_scenes(finalizadas):
+            for start_time, end_time, tags_principais in finalizadas:
+                end_time = video_duration if end_time is None else end_time
+                cenas_agrupadas.append(_montar_cena(len(cenas_agrupadas) + 1, start_time, end_time, tags_principais))
+
+        async def report_tagging(frames_done, chunk_total):
+            tagging_progress_percent = min(100, int((next_frame + frames_done) / total_frames * 100))
+            overall_progress = 5 + int(0.80 * tagging_progress_percent)
             await callback({
                 "status": "processing", 
                 "stage": "TAGGING", 
@@ -216,31 +531,50 @@ async def run_scene_detection(video_path: str, output_folder: str, callback,
                 "message": f"Analisando frames ({tagging_progress_percent}%)"
             })
 
-        if not dados_tags:
+        while True:
+            chunk_start = next_frame / fps
+            is_last_chunk = (next_frame + chunk_frames) / fps >= video_duration
+            if os.path.exists(temp_frames_path):
+                shutil.rmtree(temp_frames_path)
+
+            await callback({"status": "processing", "stage": "EXTRACTING", "progress": 5 + int(80 * min(next_frame / total_frames, 1)),
+                            "message": f"Extraindo frames ({fps} FPS) a partir de {chunk_start:.0f}s..."})
+            with metrics.stage("extraction"):
+                # O último trecho vai até o fim do arquivo, mesmo se a duração do ffprobe for imprecisa.
+                # Os outros param em chunk_frames frames, mas o -ss/-t pode render um a menos
+                num_frames = await extrair_frames(video_path, temp_frames_path, fps, chunk_start,
+                                                  None if is_last_chunk else chunk_frames / fps,
+                                                  None if is_last_chunk else chunk_frames)
+            if num_frames == 0:
+                if next_frame == 0:
+                    raise Exception("Nenhum frame foi extraído do vídeo.")
+                break
+
+            dados_tags = await tag_extracted_frames(predictor, temp_frames_path, batch_size, report_tagging, metrics)
+            with metrics.stage("segmentation"):
+                # Nomes frame_000001.png...: a ordem alfabética é a ordem temporal
+                for frame_name in sorted(dados_tags):
+                    frame_number = int(os.path.splitext(frame_name)[0].rsplit('_', 1)[-1])
+                    add_scenes(segmenter.push((next_frame + frame_number - 1) / fps, dados_tags[frame_name]))
+            # Avança pelos frames realmente extraídos: se faltou um, o próximo trecho começa nele
+            next_frame += num_frames
+            if is_last_chunk:
+                break
+            with metrics.stage("checkpoint"):
+                save_checkpoint(video_path, signature, next_frame, segmenter.to_state(), cenas_agrupadas[saved_scenes:])
+            saved_scenes = len(cenas_agrupadas)
+
+        if segmenter.position == 0:
             raise Exception("Falha ao gerar tags para os frames.")
+        await callback({"status": "processing", "stage": "ANALYZING", "progress": 85, "message": "Finalizando a última cena..."})
+        with metrics.stage("segmentation"):
+            add_scenes(segmenter.finish())
 
-        # Etapa 3: Analisar Cenas
-        await callback({"status": "processing", "stage": "ANALYZING", "progress": 85, "message": "Analisando transições de cena..."})
-        ffprobe_cmd = ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'default=noprint_wrappers=1:nokey=1', video_path]
-        result = subprocess.run(ffprobe_cmd, capture_output=True, text=True, check=True)
-        video_duration = float(result.stdout.strip())
-        trocas_de_cena, frames_ordenados = detectar_trocas_de_cena(dados_tags, fps, limiar_similaridade)
-        cenas_agrupadas = agrupar_cenas_com_tags(trocas_de_cena, frames_ordenados, dados_tags, fps, video_duration)
-
-        # Etapa 4: Salvar Resultados em JSON
-        await callback({"status": "processing", "stage": "SAVING", "progress": 95, "message": "Salvando arquivo de cenas..."})
-        json_output_path = os.path.join(output_folder, f"{base_name}_cenas.json")
-        with open(json_output_path, 'w', encoding='utf-8') as f:
-            json.dump(cenas_agrupadas, f, indent=4, ensure_ascii=False)
-
-        # --- [ETAPA INTEGRADA 5] Adicionar ao Banco de Dados ---
-        await callback({"status": "processing", "stage": "DATABASE", "progress": 98, "message": "Atualizando banco de dados..."})
-        
-        category_name = Path(video_path).parent.name
-        # Chama a função síncrona de forma segura dentro do fluxo assíncrono
-        # O FastAPI/Starlette lida com isso em um thread separado
-        add_video_to_database(video_path, category_name, cenas_agrupadas)
+        # Etapas 4 e 5: arquivo de cenas e banco de dados
+        await save_scene_results(video_path, output_folder, cenas_agrupadas, callback, metrics, params)
+        delete_checkpoint(video_path)
 
+        job_status = "completed"
         await callback({"status": "completed", "progress": 100, "message": "Processamento concluído!"})
 
     except Exception as e:
@@ -251,4 +585,13 @@ async def run_scene_detection(video_path: str, output_folder: str, callback,
     finally:
         # Etapa de Limpeza, sempre executada
         if os.path.exists(temp_frames_path):
-            shutil.rmtree(temp_frames_path)
\ No newline at end of file
+            shutil.rmtree(temp_frames_path)
+        if predictor is not None:
+            release_predictor(predictor)
+        if profiler is not None:
+            print(f"Profile do job gravado em {profiler.stop_and_dump(metrics.job_id)}")
+        try:
+            metrics.finish(job_status)
+        except Exception as metrics_err:
+            # Falha ao gravar métricas não deve mascarar o resultado do job
+            print(f"Aviso: não foi possível gravar as métricas do job: {metrics_err}")
@@ -0,0 +1,78 @@
+"""
+Checkpoints do processamento de vídeos longos.
+
+O processamento local anda em trechos de CHECKPOINT_SECONDS; ao fim de cada
+trecho o estado do OnlineSegmenter e as cenas já finalizadas são gravados aqui.
+Se o processo morrer, o próximo job do mesmo vídeo (com os mesmos parâmetros)
+continua do último trecho concluído em vez de recomeçar do frame zero.
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+
+from .database_service import DB_FILE
+
+# ==============================================================================
+# SEÇÃO 1: CONFIGURAÇÕES
+# ==============================================================================
+CHECKPOINT_SECONDS = float(os.environ.get("CHECKPOINT_SECONDS", 300))
+
+def checkpoint_signature(video_path, params):
+    """
+    Identifica o vídeo (tamanho e data de modificação) e os parâmetros que mudam
+    o resultado; um checkpoint com outra assinatura é descartado.
+    """
+    stat = os.stat(video_path)
+    data = json.dumps({"size": stat.st_size, "mtime": stat.st_mtime, **params}, sort_keys=True)
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+# ==============================================================================
+# SEÇÃO 2: LEITURA E GRAVAÇÃO
+# ==============================================================================
+
+def load_checkpoint(video_path, signature):
+    """
+    Retorna {'next_frame', 'state', 'scenes'} do último checkpoint do vídeo, ou
+    None. Um checkpoint de outra assinatura é apagado.
+    """
+    conn = sqlite3.connect(DB_FILE, timeout=30)
+    try:
+        row = conn.execute("SELECT signature, next_frame, state_json FROM scene_checkpoints WHERE video_path = ?",
+                           (video_path,)).fetchone()
+        if row is None:
+            return None
+        if row[0] != signature:
+            _delete(conn, video_path)
+            conn.commit()
+            return None
+        scenes = [json.loads(scene_json) for (scene_json,) in conn.execute(
+            "SELECT scene_json FROM scene_checkpoint_scenes WHERE video_path = ? ORDER BY scene_number", (video_path,))]
+    finally:
+        conn.close()
+    return {"next_frame": row[1], "state": json.loads(row[2]), "scenes": scenes}
+
+def save_checkpoint(video_path, signature, next_frame, state, new_scenes):
+    """Grava o estado e acrescenta as cenas finalizadas desde o último checkpoint (cada uma com 'cena_n')."""
+    conn = sqlite3.connect(DB_FILE, timeout=30)
+    try:
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO scene_checkpoints (video_path, signature, next_frame, state_json, updated_at) "
+                         "VALUES (?, ?, ?, ?, ?)", (video_path, signature, next_frame, json.dumps(state), time.time()))
+            conn.executemany("INSERT OR REPLACE INTO scene_checkpoint_scenes (video_path, scene_number, scene_json) VALUES (?, ?, ?)",
+                             [(video_path, scene["cena_n"], json.dumps(scene)) for scene in new_scenes])
+    finally:
+        conn.close()
+
+def _delete(conn, video_path):
+    conn.execute("DELETE FROM scene_checkpoints WHERE video_path = ?", (video_path,))
+    conn.execute("DELETE FROM scene_checkpoint_scenes WHERE video_path = ?", (video_path,))
+
+def delete_checkpoint(video_path):
+    conn = sqlite3.connect(DB_FILE, timeout=30)
+    try:
+        with conn:
+            _delete(conn, video_path)
+    finally:
+        conn.close()
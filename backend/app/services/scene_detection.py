@@ -0,0 +1,332 @@
+import re
+
+import numpy as np
+
+# ==============================================================================
+# SEÇÃO 1: MATRIZ ESPARSA FRAME x TAG
+# ==============================================================================
+
+_FRAME_NUMBER = re.compile(r'(\d+)')
+
+class FrameTagMatrix:
+    """
+    Tags de todos os frames de um vídeo em formato CSR: as tags do frame i são
+    indices[indptr[i]:indptr[i + 1]] (ids em tag_names, ordenados) com os
+    scores correspondentes em scores[...]. Os frames ficam em ordem temporal.
+    """
+    def __init__(self, frame_names, tag_names, indptr, indices, scores):
+        self.frame_names = frame_names
+        self.tag_names = tag_names
+        self.indptr = indptr
+        self.indices = indices
+        self.scores = scores
+
+    @property
+    def n_frames(self):
+        return len(self.frame_names)
+
+    @property
+    def n_tags(self):
+        return len(self.tag_names)
+
+    @classmethod
+    def from_tag_dict(cls, dados_tags):
+        """Monta a matriz a partir de {nome_do_frame: {tag: score}} (formato do pipeline)."""
+        names = list(dados_tags.keys())
+        numbers = np.array([int(_FRAME_NUMBER.search(name).group(1)) for name in names], dtype=np.int64)
+        frame_names = [names[i] for i in np.argsort(numbers, kind='stable')]
+
+        vocabulary = {}
+        counts = np.zeros(len(frame_names), dtype=np.int64)
+        indices, scores = [], []
+        for i, name in enumerate(frame_names):
+            tags = dados_tags[name]
+            counts[i] = len(tags)
+            for tag, score in tags.items():
+                indices.append(vocabulary.setdefault(tag, len(vocabulary)))
+                scores.append(score)
+
+        indptr = np.zeros(len(frame_names) + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        indices = np.array(indices, dtype=np.int32)
+        scores = np.array(scores, dtype=np.float32)
+
+        # Ordena as tags dentro de cada frame (chave = frame * n_tags + tag)
+        rows = np.repeat(np.arange(len(frame_names), dtype=np.int64), counts)
+        order = np.argsort(rows * max(len(vocabulary), 1) + indices, kind='stable')
+        return cls(frame_names, list(vocabulary), indptr, indices[order], scores[order])
+
+    def row_ids(self):
+        """Índice do frame de cada entrada não nula."""
+        return np.repeat(np.arange(self.n_frames, dtype=np.int64), np.diff(self.indptr))
+
+# ==============================================================================
+# SEÇÃO 2: SIMILARIDADE ENTRE FRAMES (UMA PASSADA VETORIZADA)
+# ==============================================================================
+
+def _matched_entries(matrix, lag):
+    """
+    Posições das entradas em comum entre o frame i e o frame i + lag, para todo i.
+    Cada entrada vira a chave única frame * n_tags + tag (já ordenada no CSR);
+    deslocar as chaves em 'lag' linhas e buscá-las nas originais acha as tags repetidas.
+    """
+    rows = matrix.row_ids()
+    width = max(matrix.n_tags, 1)
+    keys = rows * width + matrix.indices
+    shifted = keys + lag * width
+    positions = np.minimum(np.searchsorted(keys, shifted), max(len(keys) - 1, 0))
+    left = np.flatnonzero(keys[positions] == shifted) if len(keys) else positions
+    return rows, left, positions[left]
+
+def frame_similarity(matrix, metric="jaccard", lag=1):
+    """
+    Similaridade entre cada frame i e o frame i + lag (vetor com n_frames - lag posições).
+    - 'jaccard': |A ∩ B| / |A ∪ B| dos conjuntos de tags;
+    - 'cosine': cosseno entre os vetores de scores (tags com score alto pesam mais).
+    Dois frames sem nenhuma tag são considerados iguais (similaridade 1).
+    """
+    n_pairs = max(matrix.n_frames - lag, 0)
+    if n_pairs == 0:
+        return np.zeros(0, dtype=np.float64)
+    rows, left, right = _matched_entries(matrix, lag)
+    pair_rows = rows[left]
+
+    if metric == "jaccard":
+        sizes = np.diff(matrix.indptr)
+        intersection = np.bincount(pair_rows, minlength=matrix.n_frames)[:n_pairs]
+        union = sizes[:n_pairs] + sizes[lag:] - intersection
+        return np.divide(intersection, union, out=np.ones(n_pairs, dtype=np.float64), where=union > 0)
+
+    if metric == "cosine":
+        scores = matrix.scores.astype(np.float64)
+        dot = np.bincount(pair_rows, weights=scores[left] * scores[right], minlength=matrix.n_frames)[:n_pairs]
+        norms = np.sqrt(np.bincount(rows, weights=scores * scores, minlength=matrix.n_frames))
+        denominator = norms[:n_pairs] * norms[lag:]
+        similarity = np.divide(dot, denominator, out=np.zeros(n_pairs, dtype=np.float64), where=denominator > 0)
+        similarity[(norms[:n_pairs] == 0) & (norms[lag:] == 0)] = 1.0
+        return similarity
+
+    raise ValueError(f"Métrica de similaridade desconhecida: {metric}")
+
+# ==============================================================================
+# SEÇÃO 3: DETECÇÃO DAS TROCAS DE CENA
+# ==============================================================================
+
+def detect_boundaries(matrix, threshold, metric="jaccard", flicker_window=0, min_scene_frames=1):
+    """
+    Índices dos frames que iniciam uma nova cena (sempre começa com 0).
+
+    Sem opções extras, há troca entre i e i+1 sempre que a similaridade fica abaixo
+    do limiar (o comportamento original). Com flicker_window = W > 0, uma queda é
+    ignorada se o conteúdo anterior volta em até W frames: se o frame i for
+    parecido (>= limiar) com algum dos frames i+2 .. i+W+1, os frames entre eles
+    são tratados como ruído (flash, legenda, frame corrompido) e não como cenas.
+    min_scene_frames descarta trocas que criariam cenas mais curtas que isso.
+    """
+    if matrix.n_frames == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    similarity = frame_similarity(matrix, metric)
+    is_cut = np.zeros(matrix.n_frames, dtype=bool)
+    is_cut[1:] = similarity < threshold
+
+    if flicker_window > 0:
+        # Marcações de supressão como intervalos [j+1, j+lag] acumulados em um vetor de diferenças
+        suppress = np.zeros(matrix.n_frames + 1, dtype=np.int64)
+        for lag in range(2, flicker_window + 2):
+            returns = np.flatnonzero(frame_similarity(matrix, metric, lag) >= threshold)
+            returns = returns[similarity[returns] < threshold]
+            np.add.at(suppress, returns + 1, 1)
+            np.add.at(suppress, returns + lag + 1, -1)
+        is_cut &= np.cumsum(suppress[:-1]) == 0
+
+    boundaries = np.flatnonzero(is_cut)
+    if min_scene_frames > 1 and len(boundaries):
+        kept = []
+        last = 0
+        for frame in boundaries:
+            if frame - last >= min_scene_frames:
+                kept.append(frame)
+                last = frame
+        boundaries = np.array(kept, dtype=np.int64)
+    return np.concatenate(([0], boundaries)).astype(np.int64)
+
+# ==============================================================================
+# SEÇÃO 4: AGREGAÇÃO DAS TAGS POR CENA
+# ==============================================================================
+
+def aggregate_scene_tags(matrix, starts, top_k=None, min_support=0.0):
+    """
+    Tags principais de cada cena como reduções por segmento sobre a matriz.
+    'starts' são os frames iniciais das cenas (saída de detect_boundaries).
+
+    O score de uma tag na cena é a média dos scores nos frames em que ela aparece
+    (como antes); o suporte é a fração dos frames da cena em que ela aparece.
+    Tags com suporte abaixo de min_support são descartadas e, se top_k for dado,
+    só as top_k de maior score ficam. Retorna uma lista (uma por cena) de listas
+    [(tag, score)] em ordem decrescente de score.
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    n_scenes = len(starts)
+    if n_scenes == 0 or len(matrix.indices) == 0:
+        return [[] for _ in range(n_scenes)]
+
+    frames_per_scene = np.diff(np.append(starts, matrix.n_frames))
+    entry_scene = np.searchsorted(starts, matrix.row_ids(), side='right') - 1
+    keys = entry_scene * matrix.n_tags + matrix.indices
+
+    # Agrupa as entradas por (cena, tag) e soma cada grupo com um único reduceat
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    group_starts = np.flatnonzero(np.diff(sorted_keys, prepend=-1))
+    sums = np.add.reduceat(matrix.scores[order].astype(np.float64), group_starts)
+    counts = np.diff(np.append(group_starts, len(sorted_keys)))
+    group_keys = sorted_keys[group_starts]
+    group_scene = group_keys // matrix.n_tags
+    group_tag = group_keys % matrix.n_tags
+    means = sums / counts
+
+    keep = counts >= min_support * frames_per_scene[group_scene]
+    group_scene, group_tag, means = group_scene[keep], group_tag[keep], means[keep]
+
+    # Ordena por cena e, dentro dela, por score decrescente; o rank corta o top_k
+    order = np.lexsort((-means, group_scene))
+    group_scene, group_tag, means = group_scene[order], group_tag[order], means[order]
+    scene_offsets = np.searchsorted(group_scene, np.arange(n_scenes + 1))
+    if top_k is not None:
+        rank = np.arange(len(group_scene)) - scene_offsets[group_scene]
+        keep = rank < top_k
+        group_scene, group_tag, means = group_scene[keep], group_tag[keep], means[keep]
+        scene_offsets = np.searchsorted(group_scene, np.arange(n_scenes + 1))
+
+    tag_names = matrix.tag_names
+    return [[(tag_names[tag], float(score)) for tag, score in
+             zip(group_tag[scene_offsets[i]:scene_offsets[i + 1]].tolist(), means[scene_offsets[i]:scene_offsets[i + 1]].tolist())]
+            for i in range(n_scenes)]
+
+# ==============================================================================
+# SEÇÃO 5: SEGMENTAÇÃO INCREMENTAL (MEMÓRIA LIMITADA)
+# ==============================================================================
+
+def tag_similarity(tags_a, tags_b, metric="jaccard"):
+    """Mesma similaridade de frame_similarity, para dois frames {tag: score}."""
+    if metric == "jaccard":
+        intersection = len(tags_a.keys() & tags_b.keys())
+        union = len(tags_a) + len(tags_b) - intersection
+        return intersection / union if union > 0 else 1.0
+    if metric == "cosine":
+        norm_a = np.sqrt(sum(score * score for score in tags_a.values()))
+        norm_b = np.sqrt(sum(score * score for score in tags_b.values()))
+        if norm_a == 0 and norm_b == 0:
+            return 1.0
+        if norm_a == 0 or norm_b == 0:
+            return 0.0
+        dot = sum(score * tags_b[tag] for tag, score in tags_a.items() if tag in tags_b)
+        return float(dot / (norm_a * norm_b))
+    raise ValueError(f"Métrica de similaridade desconhecida: {metric}")
+
+class OnlineSegmenter:
+    """
+    Versão incremental de detect_boundaries + aggregate_scene_tags: recebe os
+    frames em ordem (push) e devolve cada cena assim que a troca seguinte é
+    confirmada. Em memória ficam só os últimos flicker_window + 2 frames e as
+    somas/contagens das tags da cena atual.
+
+    Uma troca no frame k só é decidida depois do frame k + flicker_window (o
+    conteúdo anterior ainda pode voltar). O estado completo cabe em JSON
+    (to_state/from_state), para os checkpoints do processamento.
+    """
+    def __init__(self, threshold, metric="jaccard", flicker_window=0, min_scene_frames=1, top_k=None, min_support=0.0):
+        self.threshold = threshold
+        self.metric = metric
+        self.flicker_window = flicker_window
+        self.min_scene_frames = min_scene_frames
+        self.top_k = top_k
+        self.min_support = min_support
+        # Últimos frames recebidos: [tempo, tags, queda em relação ao anterior, suprimido]
+        self.buffer = []
+        self.position = 0
+        self.decided = 0
+        self.last_cut = 0
+        self.scene_start = None
+        self.scene_frames = 0
+        self.scene_sums = {}
+        self.scene_counts = {}
+        # Índice de cada tag na ordem em que apareceu no vídeo (como o vocabulário de
+        # FrameTagMatrix.from_tag_dict): desempata scores iguais como o processamento em lote
+        self.tag_order = {}
+
+    def push(self, time, tags):
+        """Adiciona o próximo frame; retorna as cenas finalizadas [(início, fim, [(tag, score)])]."""
+        for tag in tags:
+            self.tag_order.setdefault(tag, len(self.tag_order))
+        entry = [time, tags, False, False]
+        if self.buffer:
+            entry[2] = tag_similarity(self.buffer[-1][1], tags, self.metric) < self.threshold
+        self.buffer.append(entry)
+        # Retorno do conteúdo do frame j = n - lag depois de uma queda em j + 1: os frames j+1..n são ruído
+        for lag in range(2, self.flicker_window + 2):
+            if len(self.buffer) <= lag:
+                break
+            if self.buffer[-lag][2] and tag_similarity(self.buffer[-1 - lag][1], tags, self.metric) >= self.threshold:
+                for suppressed in self.buffer[-lag:]:
+                    suppressed[3] = True
+        self.position += 1
+
+        scenes = []
+        while self.decided < self.position - self.flicker_window:
+            scenes.extend(self._decide_next())
+        del self.buffer[:-(self.flicker_window + 2)]
+        return scenes
+
+    def finish(self):
+        """Decide os frames restantes; retorna as últimas cenas (a última com fim None)."""
+        scenes = []
+        while self.decided < self.position:
+            scenes.extend(self._decide_next())
+        if self.scene_frames:
+            scenes.append((self.scene_start, None, self._scene_tags()))
+            self.scene_frames = 0
+        return scenes
+
+    def _decide_next(self):
+        time, tags, drop, suppressed = self.buffer[len(self.buffer) - (self.position - self.decided)]
+        scenes = []
+        frame = self.decided
+        if frame > 0 and drop and not suppressed and frame - self.last_cut >= self.min_scene_frames:
+            scenes.append((self.scene_start, time, self._scene_tags()))
+            self.last_cut = frame
+            self.scene_frames = 0
+            self.scene_sums, self.scene_counts = {}, {}
+        if self.scene_frames == 0:
+            self.scene_start = time
+        self.scene_frames += 1
+        for tag, score in tags.items():
+            # float32, como na matriz: as médias saem iguais às do processamento em lote
+            self.scene_sums[tag] = self.scene_sums.get(tag, 0.0) + float(np.float32(score))
+            self.scene_counts[tag] = self.scene_counts.get(tag, 0) + 1
+        self.decided += 1
+        return scenes
+
+    def _scene_tags(self):
+        min_count = self.min_support * self.scene_frames
+        means = [(tag, total / self.scene_counts[tag]) for tag, total in self.scene_sums.items()
+                 if self.scene_counts[tag] >= min_count]
+        means.sort(key=lambda item: (-item[1], self.tag_order[item[0]]))
+        return means[:self.top_k] if self.top_k is not None else means
+
+    def to_state(self):
+        return {"buffer": self.buffer, "position": self.position, "decided": self.decided, "last_cut": self.last_cut,
+                "scene_start": self.scene_start, "scene_frames": self.scene_frames,
+                "scene_sums": self.scene_sums, "scene_counts": self.scene_counts, "tag_order": self.tag_order}
+
+    @classmethod
+    def from_state(cls, state, threshold, metric="jaccard", flicker_window=0, min_scene_frames=1, top_k=None, min_support=0.0):
+        segmenter = cls(threshold, metric, flicker_window, min_scene_frames, top_k, min_support)
+        for name, value in state.items():
+            setattr(segmenter, name, value)
+        # Checkpoints anteriores ao tag_order: as tags já vistas entram na ordem em que aparecem no estado
+        for tags in [segmenter.scene_sums] + [entry[1] for entry in segmenter.buffer]:
+            for tag in tags:
+                segmenter.tag_order.setdefault(tag, len(segmenter.tag_order))
+        return segmenter
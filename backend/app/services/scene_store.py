@@ -0,0 +1,248 @@
+"""
+Arquivo de cenas de cada vídeo ({nome}_cenas.npz), que substitui o antigo
+{nome}_cenas.json indentado.
+
+O .npz (NumPy, sem compressão) guarda uma coluna por array: número, início,
+fim e duração das cenas, e as tags em formato CSR com os nomes internados uma
+única vez. Como cada array é lido sob demanda, quem só precisa dos limites
+das cenas não decodifica nenhuma tag.
+
+Migração dos JSON existentes (a partir da pasta 'backend'):
+    python -m app.services.scene_store migrate
+    python -m app.services.scene_store migrate --root videos/Pasta --keep-json
+"""
+import io
+import os
+import json
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+# ==============================================================================
+# SEÇÃO 1: CONFIGURAÇÕES
+# ==============================================================================
+SCENE_FORMAT_VERSION = 1
+SCENES_SUFFIX = "_cenas.npz"
+LEGACY_SCENES_SUFFIX = "_cenas.json"
+BOUNDARY_FIELDS = ("scene_number", "start_time", "end_time", "duration")
+
+class SceneFileError(ValueError):
+    """Arquivo de cenas corrompido ou de uma versão desconhecida."""
+
+# ==============================================================================
+# SEÇÃO 2: LOCALIZAÇÃO DOS ARQUIVOS
+# ==============================================================================
+
+def scene_file_for(folder, base_name):
+    """Caminho onde o arquivo de cenas de um vídeo deve ser gravado."""
+    return Path(folder) / f"{base_name}{SCENES_SUFFIX}"
+
+def find_scene_file(folder, base_name):
+    """Arquivo de cenas existente do vídeo (o binário tem prioridade sobre o JSON antigo), ou None."""
+    for suffix in (SCENES_SUFFIX, LEGACY_SCENES_SUFFIX):
+        path = Path(folder) / f"{base_name}{suffix}"
+        if path.exists():
+            return path
+    return None
+
+def scene_base_name(filename):
+    """Nome do vídeo a partir do nome de um arquivo de cenas (None se não for um)."""
+    for suffix in (SCENES_SUFFIX, LEGACY_SCENES_SUFFIX):
+        if filename.endswith(suffix):
+            return filename[:-len(suffix)]
+    return None
+
+# ==============================================================================
+# SEÇÃO 3: ESCRITA E LEITURA
+# ==============================================================================
+
+def write_scenes(path, cenas, params=None):
+    """
+    Grava a lista de cenas (formato do pipeline: cena_n, start_time, end_time,
+    duration, tags_principais) no formato binário, de forma atômica.
+    'params' (modelo, fps, parâmetros da segmentação) vai junto, em JSON.
+    """
+    vocabulary = {}
+    indptr = [0]
+    tag_ids, tag_scores = [], []
+    for cena in cenas:
+        for tag, score in cena.get('tags_principais', {}).items():
+            tag_ids.append(vocabulary.setdefault(tag, len(vocabulary)))
+            tag_scores.append(score)
+        indptr.append(len(tag_ids))
+
+    path = Path(path)
+    temp_path = path.with_name(path.name + ".tmp.npz")
+    # Campo opcional: leitores antigos o ignoram, então a versão do formato não muda
+    extra = {"params_json": np.array(json.dumps(params, sort_keys=True))} if params is not None else {}
+    np.savez(temp_path, **extra,
+             version=np.int32(SCENE_FORMAT_VERSION),
+             scene_number=np.array([c.get('cena_n') for c in cenas], dtype=np.int32),
+             start_time=np.array([c.get('start_time') for c in cenas], dtype=np.float64),
+             end_time=np.array([c.get('end_time') for c in cenas], dtype=np.float64),
+             duration=np.array([c.get('duration') for c in cenas], dtype=np.float64),
+             tag_names=np.array(list(vocabulary), dtype=np.str_),
+             tag_indptr=np.array(indptr, dtype=np.int64),
+             tag_ids=np.array(tag_ids, dtype=np.int32),
+             # Scores já vêm arredondados em 3 casas: guardados como milésimos em 16 bits
+             tag_scores=np.rint(np.array(tag_scores, dtype=np.float64) * 1000).astype(np.uint16))
+    os.replace(temp_path, path)
+    return path
+
+def _open_npz(path):
+    try:
+        data = np.load(path)
+    except (OSError, ValueError) as e:
+        raise SceneFileError(f"Arquivo de cenas inválido '{path}': {e}")
+    if 'version' not in data.files or int(data['version']) != SCENE_FORMAT_VERSION:
+        data.close()
+        raise SceneFileError(f"Versão de arquivo de cenas não suportada em '{path}'")
+    return data
+
+def _read_json(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        cenas = json.loads(content) if content else []
+    except (OSError, json.JSONDecodeError) as e:
+        raise SceneFileError(f"Arquivo de cenas inválido '{path}': {e}")
+    if not isinstance(cenas, list):
+        raise SceneFileError(f"Conteúdo de '{path}' não é uma lista de cenas")
+    return cenas
+
+def read_scene_boundaries(path):
+    """
+    Apenas os limites das cenas: lista de dicts com cena_n, start_time, end_time e duration.
+    No formato binário as tags não são lidas do disco.
+    """
+    path = Path(path)
+    if path.name.endswith(LEGACY_SCENES_SUFFIX):
+        return [{"cena_n": c.get('cena_n'), "start_time": c.get('start_time'),
+                 "end_time": c.get('end_time'), "duration": c.get('duration')} for c in _read_json(path)]
+    with _open_npz(path) as data:
+        columns = [data[field].tolist() for field in BOUNDARY_FIELDS]
+    return [{"cena_n": number, "start_time": start, "end_time": end, "duration": duration}
+            for number, start, end, duration in zip(*columns)]
+
+def read_scene_params(path):
+    """Parâmetros do processamento que gerou o arquivo, ou None (JSON antigo ou arquivo sem eles)."""
+    path = Path(path)
+    if path.name.endswith(LEGACY_SCENES_SUFFIX):
+        return None
+    with _open_npz(path) as data:
+        if 'params_json' not in data.files:
+            return None
+        return json.loads(str(data['params_json']))
+
+def read_scenes(path):
+    """Cenas completas, com tags_principais, no mesmo formato do antigo _cenas.json."""
+    path = Path(path)
+    if path.name.endswith(LEGACY_SCENES_SUFFIX):
+        return _read_json(path)
+    with _open_npz(path) as data:
+        columns = [data[field].tolist() for field in BOUNDARY_FIELDS]
+        tag_names = data['tag_names'].tolist()
+        indptr = data['tag_indptr'].tolist()
+        tag_ids = data['tag_ids'].tolist()
+        tag_scores = (data['tag_scores'] / 1000.0).round(3).tolist()
+
+    cenas = []
+    for i, (number, start, end, duration) in enumerate(zip(*columns)):
+        tags = {tag_names[tag_ids[j]]: tag_scores[j] for j in range(indptr[i], indptr[i + 1])}
+        cenas.append({"cena_n": number, "start_time": start, "end_time": end,
+                      "duration": duration, "tags_principais": tags})
+    return cenas
+
+# ==============================================================================
+# SEÇÃO 4: MIGRAÇÃO DOS JSON EXISTENTES
+# ==============================================================================
+
+def migrate_json_files(root, keep_json=False):
+    """
+    Converte todos os _cenas.json abaixo de 'root' para o formato binário.
+    Cada arquivo é relido e comparado antes de o JSON ser removido.
+    Retorna (convertidos, falhas).
+    """
+    converted, failed = 0, []
+    for folder, _, files in os.walk(root):
+        for filename in files:
+            if not filename.endswith(LEGACY_SCENES_SUFFIX):
+                continue
+            json_path = Path(folder) / filename
+            target = scene_file_for(folder, scene_base_name(filename))
+            try:
+                cenas = _read_json(json_path)
+                write_scenes(target, cenas)
+                expected = [{**c, "tags_principais": {t: round(s, 3) for t, s in c.get('tags_principais', {}).items()}}
+                            for c in cenas]
+                if read_scenes(target) != expected:
+                    raise SceneFileError("conteúdo relido difere do JSON original")
+            except (SceneFileError, TypeError, ValueError) as e:
+                failed.append((str(json_path), str(e)))
+                if target.exists():
+                    target.unlink()
+                continue
+            if not keep_json:
+                json_path.unlink()
+            converted += 1
+    return converted, failed
+
+# ==============================================================================
+# SEÇÃO 5: RESULTADOS POR FRAME ENVIADOS PELOS WORKERS
+# ==============================================================================
+
+FRAME_RESULTS_VERSION = 1
+
+def encode_frame_results(matriz, meta):
+    """
+    Serializa a matriz frame x tag de um job (FrameTagMatrix) em um .npz compacto,
+    com os scores em milésimos (16 bits) e 'meta' (dict JSON) junto.
+    """
+    buffer = io.BytesIO()
+    np.savez(buffer,
+             version=np.int32(FRAME_RESULTS_VERSION),
+             frame_names=np.array(matriz.frame_names, dtype=np.str_),
+             tag_names=np.array(matriz.tag_names, dtype=np.str_),
+             indptr=np.asarray(matriz.indptr, dtype=np.int64),
+             indices=np.asarray(matriz.indices, dtype=np.int32),
+             scores=np.rint(np.asarray(matriz.scores, dtype=np.float64) * 1000).astype(np.uint16),
+             meta=np.array(json.dumps(meta)))
+    return buffer.getvalue()
+
+def decode_frame_results(data):
+    """Inverso de encode_frame_results: retorna (FrameTagMatrix, meta)."""
+    from .scene_detection import FrameTagMatrix
+
+    try:
+        with np.load(io.BytesIO(data)) as arrays:
+            if 'version' not in arrays.files or int(arrays['version']) != FRAME_RESULTS_VERSION:
+                raise SceneFileError("Versão de resultados por frame não suportada")
+            matriz = FrameTagMatrix(arrays['frame_names'].tolist(), arrays['tag_names'].tolist(), arrays['indptr'],
+                                    arrays['indices'], (arrays['scores'] / 1000.0).astype(np.float32))
+            meta = json.loads(str(arrays['meta']))
+    except (OSError, ValueError, KeyError) as e:
+        raise SceneFileError(f"Resultados por frame inválidos: {e}")
+    # Índices negativos seriam aceitos pelo numpy (contando do fim) e trocariam as tags em silêncio
+    if (len(matriz.indptr) != len(matriz.frame_names) + 1 or matriz.indptr[0] != 0
+            or matriz.indptr[-1] != len(matriz.indices) or np.any(np.diff(matriz.indptr) < 0)
+            or (len(matriz.indices) and (int(matriz.indices.min()) < 0
+                                         or int(matriz.indices.max()) >= len(matriz.tag_names)))):
+        raise SceneFileError("Resultados por frame inconsistentes")
+    return matriz, meta
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate = subparsers.add_parser("migrate", help="Converte os _cenas.json existentes")
+    migrate.add_argument("--root", default=str(Path(__file__).resolve().parent.parent.parent / "videos"))
+    migrate.add_argument("--keep-json", action="store_true", help="Mantém os arquivos JSON depois da conversão")
+    args = parser.parse_args()
+
+    converted, failed = migrate_json_files(args.root, args.keep_json)
+    print(f"Arquivos convertidos: {converted}")
+    for path, error in failed:
+        print(f"  Falha em '{path}': {error}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,521 @@
+"""
+Linguagem de consulta booleana sobre as tags das cenas.
+
+Exemplos:
+    smile AND (cat OR dog) AND NOT night
+    smile>0.7 outdoors duration>=5 category:Anime
+    "hatsune_miku_(vocaloid)" OR category="Minha Pasta"
+
+- AND, OR e NOT (maiúsculas ou minúsculas), parênteses; termos lado a lado valem AND;
+- tag ou tag<op>score (op: > >= < <= =) para exigir o score da tag na cena;
+- duration<op>segundos filtra a duração da cena;
+- category:Nome ou category=Nome filtra pela pasta do vídeo;
+- aspas para tags com espaços, parênteses ou operadores.
+
+A consulta vira um plano: os filhos de cada AND são executados do mais seletivo
+para o menos seletivo (estimativas a partir do número de cenas de cada tag, das
+durações e das categorias do catálogo), as negações viram diferenças no fim e uma
+interseção vazia encerra o AND sem executar o resto. O plano roda no índice em
+memória (listas de cenas por tag de temporal_search.py) ou como SQL
+(INTERSECT/UNION/EXCEPT); explain devolve o plano com as cardinalidades
+estimadas e reais de cada nó.
+"""
+import os
+import re
+import time
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+from .database_service import get_catalog_generation
+from .temporal_search import get_tag_postings
+
+# ==============================================================================
+# SEÇÃO 1: CONFIGURAÇÕES
+# ==============================================================================
+# Motor usado quando a requisição pede 'auto': 'memory' ou 'sql'
+QUERY_ENGINE = os.environ.get("QUERY_ENGINE", "memory")
+# Menor score gravado pelo tagger (limiar das tags gerais): as estimativas de
+# tag>score supõem scores espalhados uniformemente entre ele e 1
+SCORE_FLOOR = 0.35
+
+class QuerySyntaxError(ValueError):
+    """Erro na expressão de busca; 'position' é o caractere onde o problema foi encontrado."""
+    def __init__(self, message, position):
+        super().__init__(f"{message} (posição {position})")
+        self.position = position
+
+# ==============================================================================
+# SEÇÃO 2: ÁRVORE DA CONSULTA E PARSER
+# ==============================================================================
+
+@dataclass
+class QueryNode:
+    """Nó da consulta. kind: 'tag', 'duration', 'category', 'and', 'or' ou 'not'."""
+    kind: str
+    value: Optional[str] = None      # nome da tag ou da categoria
+    op: Optional[str] = None         # comparação de 'tag' e 'duration'
+    number: Optional[float] = None
+    children: List["QueryNode"] = field(default_factory=list)
+
+    def label(self):
+        if self.kind == "tag":
+            return f"tag {self.value}" + (f" {self.op} {self.number:g}" if self.op else "")
+        if self.kind == "duration":
+            return f"duration {self.op} {self.number:g}"
+        if self.kind == "category":
+            return f"category = {self.value}"
+        return self.kind.upper()
+
+_TOKEN = re.compile(r'\s*(?:(?P<paren>[()])|(?P<op>>=|<=|>|<|=)|"(?P<dq>[^"]*)"|\'(?P<sq>[^\']*)\'|(?P<word>[^\s()<>="\']+))')
+_KEYWORDS = {"and", "or", "not"}
+# '=' tolera a diferença de arredondamento dos scores gravados (o SQL usa a mesma tolerância)
+_COMPARATORS = {">": np.greater, ">=": np.greater_equal, "<": np.less, "<=": np.less_equal,
+                "=": lambda values, number: np.abs(values - number) <= 1e-5}
+
+def _tokenize(text):
+    tokens, position = [], 0
+    text = text.rstrip()
+    while position < len(text):
+        match = _TOKEN.match(text, position)
+        if match is None:
+            raise QuerySyntaxError("Aspas sem fechamento", position)
+        kind = match.lastgroup
+        value = match.group(kind)
+        start = match.start(kind) - (1 if kind in ("dq", "sq") else 0)
+        if kind == "word" and value.lower() in _KEYWORDS:
+            tokens.append(("keyword", value.lower(), start))
+        else:
+            tokens.append(("quoted" if kind in ("dq", "sq") else kind, value, start))
+        position = match.end()
+    return tokens
+
+class _Parser:
+    def __init__(self, text):
+        self.tokens = _tokenize(text)
+        self.index = 0
+        self.length = len(text)
+
+    def peek(self):
+        return self.tokens[self.index] if self.index < len(self.tokens) else (None, None, self.length)
+
+    def take(self):
+        token = self.peek()
+        self.index += 1
+        return token
+
+    def parse(self):
+        if not self.tokens:
+            raise QuerySyntaxError("Consulta vazia", 0)
+        node = self.parse_or()
+        kind, value, position = self.peek()
+        if kind is not None:
+            raise QuerySyntaxError(f"'{value}' inesperado", position)
+        return node
+
+    def parse_or(self):
+        children = [self.parse_and()]
+        while self.peek()[:2] == ("keyword", "or"):
+            self.take()
+            children.append(self.parse_and())
+        return children[0] if len(children) == 1 else QueryNode("or", children=children)
+
+    def parse_and(self):
+        children = [self.parse_not()]
+        while True:
+            kind, value, _ = self.peek()
+            if (kind, value) == ("keyword", "and"):
+                self.take()
+            elif kind in (None, "op") or (kind, value) in (("paren", ")"), ("keyword", "or")):
+                break
+            children.append(self.parse_not())
+        return children[0] if len(children) == 1 else QueryNode("and", children=children)
+
+    def parse_not(self):
+        if self.peek()[:2] == ("keyword", "not"):
+            self.take()
+            return QueryNode("not", children=[self.parse_not()])
+        return self.parse_primary()
+
+    def parse_primary(self):
+        kind, value, position = self.take()
+        if (kind, value) == ("paren", "("):
+            node = self.parse_or()
+            if self.take()[:2] != ("paren", ")"):
+                raise QuerySyntaxError("Falta fechar o parêntese", position)
+            return node
+        if kind not in ("word", "quoted"):
+            raise QuerySyntaxError("Esperava uma tag, 'duration' ou 'category'" if kind else "Consulta incompleta", position)
+
+        if kind == "word" and value.lower().startswith("category:") and len(value) > len("category:"):
+            return QueryNode("category", value=value[len("category:"):])
+        op = self.peek()[1] if self.peek()[0] == "op" else None
+        if op is not None:
+            self.take()
+        if kind == "word" and value.lower() == "category":
+            target_kind, target, target_position = self.take()
+            if op != "=" or target_kind not in ("word", "quoted"):
+                raise QuerySyntaxError("Use category:Nome ou category=Nome", target_position)
+            return QueryNode("category", value=target)
+        if op is None:
+            if kind == "word" and value.lower() == "duration":
+                raise QuerySyntaxError("duration precisa de uma comparação (ex.: duration>=5)", position)
+            return QueryNode("tag", value=value.replace(' ', '_'))
+
+        number_kind, number, number_position = self.take()
+        try:
+            number = float(number) if number_kind == "word" else None
+        except ValueError:
+            number = None
+        if number is None:
+            raise QuerySyntaxError("Esperava um número depois do operador", number_position)
+        if kind == "word" and value.lower() == "duration":
+            return QueryNode("duration", op=op, number=number)
+        if not 0.0 <= number <= 1.0:
+            raise QuerySyntaxError("O score de uma tag fica entre 0 e 1", number_position)
+        return QueryNode("tag", value=value.replace(' ', '_'), op=op, number=number)
+
+def parse_query(text):
+    """Converte a expressão em uma árvore de QueryNode (QuerySyntaxError se inválida)."""
+    return _Parser(text).parse()
+
+# ==============================================================================
+# SEÇÃO 3: ESTATÍSTICAS DO CATÁLOGO E PLANEJADOR
+# ==============================================================================
+
+class CatalogIndex:
+    """
+    Todas as cenas em ordem de scene_id (vídeo, duração e categoria de cada uma),
+    carregadas uma vez por geração do catálogo. Serve de universo para o NOT, de
+    filtro de duração/categoria e de base para as estimativas.
+    """
+    def __init__(self, conn, generation):
+        self.generation = generation
+        rows = conn.execute("SELECT scene_id, video_id, duration FROM scenes ORDER BY scene_id").fetchall()
+        columns = np.array(rows, dtype=np.float64).reshape(-1, 3)
+        self.scene_ids = columns[:, 0].astype(np.int64)
+        self.video_ids = columns[:, 1].astype(np.int64)
+        self.durations = columns[:, 2]
+        self.sorted_durations = np.sort(self.durations)
+
+        videos = conn.execute("SELECT video_id, category FROM videos ORDER BY video_id").fetchall()
+        video_table = np.array([row[0] for row in videos], dtype=np.int64)
+        self.categories = sorted({row[1] for row in videos if row[1] is not None})
+        codes = {name: i for i, name in enumerate(self.categories)}
+        video_codes = np.array([codes.get(row[1], -1) for row in videos], dtype=np.int64)
+        if len(video_table):
+            position = np.minimum(np.searchsorted(video_table, self.video_ids), len(video_table) - 1)
+            self.scene_categories = np.where(video_table[position] == self.video_ids, video_codes[position], -1)
+        else:
+            self.scene_categories = np.full(len(self.scene_ids), -1, dtype=np.int64)
+        self.category_counts = np.bincount(self.scene_categories[self.scene_categories >= 0], minlength=len(self.categories))
+        self._tag_counts = {}
+        self._lock = threading.Lock()
+
+    @property
+    def total(self):
+        return len(self.scene_ids)
+
+    def tag_count(self, conn, tag):
+        """Cenas com a tag (contagem pelo índice idx_scene_tags_tag, guardada por geração)."""
+        with self._lock:
+            if tag in self._tag_counts:
+                return self._tag_counts[tag]
+        count = conn.execute("SELECT COUNT(*) FROM scene_tags WHERE tag_id = (SELECT tag_id FROM tags WHERE tag_name = ?)",
+                             (tag,)).fetchone()[0]
+        with self._lock:
+            self._tag_counts[tag] = count
+        return count
+
+    def duration_count(self, op, number):
+        durations = self.sorted_durations
+        if op == ">":
+            return len(durations) - np.searchsorted(durations, number, side='right')
+        if op == ">=":
+            return len(durations) - np.searchsorted(durations, number, side='left')
+        if op == "<":
+            return np.searchsorted(durations, number, side='left')
+        if op == "<=":
+            return np.searchsorted(durations, number, side='right')
+        return np.searchsorted(durations, number, side='right') - np.searchsorted(durations, number, side='left')
+
+    def category_code(self, name):
+        try:
+            return self.categories.index(name)
+        except ValueError:
+            return -1
+
+_index_lock = threading.Lock()
+_catalog_index = {"generation": None, "index": None}
+
+def get_catalog_index(conn, generation=None):
+    generation = generation or get_catalog_generation(conn)
+    with _index_lock:
+        if _catalog_index["generation"] != generation:
+            _catalog_index.update(generation=generation, index=CatalogIndex(conn, generation))
+        return _catalog_index["index"]
+
+def _score_fraction(op, number):
+    """Fração das cenas de uma tag com score <op> number, supondo scores uniformes em [SCORE_FLOOR, 1]."""
+    above = min(max((1.0 - number) / (1.0 - SCORE_FLOOR), 0.0), 1.0)
+    if op in (">", ">="):
+        return above
+    if op in ("<", "<="):
+        return 1.0 - above
+    return 0.01
+
+@dataclass
+class PlanNode:
+    """Nó do plano: a consulta com a estimativa; 'exact' se a estimativa é a cardinalidade real."""
+    query: QueryNode
+    estimated: float
+    exact: bool = False
+    children: List["PlanNode"] = field(default_factory=list)
+    actual: Optional[int] = None
+    skipped: bool = False
+
+    def to_dict(self):
+        data = {"op": self.query.label(), "estimated": int(round(self.estimated)), "actual": self.actual}
+        if self.skipped:
+            data["skipped"] = True
+        if self.children:
+            data["children"] = [child.to_dict() for child in self.children]
+        return data
+
+def plan_query(conn, node, index):
+    """
+    Estima a cardinalidade de cada nó e ordena os filhos: AND do mais seletivo ao
+    menos seletivo (negações por último, a maior primeiro) e OR do maior ao menor.
+    Um AND com um filho certamente vazio (ex.: tag inexistente) fica com estimativa 0 exata;
+    um AND sem filhos (busca sem filtros) seleciona todas as cenas, como na /search.
+    """
+    total = max(index.total, 1)
+    if node.kind == "tag":
+        count = index.tag_count(conn, node.value)
+        if node.op is None or count == 0:
+            return PlanNode(node, count, exact=True)
+        return PlanNode(node, count * _score_fraction(node.op, node.number))
+    if node.kind == "duration":
+        return PlanNode(node, index.duration_count(node.op, node.number), exact=True)
+    if node.kind == "category":
+        code = index.category_code(node.value)
+        return PlanNode(node, int(index.category_counts[code]) if code >= 0 else 0, exact=True)
+
+    children = [plan_query(conn, child, index) for child in node.children]
+    if node.kind == "not":
+        child = children[0]
+        return PlanNode(node, index.total - child.estimated, exact=child.exact, children=children)
+    if node.kind == "or":
+        children.sort(key=lambda child: -child.estimated)
+        remaining = np.prod([1.0 - child.estimated / total for child in children])
+        return PlanNode(node, total * (1.0 - remaining), exact=len(children) == 1 and children[0].exact, children=children)
+
+    if not children:
+        return PlanNode(node, index.total, exact=True)
+    positives = sorted((child for child in children if child.query.kind != "not"), key=lambda child: child.estimated)
+    negatives = sorted((child for child in children if child.query.kind == "not"), key=lambda child: child.estimated)
+    if any(child.exact and child.estimated == 0 for child in children):
+        return PlanNode(node, 0, exact=True, children=positives + negatives)
+    estimate = total * np.prod([child.estimated / total for child in children])
+    return PlanNode(node, estimate, children=positives + negatives)
+
+# ==============================================================================
+# SEÇÃO 4: EXECUÇÃO NO ÍNDICE EM MEMÓRIA
+# ==============================================================================
+
+def _tag_scene_ids(conn, node, generation):
+    postings = get_tag_postings(conn, node.value, generation)
+    scene_ids, scores = postings.scene_ids, postings.scores
+    if node.op is not None:
+        keep = _COMPARATORS[node.op](scores, node.number)
+        scene_ids = scene_ids[keep]
+    return np.sort(scene_ids)
+
+def _filter_candidates(plan, candidates, index):
+    """Duração e categoria filtram direto as cenas candidatas (sem materializar o predicado)."""
+    positions = np.searchsorted(index.scene_ids, candidates)
+    query = plan.query
+    if query.kind == "duration":
+        keep = _COMPARATORS[query.op](index.durations[positions], query.number)
+    else:
+        keep = index.scene_categories[positions] == index.category_code(query.value)
+    return candidates[keep]
+
+def execute_memory(conn, plan, index, generation):
+    """Executa o plano com arrays ordenados de scene_id; preenche 'actual' de cada nó."""
+    query = plan.query
+    if plan.exact and plan.estimated == 0:
+        result = np.zeros(0, dtype=np.int64)
+        for child in plan.children:
+            child.skipped = True
+    elif query.kind == "tag":
+        result = _tag_scene_ids(conn, query, generation)
+    elif query.kind in ("duration", "category"):
+        result = _filter_candidates(plan, index.scene_ids, index)
+    elif query.kind == "not":
+        result = np.setdiff1d(index.scene_ids, execute_memory(conn, plan.children[0], index, generation), assume_unique=True)
+    elif query.kind == "or":
+        result = np.zeros(0, dtype=np.int64)
+        for child in plan.children:
+            result = np.union1d(result, execute_memory(conn, child, index, generation))
+    else:
+        result = None
+        for child in plan.children:
+            if result is not None and len(result) == 0:
+                child.skipped = True
+                continue
+            if result is None:
+                result = execute_memory(conn, child, index, generation) if child.query.kind != "not" else \
+                    np.setdiff1d(index.scene_ids, execute_memory(conn, child.children[0], index, generation), assume_unique=True)
+                child.actual = int(len(result))
+            elif child.query.kind in ("duration", "category"):
+                result = _filter_candidates(child, result, index)
+                child.actual = None
+            elif child.query.kind == "not":
+                excluded = execute_memory(conn, child.children[0], index, generation)
+                result = np.setdiff1d(result, excluded, assume_unique=True)
+                child.actual = int(index.total - len(excluded))
+            else:
+                result = np.intersect1d(result, execute_memory(conn, child, index, generation), assume_unique=True)
+        if result is None:
+            result = index.scene_ids
+    plan.actual = int(len(result))
+    return result
+
+# ==============================================================================
+# SEÇÃO 5: EXECUÇÃO EM SQL
+# ==============================================================================
+
+def compile_sql(plan):
+    """SQL (com parâmetros) que seleciona os scene_ids do plano, na ordem escolhida pelo planejador."""
+    query = plan.query
+    if plan.exact and plan.estimated == 0:
+        return "SELECT scene_id FROM scenes WHERE 0", []
+    if query.kind == "tag":
+        sql = "SELECT st.scene_id FROM scene_tags st JOIN tags t ON t.tag_id = st.tag_id WHERE t.tag_name = ?"
+        if query.op is None:
+            return sql, [query.value]
+        if query.op == "=":
+            return sql + " AND abs(st.score - ?) <= 1e-5", [query.value, query.number]
+        return sql + f" AND st.score {query.op} ?", [query.value, query.number]
+    if query.kind == "duration":
+        return f"SELECT scene_id FROM scenes WHERE duration {query.op} ?", [query.number]
+    if query.kind == "category":
+        return "SELECT s.scene_id FROM scenes s JOIN videos v ON v.video_id = s.video_id WHERE v.category = ?", [query.value]
+    if query.kind == "not":
+        sql, params = compile_sql(plan.children[0])
+        return f"SELECT scene_id FROM scenes EXCEPT SELECT * FROM ({sql})", params
+
+    if not plan.children:
+        return "SELECT scene_id FROM scenes", []
+
+    parts, params = [], []
+    for child in plan.children:
+        target = child.children[0] if query.kind == "and" and child.query.kind == "not" else child
+        sql, child_params = compile_sql(target)
+        operator = "UNION" if query.kind == "or" else ("EXCEPT" if target is not child else "INTERSECT")
+        parts.append((operator, f"SELECT * FROM ({sql})"))
+        params.extend(child_params)
+    if query.kind == "and" and parts[0][0] == "EXCEPT":
+        # Só negações: parte de todas as cenas
+        parts.insert(0, ("INTERSECT", "SELECT scene_id FROM scenes"))
+    sql = parts[0][1] + "".join(f" {operator} {part}" for operator, part in parts[1:])
+    return sql, params
+
+def count_sql_actuals(conn, plan):
+    """Cardinalidade real de cada nó (só para o explain do motor SQL)."""
+    sql, params = compile_sql(plan)
+    plan.actual = conn.execute(f"SELECT COUNT(*) FROM ({sql})", params).fetchone()[0]
+    for child in plan.children:
+        count_sql_actuals(conn, child)
+
+# ==============================================================================
+# SEÇÃO 6: BUSCA COMPLETA
+# ==============================================================================
+
+def request_query(request):
+    """Árvore da busca: a expressão 'query' com AND dos filtros simples da SearchRequest."""
+    terms = [parse_query(request.query)] if request.query else []
+    terms += [QueryNode("tag", value=tag) for tag in request.include_tags or []]
+    terms += [QueryNode("not", children=[QueryNode("tag", value=tag)]) for tag in request.exclude_tags or []]
+    if request.min_duration:
+        terms.append(QueryNode("duration", op=">=", number=request.min_duration))
+    if request.max_duration:
+        terms.append(QueryNode("duration", op="<=", number=request.max_duration))
+    return terms[0] if len(terms) == 1 else QueryNode("and", children=terms)
+
+def _video_results(video_rows, scene_rows):
+    scenes_by_video = {}
+    for scene_id, video_id, start_time, end_time in scene_rows:
+        scenes_by_video.setdefault(video_id, []).append({"scene_id": scene_id, "start_time": start_time, "end_time": end_time})
+    results = []
+    for video_id, video_name, file_path in video_rows:
+        path_obj = Path(file_path)
+        results.append({"video_id": video_id, "video_name": video_name, "file_path": file_path,
+                        "matching_scenes": sorted(scenes_by_video.get(video_id, []), key=lambda scene: scene["start_time"]),
+                        "filename": path_obj.name, "folder": path_obj.parent.name, "has_scenes_json": True})
+    return results
+
+def query_search(conn, request):
+    """
+    Executa a busca por expressão. Mesmo formato de resposta da /search (vídeos com
+    mais cenas encontradas primeiro); com request.explain inclui o plano.
+    """
+    started = time.perf_counter()
+    node = request_query(request)
+    generation = get_catalog_generation(conn)
+    index = get_catalog_index(conn, generation)
+    plan = plan_query(conn, node, index)
+    engine = QUERY_ENGINE if request.engine == "auto" else request.engine
+    offset = (request.page - 1) * request.limit
+
+    if engine == "memory":
+        scene_ids = execute_memory(conn, plan, index, generation)
+        video_ids = index.video_ids[np.searchsorted(index.scene_ids, scene_ids)]
+        unique_videos, counts = np.unique(video_ids, return_counts=True)
+        page_videos = [int(v) for v in unique_videos[np.argsort(-counts, kind='stable')][offset:offset + request.limit]]
+        total_videos = len(unique_videos)
+        results = []
+        if page_videos:
+            placeholders = ", ".join("?" for _ in page_videos)
+            video_info = {row[0]: row for row in conn.execute(
+                f"SELECT video_id, video_name, file_path FROM videos WHERE video_id IN ({placeholders})", page_videos)}
+            matched = set(scene_ids[np.isin(video_ids, page_videos)].tolist())
+            scene_rows = [row for row in conn.execute(
+                f"SELECT scene_id, video_id, start_time, end_time FROM scenes WHERE video_id IN ({placeholders})", page_videos)
+                if row[0] in matched]
+            results = _video_results([video_info[v] for v in page_videos if v in video_info], scene_rows)
+    else:
+        sql, params = compile_sql(plan)
+        conn.execute("DROP TABLE IF EXISTS temp.query_matches")
+        conn.execute(f"CREATE TEMP TABLE query_matches AS {sql}", params)
+        try:
+            total_videos = conn.execute("SELECT COUNT(DISTINCT s.video_id) FROM scenes s JOIN temp.query_matches m ON m.scene_id = s.scene_id").fetchone()[0]
+            video_rows = conn.execute("""
+                SELECT v.video_id, v.video_name, v.file_path FROM temp.query_matches m
+                JOIN scenes s ON s.scene_id = m.scene_id JOIN videos v ON v.video_id = s.video_id
+                GROUP BY v.video_id ORDER BY COUNT(*) DESC LIMIT ? OFFSET ?""", (request.limit, offset)).fetchall()
+            page_videos = [row[0] for row in video_rows]
+            scene_rows = []
+            if page_videos:
+                placeholders = ", ".join("?" for _ in page_videos)
+                scene_rows = conn.execute(f"""SELECT s.scene_id, s.video_id, s.start_time, s.end_time FROM temp.query_matches m
+                                              JOIN scenes s ON s.scene_id = m.scene_id WHERE s.video_id IN ({placeholders})""",
+                                          page_videos).fetchall()
+            results = _video_results([tuple(row) for row in video_rows], scene_rows)
+            if request.explain:
+                count_sql_actuals(conn, plan)
+        finally:
+            conn.execute("DROP TABLE IF EXISTS temp.query_matches")
+
+    response = {"total_videos": int(total_videos), "results": results}
+    if request.explain:
+        explain = {"engine": engine, "catalog_scenes": index.total, "plan": plan.to_dict(),
+                   "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)}
+        if engine == "sql":
+            explain["sql"] = compile_sql(plan)[0]
+        response["explain"] = explain
+    return response
@@ -0,0 +1,279 @@
+"""
+Consultas temporais sobre o catálogo de cenas:
+
+- sequence:     cenas com as tags do passo 1 seguidas, em até max_gap segundos,
+                por uma cena com as tags do passo 2 (e assim por diante);
+- cooccurrence: cenas com as tags do passo 1 que têm, a até max_gap segundos
+                (antes, depois ou na mesma cena), cenas com as tags de cada outro passo;
+- coverage:     vídeos em que as cenas com as tags do passo 1 somam pelo menos
+                min_total_seconds.
+
+Cada tag tem uma lista de cenas ordenada por (vídeo, início), lida do banco uma
+vez por geração do catálogo. Vídeo e instante viram uma única chave numérica
+(video_id * span + t), então "a próxima cena da tag B depois do fim desta cena,
+no mesmo vídeo" é uma busca binária (merge-join) e não um self-join no SQL.
+Como as cenas de um vídeo não se sobrepõem, os fins também ficam ordenados, e a
+mesma lista serve de índice de intervalos.
+"""
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+from .database_service import get_catalog_generation
+
+# ==============================================================================
+# SEÇÃO 1: CONFIGURAÇÕES
+# ==============================================================================
+# Listas de cenas por tag mantidas em memória (as mais usadas recentemente)
+POSTINGS_CACHE_SIZE = int(os.environ.get("TEMPORAL_CACHE_SIZE", 256))
+# Limites de cenas consecutivas são gravados arredondados em milissegundos
+BOUNDARY_TOLERANCE = 1e-3
+
+_postings_cache = OrderedDict()
+_postings_lock = threading.Lock()
+
+# ==============================================================================
+# SEÇÃO 2: LISTAS DE CENAS POR TAG
+# ==============================================================================
+
+class ScenePostings:
+    """Cenas que têm uma tag (ou um conjunto de tags), em ordem de (video_id, start_time)."""
+    def __init__(self, video_ids, starts, ends, scene_ids, scores):
+        self.video_ids = video_ids
+        self.starts = starts
+        self.ends = ends
+        self.scene_ids = scene_ids
+        self.scores = scores
+
+    def __len__(self):
+        return len(self.scene_ids)
+
+    def take(self, mask_or_index):
+        return ScenePostings(self.video_ids[mask_or_index], self.starts[mask_or_index], self.ends[mask_or_index],
+                             self.scene_ids[mask_or_index], self.scores[mask_or_index])
+
+def _load_postings(conn, tag_name):
+    rows = conn.execute("""
+        SELECT s.video_id, s.start_time, s.end_time, s.scene_id, st.score
+        FROM tags t
+        JOIN scene_tags st ON st.tag_id = t.tag_id
+        JOIN scenes s ON s.scene_id = st.scene_id
+        WHERE t.tag_name = ?
+        ORDER BY s.video_id, s.start_time
+    """, (tag_name,)).fetchall()
+    columns = np.array(rows, dtype=np.float64).reshape(-1, 5)
+    return ScenePostings(columns[:, 0].astype(np.int64), columns[:, 1], columns[:, 2],
+                         columns[:, 3].astype(np.int64), columns[:, 4])
+
+def get_tag_postings(conn, tag_name, generation=None):
+    """Lista de cenas da tag, reaproveitada enquanto a geração do catálogo não mudar."""
+    key = (generation or get_catalog_generation(conn), tag_name)
+    with _postings_lock:
+        if key in _postings_cache:
+            _postings_cache.move_to_end(key)
+            return _postings_cache[key]
+    postings = _load_postings(conn, tag_name)
+    with _postings_lock:
+        _postings_cache[key] = postings
+        while len(_postings_cache) > POSTINGS_CACHE_SIZE:
+            _postings_cache.popitem(last=False)
+    return postings
+
+def step_postings(conn, generation, tags, min_score=0.0):
+    """Cenas que têm todas as tags do passo, cada uma com score >= min_score."""
+    lists = [get_tag_postings(conn, tag, generation) for tag in tags]
+    lists = [p.take(p.scores >= min_score) if min_score > 0 else p for p in lists]
+    result = min(lists, key=len)
+    for other in lists:
+        if other is not result and len(result):
+            result = result.take(np.isin(result.scene_ids, other.scene_ids, assume_unique=True))
+    return result
+
+# ==============================================================================
+# SEÇÃO 3: JUNÇÕES TEMPORAIS
+# ==============================================================================
+
+def _span(postings_list, window):
+    """Espaço reservado a cada vídeo na chave numérica: maior instante + janela + folga."""
+    return max((float(p.ends.max()) for p in postings_list if len(p)), default=0.0) + window + 1.0
+
+def _next_window(postings, video_ids, ends, max_gap, span):
+    """Para cada fim (vídeo, instante), a faixa [lo, hi) de 'postings' que começa até max_gap segundos depois."""
+    start_keys = postings.video_ids * span + postings.starts
+    anchor_keys = video_ids * span + ends
+    lo = np.searchsorted(start_keys, anchor_keys - BOUNDARY_TOLERANCE, side='left')
+    hi = np.searchsorted(start_keys, anchor_keys + max_gap, side='right')
+    return lo, hi
+
+def _chainable(postings_list, max_gap, span):
+    """
+    Passada de trás para frente: mantém em cada passo só as cenas de onde ainda
+    se chega ao último passo (há cena mantida do passo seguinte dentro da janela).
+    """
+    kept = [postings_list[-1]]
+    for postings in reversed(postings_list[:-1]):
+        lo, hi = _next_window(kept[0], postings.video_ids, postings.ends, max_gap, span)
+        kept.insert(0, postings.take(lo < hi))
+    return kept
+
+def match_sequence(postings_list, max_gap):
+    """
+    Para cada cena do primeiro passo, encadeia a cena mais próxima de cada passo
+    seguinte que começa depois do fim da anterior, com no máximo max_gap segundos
+    de intervalo. Só contam as cenas que completam a cadeia até o último passo
+    (ver _chainable), então uma cena mais próxima sem continuação não esconde uma
+    mais distante que continua. Se várias cenas iniciais levam à mesma cena final,
+    fica só a mais próxima dela (a faixa mais curta).
+    Retorna (video_ids, starts, ends, scene_ids [n x passos]).
+    """
+    span = _span(postings_list, max_gap)
+    postings_list = _chainable(postings_list, max_gap, span)
+    first = postings_list[0]
+    video_ids, range_starts, last_ends = first.video_ids, first.starts, first.ends
+    path = [first.scene_ids]
+    for postings in postings_list[1:]:
+        lo, hi = _next_window(postings, video_ids, last_ends, max_gap, span)
+        found = lo < hi
+        chosen = lo[found]
+        video_ids, range_starts = video_ids[found], range_starts[found]
+        path = [ids[found] for ids in path] + [postings.scene_ids[chosen]]
+        last_ends = postings.ends[chosen]
+
+    scene_ids = np.stack(path, axis=1) if path else np.empty((0, 0), dtype=np.int64)
+    if len(postings_list) > 1 and len(scene_ids):
+        # As cenas iniciais estão em ordem: a última de cada cena final é a mais próxima
+        _, last_index = np.unique(scene_ids[::-1, -1], return_index=True)
+        keep = np.sort(len(scene_ids) - 1 - last_index)
+        video_ids, range_starts, last_ends, scene_ids = video_ids[keep], range_starts[keep], last_ends[keep], scene_ids[keep]
+    return video_ids, range_starts, last_ends, scene_ids
+
+def match_cooccurrence(postings_list, window):
+    """
+    Cenas do primeiro passo com alguma cena de cada outro passo a até 'window'
+    segundos (intervalos que se tocam ou se sobrepõem contam como distância zero).
+    A faixa vai do início da primeira ao fim da última cena envolvida.
+    """
+    span = _span(postings_list, window)
+    first = postings_list[0]
+    video_ids, anchor_starts, anchor_ends = first.video_ids, first.starts, first.ends
+    range_starts, range_ends = anchor_starts, anchor_ends
+    path = [first.scene_ids]
+    for postings in postings_list[1:]:
+        start_keys = postings.video_ids * span + postings.starts
+        end_keys = postings.video_ids * span + postings.ends
+        base = video_ids * span
+        # Há cena próxima se a primeira que termina depois de (início - janela)
+        # começa antes de (fim + janela)
+        lo = np.searchsorted(end_keys, base + anchor_starts - window - BOUNDARY_TOLERANCE, side='left')
+        hi = np.searchsorted(start_keys, base + anchor_ends + window + BOUNDARY_TOLERANCE, side='right')
+        found = lo < hi
+        chosen = lo[found]
+        video_ids, anchor_starts, anchor_ends = video_ids[found], anchor_starts[found], anchor_ends[found]
+        range_starts = np.minimum(range_starts[found], postings.starts[chosen])
+        range_ends = np.maximum(range_ends[found], postings.ends[chosen])
+        path = [ids[found] for ids in path] + [postings.scene_ids[chosen]]
+    return video_ids, range_starts, range_ends, np.stack(path, axis=1)
+
+def merge_ranges(video_ids, starts, ends, gap):
+    """
+    Agrupa faixas do mesmo vídeo que se sobrepõem ou distam até 'gap' segundos.
+    As faixas devem estar ordenadas por (vídeo, início). Retorna o grupo de cada faixa.
+    """
+    if len(video_ids) == 0:
+        return np.empty(0, dtype=np.int64)
+    span = float(ends.max()) + gap + 1.0
+    start_keys = video_ids * span + starts
+    reach = np.maximum.accumulate(video_ids * span + ends)
+    new_group = np.ones(len(video_ids), dtype=bool)
+    new_group[1:] = start_keys[1:] > reach[:-1] + gap + BOUNDARY_TOLERANCE
+    return np.cumsum(new_group) - 1
+
+# ==============================================================================
+# SEÇÃO 4: CONSULTA COMPLETA
+# ==============================================================================
+
+def _video_rows(conn, video_ids):
+    placeholders = ", ".join("?" for _ in video_ids)
+    rows = conn.execute(f"SELECT video_id, video_name, file_path FROM videos WHERE video_id IN ({placeholders})",
+                        [int(v) for v in video_ids]).fetchall()
+    return {row[0]: row for row in rows}
+
+def temporal_search(conn, request):
+    """
+    Executa uma TemporalSearchRequest e retorna, por vídeo, as faixas de tempo
+    encontradas no formato de matching_scenes da /search (scene_id da primeira
+    cena, start_time e end_time), mais os ids de todas as cenas de cada faixa.
+    """
+    generation = get_catalog_generation(conn)
+    postings_list = [step_postings(conn, generation, step.tags, step.min_score) for step in request.steps]
+
+    if request.mode == "sequence":
+        video_ids, starts, ends, scene_ids = match_sequence(postings_list, request.max_gap)
+        groups = np.arange(len(video_ids))
+    elif request.mode == "cooccurrence":
+        video_ids, starts, ends, scene_ids = match_cooccurrence(postings_list, request.max_gap)
+        # A faixa pode começar antes da cena inicial: reordena antes de juntar as sobrepostas
+        order = np.lexsort((starts, video_ids))
+        video_ids, starts, ends, scene_ids = video_ids[order], starts[order], ends[order], scene_ids[order]
+        groups = merge_ranges(video_ids, starts, ends, 0.0)
+    else:
+        postings = postings_list[0]
+        video_ids, starts, ends = postings.video_ids, postings.starts, postings.ends
+        scene_ids = postings.scene_ids[:, None]
+        groups = merge_ranges(video_ids, starts, ends, request.merge_gap)
+
+    # Uma faixa por grupo (faixas agrupadas viram uma só)
+    n_groups = int(groups.max()) + 1 if len(groups) else 0
+    group_videos = np.zeros(n_groups, dtype=np.int64)
+    group_videos[groups] = video_ids
+    group_starts = np.full(n_groups, np.inf)
+    np.minimum.at(group_starts, groups, starts)
+    group_ends = np.full(n_groups, -np.inf)
+    np.maximum.at(group_ends, groups, ends)
+
+    # Ordem dos vídeos: mais faixas (ou mais tempo coberto, em 'coverage') primeiro
+    unique_videos, group_video_index = np.unique(group_videos, return_inverse=True)
+    range_counts = np.bincount(group_video_index, minlength=len(unique_videos))
+    if request.mode == "coverage":
+        # Cenas de um vídeo não se sobrepõem: o tempo coberto é a soma das durações
+        scene_video_index = np.searchsorted(unique_videos, video_ids)
+        covered = np.bincount(scene_video_index, weights=ends - starts, minlength=len(unique_videos))
+        eligible = covered >= request.min_total_seconds
+        order = np.argsort(-covered, kind='stable')
+    else:
+        covered = np.bincount(group_video_index, weights=group_ends - group_starts, minlength=len(unique_videos))
+        eligible = np.ones(len(unique_videos), dtype=bool)
+        order = np.argsort(-range_counts, kind='stable')
+    order = order[eligible[order]]
+
+    offset = (request.page - 1) * request.limit
+    page_videos = order[offset:offset + request.limit]
+    video_info = _video_rows(conn, unique_videos[page_videos]) if len(page_videos) else {}
+
+    results = []
+    for index in page_videos:
+        video_id = int(unique_videos[index])
+        video_groups = np.flatnonzero(group_video_index == index)
+        member_rows = np.isin(groups, video_groups)
+        ids_by_group = {}
+        for group, ids in zip(groups[member_rows], scene_ids[member_rows]):
+            ids_by_group.setdefault(int(group), set()).update(int(i) for i in ids)
+        ranges = []
+        for group in video_groups:
+            ids = sorted(ids_by_group[int(group)])
+            ranges.append({"scene_id": ids[0], "scene_ids": ids, "start_time": round(float(group_starts[group]), 3),
+                           "end_time": round(float(group_ends[group]), 3)})
+        ranges.sort(key=lambda r: r["start_time"])
+
+        row = video_info.get(video_id)
+        if row is None:
+            continue
+        path_obj = Path(row[2])
+        results.append({"video_id": video_id, "video_name": row[1], "file_path": row[2],
+                        "filename": path_obj.name, "folder": path_obj.parent.name, "has_scenes_json": True,
+                        "total_seconds": round(float(covered[index]), 3), "matching_scenes": ranges})
+
+    return {"mode": request.mode, "total_videos": int(len(order)), "results": results}
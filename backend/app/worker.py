@@ -0,0 +1,283 @@
+"""
+Worker de tagging distribuído: pega jobs da fila do servidor por HTTP, faz a
+extração de frames e o tagging localmente e envia as tags por frame (.npz
+compacto) de volta. A segmentação, o arquivo de cenas e o banco ficam no servidor.
+
+O vídeo é lido direto do disco quando o worker enxerga o mesmo caminho (ou a
+mesma pasta de vídeos via --shared-root); senão é baixado pelo /api/stream.
+
+Uso (a partir da pasta 'backend'):
+    PROCESSING_MODE=workers uvicorn app.main:app --host 0.0.0.0     # servidor
+    python -m app.worker --server http://servidor:8000 --name gpu-1
+    python -m app.worker --server http://localhost:8000 --shared-root videos --sessions 1 --threads 2
+
+Vários workers podem rodar na mesma máquina (cada um tem sua pasta temporária);
+use --sessions/--threads para que não disputem os mesmos núcleos.
+"""
+import os
+import time
+import shutil
+import socket
+import asyncio
+import argparse
+import tempfile
+import threading
+from pathlib import Path
+
+import httpx
+
+from app.services.inference_pool import auto_config, available_providers
+from app.services.job_metrics import JobMetrics
+from app.services.processing_service import acquire_predictor, extrair_frames, release_predictor, tag_extracted_frames
+from app.services.scene_detection import FrameTagMatrix
+from app.services.scene_store import encode_frame_results
+
+# ==============================================================================
+# SEÇÃO 1: CONFIGURAÇÕES
+# ==============================================================================
+DEFAULT_SERVER = os.environ.get("SCENES_SERVER", "http://localhost:8000")
+POLL_INTERVAL = 2.0
+# Intervalo mínimo entre dois envios de progresso (além dos heartbeats periódicos)
+MIN_PROGRESS_INTERVAL = 1.0
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+UPLOAD_TIMEOUT = 600
+
+class LeaseLost(Exception):
+    """O servidor entregou o job a outro worker (ou o encerrou); o trabalho local é descartado."""
+
+# ==============================================================================
+# SEÇÃO 2: HEARTBEAT
+# ==============================================================================
+
+class Heartbeat(threading.Thread):
+    """
+    Renova o lease do job a cada 'interval' segundos e envia o progresso mais
+    recente (no máximo um envio por MIN_PROGRESS_INTERVAL). Se o servidor recusar
+    (409/404), marca 'lost' para o job ser abandonado.
+    """
+    def __init__(self, client, worker_id, job_id, interval):
+        super().__init__(daemon=True, name=f"heartbeat-{job_id[:8]}")
+        self.client = client
+        self.url = f"/api/workers/{worker_id}/jobs/{job_id}/heartbeat"
+        self.interval = interval
+        self.progress = {"stage": "STARTING", "progress": 1, "message": "Preparando o job no worker..."}
+        self.lost = threading.Event()
+        self._changed = threading.Event()
+        self._stopped = threading.Event()
+
+    def update(self, stage, progress, message):
+        self.progress = {"stage": stage, "progress": progress, "message": message}
+        self._changed.set()
+
+    def renew_only(self):
+        """Daqui em diante só renova o lease: o progresso passa a ser publicado pelo servidor."""
+        self.progress = {}
+        self._changed.set()
+
+    def check(self):
+        if self.lost.is_set():
+            raise LeaseLost()
+
+    def run(self):
+        while not self._stopped.is_set():
+            self._changed.wait(self.interval)
+            self._changed.clear()
+            if self._stopped.is_set():
+                break
+            try:
+                response = self.client.post(self.url, json=self.progress)
+                if response.status_code in (404, 409):
+                    self.lost.set()
+                    return
+            except httpx.HTTPError as e:
+                # Falha de rede passageira: o lease ainda vale até expirar
+                print(f"Aviso: heartbeat falhou: {e}")
+            self._stopped.wait(MIN_PROGRESS_INTERVAL)
+
+    def stop(self):
+        self._stopped.set()
+        self._changed.set()
+
+# ==============================================================================
+# SEÇÃO 3: WORKER
+# ==============================================================================
+
+class Worker:
+    def __init__(self, client, name, shared_root=None, inference_config=None, work_dir=None):
+        self.client = client
+        self.name = name
+        self.shared_root = Path(shared_root) if shared_root else None
+        self.inference_config = inference_config
+        self.work_dir = work_dir
+        self.worker_id = None
+        self.heartbeat_seconds = 20.0
+
+    def register(self):
+        config = self.inference_config
+        info = {"pid": os.getpid(), "providers": available_providers(),
+                "sessions": config.sessions if config else None, "threads": config.intra_op_threads if config else None}
+        response = self.client.post("/api/workers/register", json={"name": self.name, "host": socket.gethostname(), "info": info})
+        response.raise_for_status()
+        data = response.json()
+        self.worker_id = data["worker_id"]
+        self.heartbeat_seconds = data["heartbeat_seconds"]
+        print(f"Worker '{self.name}' registrado ({self.worker_id}); heartbeat a cada {self.heartbeat_seconds:.0f}s")
+
+    def lease(self):
+        """Próximo job da fila, ou None se ela estiver vazia."""
+        response = self.client.post(f"/api/workers/{self.worker_id}/lease")
+        if response.status_code == 404:
+            # Servidor não conhece mais este worker: registra de novo
+            self.register()
+            response = self.client.post(f"/api/workers/{self.worker_id}/lease")
+        response.raise_for_status()
+        return None if response.status_code == 204 else response.json()
+
+    def run_forever(self, once=False, poll_interval=POLL_INTERVAL):
+        self.register()
+        while True:
+            try:
+                job = self.lease()
+            except httpx.HTTPError as e:
+                print(f"Servidor indisponível ({e}); tentando de novo em {poll_interval * 5:.0f}s")
+                time.sleep(poll_interval * 5)
+                continue
+            if job is None:
+                if once:
+                    return
+                time.sleep(poll_interval)
+                continue
+            self.process(job)
+            if once:
+                return
+
+    def process(self, job):
+        job_id = job["job_id"]
+        print(f"Job {job_id}: {job['folder']}/{job['filename']} (tentativa {job['attempt']})")
+        heartbeat = Heartbeat(self.client, self.worker_id, job_id, self.heartbeat_seconds)
+        heartbeat.start()
+        temp_dir = tempfile.mkdtemp(prefix=f"worker_{os.getpid()}_", dir=self.work_dir)
+        try:
+            payload = asyncio.run(self._tag_video(job, heartbeat, Path(temp_dir)))
+            heartbeat.check()
+            # Durante o envio o servidor publica a finalização (85 a 100%); um heartbeat
+            # com o progresso do worker faria a barra voltar
+            heartbeat.renew_only()
+            response = self.client.post(f"/api/workers/{self.worker_id}/jobs/{job_id}/result", content=payload,
+                                        headers={"Content-Type": "application/octet-stream"}, timeout=UPLOAD_TIMEOUT)
+            if response.status_code == 409:
+                raise LeaseLost()
+            response.raise_for_status()
+            print(f"Job {job_id} concluído: {response.json().get('scenes')} cenas")
+        except LeaseLost:
+            print(f"Job {job_id}: lease perdido; resultado descartado")
+        except BaseException as e:
+            # Inclui Ctrl+C: o job volta para a fila em vez de esperar o lease expirar
+            retry = not isinstance(e, httpx.HTTPStatusError)
+            self._report_failure(job_id, f"{type(e).__name__}: {e}", retry)
+            if not isinstance(e, Exception):
+                raise
+        finally:
+            heartbeat.stop()
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def _report_failure(self, job_id, error, retry):
+        print(f"Job {job_id} falhou: {error}")
+        try:
+            self.client.post(f"/api/workers/{self.worker_id}/jobs/{job_id}/fail", json={"error": error, "retry": retry})
+        except httpx.HTTPError as e:
+            print(f"Aviso: não foi possível informar a falha ao servidor ({e}); o lease vai expirar")
+
+    def _local_video(self, job):
+        candidates = [Path(job["video_path"])]
+        if self.shared_root is not None:
+            candidates.append(self.shared_root / job["folder"] / job["filename"])
+        return next((path for path in candidates if path.is_file()), None)
+
+    def _download_video(self, job, temp_dir, heartbeat):
+        target = temp_dir / job["filename"]
+        with self.client.stream("GET", job["video_url"], timeout=UPLOAD_TIMEOUT) as response:
+            response.raise_for_status()
+            total = int(response.headers.get("content-length") or 0)
+            received = 0
+            with open(target, "wb") as f:
+                for chunk in response.iter_bytes(DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+                    received += len(chunk)
+                    if total:
+                        heartbeat.update("DOWNLOADING", 2, f"Baixando o vídeo ({received * 100 // total}%)...")
+                    heartbeat.check()
+        return target
+
+    async def _tag_video(self, job, heartbeat, temp_dir):
+        """Extração + tagging locais; retorna o corpo do upload (encode_frame_results)."""
+        params = job["params"]
+        metrics = JobMetrics(job["job_id"], job["filename"])
+        predictor = None
+        try:
+            video_path = self._local_video(job)
+            if video_path is None:
+                heartbeat.update("DOWNLOADING", 2, "Baixando o vídeo do servidor...")
+                with metrics.stage("download"):
+                    video_path = await asyncio.to_thread(self._download_video, job, temp_dir, heartbeat)
+
+            predictor = acquire_predictor(params["model_repo"], params["model_variant"])
+            if (predictor.last_loaded_repo, predictor.last_loaded_variant) != (params["model_repo"], params["model_variant"]):
+                heartbeat.update("LOADING_MODEL", 3, f"Carregando modelo de IA ({params['model_repo']}, {params['model_variant']})...")
+                with metrics.stage("model_load"):
+                    await asyncio.to_thread(predictor.load_model, params["model_repo"], params["model_variant"], self.inference_config)
+
+            heartbeat.update("EXTRACTING", 5, f"Extraindo frames ({params['fps']} FPS)...")
+            frames_path = temp_dir / "frames"
+            with metrics.stage("extraction"):
+                num_frames = await extrair_frames(str(video_path), str(frames_path), params["fps"])
+            if num_frames == 0:
+                raise Exception("Nenhum frame foi extraído do vídeo.")
+
+            async def report_tagging(frames_done, total_frames):
+                heartbeat.check()
+                percent = int(frames_done / total_frames * 100)
+                heartbeat.update("TAGGING", 15 + int(0.70 * percent), f"Analisando frames ({percent}%)")
+
+            heartbeat.update("TAGGING", 15, "Iniciando tagging...")
+            dados_tags = await tag_extracted_frames(predictor, str(frames_path), params["batch_size"], report_tagging, metrics)
+            if not dados_tags:
+                raise Exception("Falha ao gerar tags para os frames.")
+            with metrics.stage("segmentation"):
+                matriz = FrameTagMatrix.from_tag_dict(dados_tags)
+        finally:
+            if predictor is not None:
+                release_predictor(predictor)
+            elapsed = metrics.stop()
+        return encode_frame_results(matriz, {"worker": self.name, "fps": params["fps"], "frames": metrics.frames,
+                                             "elapsed_seconds": round(elapsed, 4), "stages": metrics.stages})
+
+# ==============================================================================
+# SEÇÃO 4: EXECUÇÃO
+# ==============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--server", default=DEFAULT_SERVER, help="URL do backend (padrão: $SCENES_SERVER ou localhost:8000)")
+    parser.add_argument("--name", default=f"{socket.gethostname()}-{os.getpid()}")
+    parser.add_argument("--shared-root", help="Pasta de vídeos do servidor montada nesta máquina (evita o download)")
+    parser.add_argument("--sessions", type=int, help="Sessões ONNX deste worker (padrão: automático)")
+    parser.add_argument("--threads", type=int, help="Threads intra-op por sessão (padrão: automático)")
+    parser.add_argument("--work-dir", help="Pasta para os arquivos temporários (padrão: temp do sistema)")
+    parser.add_argument("--poll-interval", type=float, default=POLL_INTERVAL)
+    parser.add_argument("--once", action="store_true", help="Processa no máximo um job e sai")
+    args = parser.parse_args()
+
+    inference_config = None
+    if args.sessions or args.threads:
+        inference_config = auto_config(available_providers(), sessions=args.sessions, intra_op_threads=args.threads)
+
+    with httpx.Client(base_url=args.server, timeout=60) as client:
+        worker = Worker(client, args.name, args.shared_root, inference_config, args.work_dir)
+        try:
+            worker.run_forever(once=args.once, poll_interval=args.poll_interval)
+        except KeyboardInterrupt:
+            print("Worker encerrado.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Benchmark do catálogo: gera um banco sintético com N cenas (tags com popularidade
+Zipf) e mede a taxa de ingestão do add_video_to_database e a latência (p50/p90/p99)
+da busca (/search) e da leitura das cenas de um vídeo (/scenes).
+
+Uso (a partir da pasta 'backend'):
+    python -m benchmarks.bench_catalog
+    python -m benchmarks.bench_catalog --scenes 10000 100000 1000000 --queries 500
+"""
+import io
+import json
+import time
+import sqlite3
+import argparse
+import tempfile
+from contextlib import redirect_stdout
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.synthetic import build_catalog, general_tag_names, synthetic_scenes, use_database
+
+def percentiles(samples_seconds):
+    values = np.array(samples_seconds) * 1000
+    return {"p50_ms": round(float(np.percentile(values, 50)), 3), "p90_ms": round(float(np.percentile(values, 90)), 3),
+            "p99_ms": round(float(np.percentile(values, 99)), 3), "max_ms": round(float(values.max()), 3)}
+
+def random_search_requests(rng, n_queries, tag_names, popular=200):
+    """Buscas variadas: 1 a 3 tags entre as mais populares, às vezes com exclusão e filtro de duração."""
+    requests = []
+    for _ in range(n_queries):
+        request = {"include_tags": [tag_names[i] for i in rng.choice(popular, rng.integers(1, 4), replace=False)]}
+        if rng.random() < 0.3:
+            request["exclude_tags"] = [tag_names[int(rng.integers(0, popular))]]
+        if rng.random() < 0.3:
+            request["min_duration"] = float(rng.choice([2.0, 5.0, 10.0]))
+        requests.append(request)
+    return requests
+
+def measure_ingest(rng, tag_names, videos, scenes_per_video, tags_per_scene):
+    """Taxa de ingestão pelo caminho real (add_video_to_database), um vídeo por transação."""
+    from app.services.database_service import add_video_to_database
+
+    payloads = [synthetic_scenes(rng, scenes_per_video, tag_names, tags_per_scene) for _ in range(videos)]
+    start = time.perf_counter()
+    # add_video_to_database imprime uma linha por vídeo
+    with redirect_stdout(io.StringIO()):
+        for i, scenes in enumerate(payloads):
+            add_video_to_database(f"/benchmark/ingest/ingest_{i:05d}.mp4", "ingest", scenes)
+    elapsed = time.perf_counter() - start
+    tag_rows = sum(len(scene["tags_principais"]) for scenes in payloads for scene in scenes)
+    return {"videos": videos, "scenes": videos * scenes_per_video, "seconds": round(elapsed, 3),
+            "scenes_per_second": round(videos * scenes_per_video / elapsed, 1),
+            "tag_rows_per_second": round(tag_rows / elapsed, 1)}
+
+def measure_search(db_path, rng, tag_names, n_queries):
+    from app.api.search import search_videos
+    from app.core.schemas import SearchRequest
+
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    try:
+        requests = [SearchRequest(**request) for request in random_search_requests(rng, n_queries, tag_names)]
+        search_videos(requests[0], db=conn)  # Aquecimento do cache de páginas do SQLite
+        timings, results = [], 0
+        for request in requests:
+            start = time.perf_counter()
+            results += len(search_videos(request, db=conn)["results"])
+            timings.append(time.perf_counter() - start)
+    finally:
+        conn.close()
+    return {"queries": n_queries, "mean_results": round(results / n_queries, 1), **percentiles(timings)}
+
+def measure_scene_reads(db_path, rng, n_reads, n_videos):
+    from app.services.database_service import get_video_scenes
+
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    try:
+        names = [f"video_{int(v):07d}" for v in rng.integers(0, n_videos, n_reads)]
+        timings = []
+        for name in names:
+            start = time.perf_counter()
+            get_video_scenes(conn, name, top_tags=10)
+            timings.append(time.perf_counter() - start)
+    finally:
+        conn.close()
+    return {"reads": n_reads, **percentiles(timings)}
+
+def run_catalog_benchmark(n_scenes, queries=200, ingest_videos=50, scenes_per_video=40, tags_per_scene=20,
+                          seed=0, workdir=None):
+    """Monta o catálogo de 'n_scenes' cenas em uma pasta temporária e retorna as medidas em um dict."""
+    rng = np.random.default_rng(seed)
+    tag_names = general_tag_names()
+    with tempfile.TemporaryDirectory(dir=workdir) as temp_dir:
+        db_path = Path(temp_dir) / "catalog.db"
+        start = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            catalog = build_catalog(db_path, n_scenes, scenes_per_video, tags_per_scene, seed)
+            use_database(db_path)
+        catalog["build_seconds"] = round(time.perf_counter() - start, 2)
+        return {
+            "catalog": catalog,
+            "search": measure_search(db_path, rng, tag_names, queries),
+            "scene_reads": measure_scene_reads(db_path, rng, queries, catalog["videos"]),
+            # A ingestão vem por último: ela também aumenta o catálogo
+            "ingest": measure_ingest(rng, tag_names, ingest_videos, scenes_per_video, tags_per_scene),
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenes", type=int, nargs="+", default=[10_000, 100_000], help="Tamanhos de catálogo")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--ingest-videos", type=int, default=50)
+    parser.add_argument("--tags-per-scene", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    results = {str(n): run_catalog_benchmark(n, args.queries, args.ingest_videos, tags_per_scene=args.tags_per_scene,
+                                              seed=args.seed)
+               for n in args.scenes}
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Benchmark do backend de inferência: mede frames/s do tagger para diferentes
+combinações de sessões (K) x threads intra-op por sessão.
+
+Uso (a partir da pasta 'backend'):
+    python -m benchmarks.bench_inference
+    python -m benchmarks.bench_inference --model caminho/model.onnx --backend processes --batch-size 16
+"""
+import os
+import time
+import argparse
+import threading
+
+import numpy as np
+
+from app.services.inference_pool import InferenceConfig, create_pool
+from app.services.model_variants import resolve_model_path
+from app.services.processing_service import MODEL_REPO
+
+def default_combinations(cores):
+    """Pares (K, threads) que ocupam todos os núcleos, mais alguns com menos threads."""
+    combos = []
+    for sessions in (1, 2, 4, 8):
+        if sessions > cores:
+            break
+        for threads in sorted({max(1, cores // sessions), max(1, cores // (2 * sessions))}):
+            combos.append((sessions, threads))
+    return combos
+
+def run_combination(model_path, sessions, threads, backend, batch_size, batches_per_session, providers):
+    config = InferenceConfig(backend=backend, sessions=sessions, intra_op_threads=threads, providers=providers)
+    pool = create_pool(model_path, config)
+    try:
+        _, height, width, channels = pool.input_shape
+        batch = (np.random.rand(batch_size, height, width, channels) * 255).astype(np.float32)
+        pool.run(batch)  # Aquecimento: inicializa o grafo antes de medir
+
+        def worker():
+            for _ in range(batches_per_session):
+                pool.run(batch)
+
+        workers = [threading.Thread(target=worker) for _ in range(sessions)]
+        start = time.perf_counter()
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        elapsed = time.perf_counter() - start
+        return sessions * batches_per_session * batch_size / elapsed
+    finally:
+        pool.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", help="Caminho do model.onnx (padrão: pasta local de modelos ou cache do MODEL_REPO)")
+    parser.add_argument("--backend", choices=("threads", "processes"), default="threads")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--batches", type=int, default=4, help="Lotes por sessão em cada medição")
+    parser.add_argument("--combos", help="Lista K:threads separada por vírgula (ex.: 1:8,2:4,4:2)")
+    args = parser.parse_args()
+
+    model_path = args.model or resolve_model_path(MODEL_REPO)
+
+    cores = os.cpu_count() or 1
+    if args.combos:
+        combos = [tuple(int(x) for x in item.split(':')) for item in args.combos.split(',')]
+    else:
+        combos = default_combinations(cores)
+
+    print(f"Modelo: {model_path}")
+    print(f"Núcleos: {cores} | backend: {args.backend} | batch: {args.batch_size}\n")
+    print(f"{'K':>3} {'threads':>8} {'frames/s':>10}")
+    results = []
+    for sessions, threads in combos:
+        fps = run_combination(model_path, sessions, threads, args.backend, args.batch_size,
+                              args.batches, ['CPUExecutionProvider'])
+        results.append((sessions, threads, fps))
+        print(f"{sessions:>3} {threads:>8} {fps:>10.2f}")
+
+    best = max(results, key=lambda r: r[2])
+    print(f"\nMelhor combinação: K={best[0]} x {best[1]} threads ({best[2]:.2f} frames/s)")
+    print(f"Use INFERENCE_SESSIONS={best[0]} INFERENCE_INTRA_THREADS={best[1]} para fixá-la.")
+
+if __name__ == "__main__":
+    main()
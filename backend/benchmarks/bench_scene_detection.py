@@ -0,0 +1,141 @@
+"""
+Benchmark da detecção de trocas de cena e da agregação de tags por cena: compara
+as implementações originais (conjuntos e listas Python frame a frame) com as
+versões vetorizadas sobre a matriz esparsa, em uma sequência sintética com cenas
+de tamanho aleatório e frames com "flicker".
+
+Uso (a partir da pasta 'backend'):
+    python -m benchmarks.bench_scene_detection
+    python -m benchmarks.bench_scene_detection --frames 50000 --tags-per-frame 40
+"""
+import re
+import json
+import time
+import argparse
+
+import numpy as np
+
+from app.services.scene_detection import FrameTagMatrix, aggregate_scene_tags, detect_boundaries
+
+def synthetic_tags(n_frames, vocabulary_size, tags_per_frame, flicker_rate, seed):
+    """
+    Gera {frame_%06d.png: {tag: score}}: cada cena sorteia um conjunto base de tags
+    e cada frame mantém ~85% delas (mais algumas aleatórias). Alguns frames isolados
+    recebem tags totalmente diferentes, simulando flashes.
+    Retorna também os frames onde as cenas realmente começam.
+    """
+    rng = np.random.default_rng(seed)
+    tags = {}
+    true_starts = []
+    frame = 0
+    while frame < n_frames:
+        length = int(rng.integers(5, 120))
+        base = rng.choice(vocabulary_size, tags_per_frame, replace=False)
+        true_starts.append(frame)
+        for _ in range(min(length, n_frames - frame)):
+            if frame > 0 and rng.random() < flicker_rate:
+                kept = rng.choice(vocabulary_size, tags_per_frame, replace=False)
+            else:
+                kept = base[rng.random(len(base)) < 0.85]
+                kept = np.union1d(kept, rng.choice(vocabulary_size, 3, replace=False))
+            tags[f"frame_{frame + 1:06d}.png"] = {f"tag_{t}": float(s) for t, s in zip(kept, rng.uniform(0.35, 1.0, len(kept)))}
+            frame += 1
+    return tags, true_starts
+
+def legacy_detection(dados_tags, fps, limiar_similaridade):
+    """Implementação anterior de detectar_trocas_de_cena, mantida aqui como referência."""
+    def calcular_similaridade_jaccard(tags1, tags2):
+        set1, set2 = set(tags1.keys()), set(tags2.keys())
+        intersecao = set1.intersection(set2)
+        uniao = set1.union(set2)
+        return len(intersecao) / len(uniao) if uniao else 1.0
+
+    frames_ordenados = sorted(dados_tags.keys(), key=lambda x: int(re.search(r'(\d+)', x).group(1)))
+    trocas_de_cena = [0.0]
+    for i in range(len(frames_ordenados) - 1):
+        similaridade = calcular_similaridade_jaccard(dados_tags[frames_ordenados[i]], dados_tags[frames_ordenados[i+1]])
+        if similaridade < limiar_similaridade:
+            trocas_de_cena.append((i + 1) / fps)
+    return trocas_de_cena, frames_ordenados
+
+def legacy_aggregation(trocas_de_cena, frames_ordenados, dados_tags, fps, video_duration):
+    """Implementação anterior de agrupar_cenas_com_tags (só as tags de cada cena)."""
+    cenas = []
+    trocas_de_cena = trocas_de_cena + [video_duration]
+    for i in range(len(trocas_de_cena) - 1):
+        frames_da_cena = frames_ordenados[int(trocas_de_cena[i] * fps):int(trocas_de_cena[i+1] * fps)]
+        tags_agregadas = {}
+        for frame_nome in frames_da_cena:
+            for tag, score in dados_tags.get(frame_nome, {}).items():
+                tags_agregadas.setdefault(tag, []).append(score)
+        tags_medias = {tag: np.mean(scores) for tag, scores in tags_agregadas.items()}
+        cenas.append(sorted(tags_medias.items(), key=lambda item: item[1], reverse=True))
+    return cenas
+
+def best_of(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+def boundary_f1(true_starts, detected):
+    true_set, detected_set = set(true_starts[1:]), set(int(x) for x in detected[1:])
+    hits = len(true_set & detected_set)
+    precision = hits / len(detected_set) if detected_set else 1.0
+    recall = hits / len(true_set) if true_set else 1.0
+    return 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=10000)
+    parser.add_argument("--vocabulary", type=int, default=5000)
+    parser.add_argument("--tags-per-frame", type=int, default=30)
+    parser.add_argument("--flicker-rate", type=float, default=0.01)
+    parser.add_argument("--threshold", type=float, default=0.4)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    tags, true_starts = synthetic_tags(args.frames, args.vocabulary, args.tags_per_frame, args.flicker_rate, args.seed)
+    print(f"{len(tags)} frames, {len(true_starts)} cenas reais, limiar {args.threshold}\n")
+
+    legacy_time, (legacy_cuts, _) = best_of(lambda: legacy_detection(tags, 1.0, args.threshold), args.repeat)
+    build_time, matrix = best_of(lambda: FrameTagMatrix.from_tag_dict(tags), args.repeat)
+    print(f"{'variante':<28} {'tempo (ms)':>11} {'cenas':>7} {'F1':>6}")
+    print(f"{'original (sets)':<28} {legacy_time * 1000:>11.1f} {len(legacy_cuts):>7} {boundary_f1(true_starts, legacy_cuts):>6.3f}")
+    print(f"{'montagem da matriz CSR':<28} {build_time * 1000:>11.1f}")
+
+    for label, options in (("jaccard", {}),
+                           ("cosine", {"metric": "cosine"}),
+                           ("jaccard + flicker W=1", {"flicker_window": 1}),
+                           ("jaccard + flicker W=2", {"flicker_window": 2})):
+        elapsed, starts = best_of(lambda: detect_boundaries(matrix, args.threshold, **options), args.repeat)
+        print(f"{label:<28} {elapsed * 1000:>11.1f} {len(starts):>7} {boundary_f1(true_starts, starts):>6.3f}")
+        if not options:
+            assert [int(s) for s in starts] == [int(c) for c in legacy_cuts], "Resultado diferente da implementação original"
+
+    # Agregação das tags por cena (cenas do detector com flicker W=1)
+    starts = detect_boundaries(matrix, args.threshold, flicker_window=1)
+    frames = matrix.frame_names
+    print(f"\n{'agregação':<28} {'tempo (ms)':>11} {'tags/cena':>10} {'JSON (KB)':>10}")
+    legacy_time, legacy_scenes = best_of(lambda: legacy_aggregation([float(s) for s in starts], frames, tags, 1.0, len(frames)), args.repeat)
+    print(f"{'original (listas)':<28} {legacy_time * 1000:>11.1f} {_mean_tags(legacy_scenes):>10.1f} {_json_kb(legacy_scenes):>10.1f}")
+    for label, top_k, support in (("reduceat (todas)", None, 0.0), ("reduceat top-50, suporte 10%", 50, 0.1),
+                                  ("reduceat top-20, suporte 30%", 20, 0.3)):
+        elapsed, scenes = best_of(lambda: aggregate_scene_tags(matrix, starts, top_k, support), args.repeat)
+        print(f"{label:<28} {elapsed * 1000:>11.1f} {_mean_tags(scenes):>10.1f} {_json_kb(scenes):>10.1f}")
+        if top_k is None and support == 0.0:
+            for old, new in zip(legacy_scenes, scenes):
+                assert {t: round(s, 3) for t, s in old} == {t: round(s, 3) for t, s in new}, "Agregação diferente da original"
+
+def _mean_tags(scenes):
+    return sum(len(scene) for scene in scenes) / max(len(scenes), 1)
+
+def _json_kb(scenes):
+    payload = [{"tags_principais": {tag: round(float(score), 3) for tag, score in scene}} for scene in scenes]
+    return len(json.dumps(payload, indent=4, ensure_ascii=False)) / 1024
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Benchmark da inicialização do servidor: mede quanto tempo leva para importar
+'app.main' em um processo Python novo e quais módulos pesados de ML foram
+carregados no caminho (nenhum deveria ser, até o primeiro job de processamento).
+
+Uso (a partir da pasta 'backend'):
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --runs 10 --module app.api.search
+"""
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+HEAVY_MODULES = ("torch", "onnxruntime", "pandas", "huggingface_hub")
+
+PROBE = """
+import sys, time, json
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+def measure(module, runs):
+    code = PROBE.format(module=module, heavy=HEAVY_MODULES)
+    timings, heavy = [], set()
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        data = json.loads(result.stdout.strip().splitlines()[-1])
+        timings.append(data["seconds"])
+        heavy.update(data["heavy"])
+    return timings, sorted(heavy)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="app.main", help="Módulo importado na medição")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    # A primeira execução aquece o cache de bytecode e do sistema de arquivos
+    measure(args.module, 1)
+    timings, heavy = measure(args.module, args.runs)
+
+    print(f"Import de '{args.module}' ({args.runs} execuções)")
+    print(f"  mediana: {statistics.median(timings) * 1000:.0f} ms")
+    print(f"  mínimo:  {min(timings) * 1000:.0f} ms | máximo: {max(timings) * 1000:.0f} ms")
+    print(f"  módulos pesados carregados: {', '.join(heavy) if heavy else 'nenhum'}")
+
+if __name__ == "__main__":
+    main()
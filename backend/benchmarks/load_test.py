@@ -0,0 +1,399 @@
+"""
+Teste de carga da API: sobe o backend (uvicorn, em outro processo) sobre um
+catálogo sintético e arquivos de mídia fictícios, dispara uma mistura
+configurável de /search, /videos/{pasta}, /thumbnail e /stream com N clientes
+assíncronos concorrentes e reporta, por endpoint, p50/p95/p99, vazão e taxa de
+erros, comparando com os SLOs de latência. Opcionalmente mantém jobs de
+processamento rodando ao mesmo tempo (modelo stub + vídeos sintéticos, requer o
+ffmpeg) para medir a interferência deles nas requisições.
+
+Os vídeos fictícios são bytes aleatórios (o /stream não decodifica nada) e as
+thumbnails já ficam no cache, então o /thumbnail mede o caminho do cache.
+Sai com código 1 se algum SLO for violado.
+
+Uso (a partir da pasta 'backend'):
+    python -m benchmarks.load_test
+    python -m benchmarks.load_test --clients 64 --duration 60 --mix search=60 stream=30 thumbnail=10
+    python -m benchmarks.load_test --processing-jobs 2 --output benchmarks/results/carga.json
+    python -m benchmarks.load_test --url http://localhost:8000 --slo search=150 videos=50
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import socket
+import asyncio
+import sqlite3
+import argparse
+import tempfile
+import subprocess
+from collections import Counter
+from pathlib import Path
+from urllib.parse import quote
+
+import httpx
+import numpy as np
+
+from benchmarks.bench_catalog import random_search_requests
+from benchmarks.synthetic import BACKEND_DIR, build_catalog, general_tag_names, make_test_video, scene_durations
+
+# ==============================================================================
+# SEÇÃO 1: CONFIGURAÇÕES
+# ==============================================================================
+ENDPOINTS = ("search", "videos", "thumbnail", "stream")
+# Pesos relativos de cada endpoint no tráfego
+DEFAULT_MIX = {"search": 40, "videos": 20, "thumbnail": 25, "stream": 15}
+# Latência máxima (ms) no percentil do SLO (--slo-percentile), por endpoint
+DEFAULT_SLO_MS = {"search": 300, "videos": 100, "thumbnail": 50, "stream": 100}
+MAX_ERROR_RATE = 0.01
+# Tamanho de cada leitura do /stream (um player pede trechos assim com Range)
+STREAM_CHUNK_BYTES = 1 << 20
+# Tamanho típico de uma thumbnail de 320px
+THUMBNAIL_BYTES = 12 << 10
+STUB_MODEL_REPO = "benchmark/stub-tagger"
+JOBS_FOLDER = "LoadTestJobs"
+SERVER_START_TIMEOUT = 120
+REQUEST_TIMEOUT = 60
+
+# ==============================================================================
+# SEÇÃO 2: DADOS E SERVIDOR
+# ==============================================================================
+
+def build_media(workdir, n_videos, video_size_mb, seed):
+    """
+    Cria arquivos de vídeo fictícios com as pastas e nomes de 'n_videos' vídeos do
+    catálogo (todos hard links de um mesmo arquivo) e as thumbnails no cache.
+    """
+    media_dir = workdir / "videos"
+    thumbnails_dir = media_dir / ".thumbnails"
+    os.makedirs(thumbnails_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    source = workdir / "source.mp4"
+    source.write_bytes(rng.bytes(int(video_size_mb * 2**20)))
+    thumbnail = rng.bytes(THUMBNAIL_BYTES)
+
+    conn = sqlite3.connect(workdir / "catalog.db")
+    try:
+        total = conn.execute("SELECT COUNT(*) FROM videos").fetchone()[0]
+        step = max(1, total // max(1, n_videos))
+        rows = conn.execute("SELECT category, video_name FROM videos WHERE video_id % ? = 0 LIMIT ?",
+                            (step, n_videos)).fetchall()
+    finally:
+        conn.close()
+    for category, video_name in rows:
+        os.makedirs(media_dir / category, exist_ok=True)
+        target = media_dir / category / f"{video_name}.mp4"
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copyfile(source, target)
+        (thumbnails_dir / f"{video_name}.jpg").write_bytes(thumbnail)
+    return len(rows)
+
+def build_job_videos(workdir, n_jobs, scenes, seed):
+    """Um vídeo sintético (com cortes reais) por job de processamento simultâneo."""
+    folder = workdir / "videos" / JOBS_FOLDER
+    os.makedirs(folder, exist_ok=True)
+    first = folder / "job_00.mp4"
+    make_test_video(first, scene_durations(scenes, seed))
+    names = [first.name]
+    for i in range(1, n_jobs):
+        shutil.copyfile(first, folder / f"job_{i:02d}.mp4")
+        names.append(f"job_{i:02d}.mp4")
+    return names
+
+def serve(workdir, port):
+    """Modo servidor (--serve): backend apontado para o banco e a mídia de 'workdir'."""
+    from benchmarks.synthetic import install_stub_model, use_database
+
+    workdir = Path(workdir)
+    use_database(workdir / "catalog.db")
+    install_stub_model(workdir / "models", STUB_MODEL_REPO)
+
+    import uvicorn
+    from app.api import videos
+    from app.main import app
+
+    videos.VIDEOS_BASE_PATH = workdir / "videos"
+    videos.THUMBNAIL_CACHE_PATH = videos.VIDEOS_BASE_PATH / ".thumbnails"
+    videos.DB_FILE = workdir / "catalog.db"
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning", access_log=False)
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_server(workdir):
+    """Sobe o backend em outro processo (sem disputar o GIL com os clientes) e espera ele responder."""
+    port = free_port()
+    command = [sys.executable, "-m", "benchmarks.load_test", "--serve", str(workdir), "--port", str(port)]
+    # O aquecimento na inicialização carregaria o modelo padrão, que não existe aqui
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env={**os.environ, "MODEL_WARMUP": "first_use"})
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"o servidor terminou durante a inicialização (código {process.returncode})")
+        try:
+            if httpx.get(f"{url}/", timeout=1).status_code == 200:
+                return process, url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"o servidor não respondeu em {SERVER_START_TIMEOUT}s")
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+# ==============================================================================
+# SEÇÃO 3: GERAÇÃO DE CARGA
+# ==============================================================================
+
+async def discover_targets(client, max_videos, n_searches, seed):
+    """Pastas, vídeos (com tamanho) e buscas usados pelos clientes, descobertos pela própria API."""
+    response = await client.get("/api/folders")
+    response.raise_for_status()
+    folders = [folder for folder in response.json()["folders"] if folder != JOBS_FOLDER]
+    videos = []
+    for folder in folders:
+        listing = await client.get(f"/api/videos/{quote(folder)}")
+        listing.raise_for_status()
+        videos += [(folder, video["filename"]) for video in listing.json()["videos"]]
+    if not videos:
+        raise RuntimeError("nenhum vídeo encontrado nas pastas do servidor")
+    videos = random.Random(seed).sample(videos, min(max_videos, len(videos)))
+
+    sized_videos = []
+    for folder, filename in videos:
+        head = await client.head(f"/api/stream/{quote(folder)}/{quote(filename)}")
+        if head.status_code == 200:
+            sized_videos.append((folder, filename, int(head.headers["content-length"])))
+    searches = random_search_requests(np.random.default_rng(seed), n_searches, general_tag_names())
+    return {"folders": sorted({folder for folder, _, _ in sized_videos}), "videos": sized_videos, "searches": searches}
+
+def build_request(endpoint, targets, rng):
+    """(método, url, kwargs do httpx) de uma requisição aleatória ao endpoint."""
+    if endpoint == "search":
+        return "POST", "/api/search", {"json": rng.choice(targets["searches"])}
+    if endpoint == "videos":
+        return "GET", f"/api/videos/{quote(rng.choice(targets['folders']))}", {}
+    folder, filename, size = rng.choice(targets["videos"])
+    if endpoint == "thumbnail":
+        return "GET", f"/api/thumbnail/{quote(folder)}/{quote(filename)}", {}
+    start = rng.randrange(max(1, size - STREAM_CHUNK_BYTES))
+    end = min(size, start + STREAM_CHUNK_BYTES) - 1
+    return "GET", f"/api/stream/{quote(folder)}/{quote(filename)}", {"headers": {"Range": f"bytes={start}-{end}"}}
+
+async def run_client(client, targets, mix, rng, t0, deadline, records):
+    """Um usuário: requisições em sequência, sem pausa, até o fim do teste."""
+    endpoints, weights = list(mix), list(mix.values())
+    while time.perf_counter() < deadline:
+        endpoint = rng.choices(endpoints, weights)[0]
+        method, url, kwargs = build_request(endpoint, targets, rng)
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+            error = None if response.status_code < 400 else f"HTTP {response.status_code}"
+        except httpx.HTTPError as e:
+            error = type(e).__name__
+        records.append((endpoint, start - t0, time.perf_counter() - start, error))
+
+async def run_processing_slot(client, filename, params, jobs):
+    """Mantém um job de processamento rodando: ao terminar um, inicia o próximo."""
+    while True:
+        start = time.perf_counter()
+        response = await client.post(f"/api/process/{JOBS_FOLDER}/{quote(filename)}", json=params)
+        response.raise_for_status()
+        job_id = response.json()["job_id"]
+        # As métricas do job só são gravadas quando ele termina (com sucesso ou erro)
+        while (metrics := await client.get(f"/api/jobs/{job_id}/metrics")).status_code == 404:
+            await asyncio.sleep(0.5)
+        metrics = metrics.json()
+        jobs.append({"status": metrics["status"], "seconds": round(time.perf_counter() - start, 3),
+                     "frames": metrics["frames"], "frames_per_second": metrics["frames_per_second"]})
+
+async def run_load(url, targets_options, clients, duration, mix, seed, job_videos=(), job_params=None):
+    """Executa o teste; retorna os registros (endpoint, início, latência, erro) e os jobs concluídos."""
+    limits = httpx.Limits(max_connections=clients + len(job_videos) + 4, max_keepalive_connections=clients + len(job_videos))
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=REQUEST_TIMEOUT) as client:
+        targets = await discover_targets(client, *targets_options, seed)
+        records, jobs = [], []
+        job_tasks = [asyncio.create_task(run_processing_slot(client, filename, job_params, jobs)) for filename in job_videos]
+        t0 = time.perf_counter()
+        try:
+            await asyncio.gather(*(run_client(client, targets, mix, random.Random(seed + i), t0, t0 + duration, records)
+                                   for i in range(clients)))
+        finally:
+            for task in job_tasks:
+                task.cancel()
+            # Cancelados não contam (CancelledError não é Exception); sobram só as falhas reais
+            failed = [result for result in await asyncio.gather(*job_tasks, return_exceptions=True)
+                      if isinstance(result, Exception)]
+        if failed:
+            raise RuntimeError(f"falha ao disparar os jobs de processamento: {failed[0]}")
+    return records, jobs, len(targets["videos"])
+
+# ==============================================================================
+# SEÇÃO 4: RELATÓRIO
+# ==============================================================================
+
+def summarize(records, warmup, duration, slo_ms, slo_percentile, max_error_rate):
+    """Estatísticas por endpoint (e no total) das requisições iniciadas depois do aquecimento."""
+    measured = [record for record in records if record[1] >= warmup]
+    window = duration - warmup
+    report = {}
+    for endpoint in ENDPOINTS + ("total",):
+        rows = measured if endpoint == "total" else [record for record in measured if record[0] == endpoint]
+        if not rows:
+            continue
+        latencies = np.array([latency for _, _, latency, error in rows if error is None]) * 1000
+        errors = Counter(error for _, _, _, error in rows if error is not None)
+        error_rate = sum(errors.values()) / len(rows)
+        stats = {"requests": len(rows), "throughput_rps": round(len(rows) / window, 1),
+                 "error_rate": round(error_rate, 4), "errors": dict(errors)}
+        if len(latencies):
+            stats.update({f"p{p}_ms": round(float(np.percentile(latencies, p)), 2) for p in (50, 95, 99)})
+            stats["max_ms"] = round(float(latencies.max()), 2)
+        if endpoint in slo_ms:
+            observed = float(np.percentile(latencies, slo_percentile)) if len(latencies) else float("inf")
+            stats["slo"] = {"percentile": slo_percentile, "target_ms": slo_ms[endpoint], "observed_ms": round(observed, 2),
+                            "max_error_rate": max_error_rate,
+                            "ok": observed <= slo_ms[endpoint] and error_rate <= max_error_rate}
+        report[endpoint] = stats
+    return report
+
+def summarize_jobs(jobs):
+    if not jobs:
+        return {"completed": 0}
+    return {"completed": sum(job["status"] == "completed" for job in jobs), "failed": sum(job["status"] != "completed" for job in jobs),
+            "mean_seconds": round(float(np.mean([job["seconds"] for job in jobs])), 2),
+            "mean_frames_per_second": round(float(np.mean([job["frames_per_second"] or 0 for job in jobs])), 2)}
+
+def print_report(endpoints, jobs=None):
+    print(f"\n{'endpoint':<10} {'reqs':>7} {'req/s':>8} {'erros':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}  SLO")
+    for endpoint, stats in endpoints.items():
+        slo = stats.get("slo")
+        slo_text = ""
+        if slo:
+            slo_text = f"p{slo['percentile']:g} <= {slo['target_ms']:g} ms: {'ok' if slo['ok'] else 'VIOLADO'}"
+        print(f"{endpoint:<10} {stats['requests']:>7} {stats['throughput_rps']:>8} {stats['error_rate']:>7.1%} "
+              f"{stats.get('p50_ms', '-'):>8} {stats.get('p95_ms', '-'):>8} {stats.get('p99_ms', '-'):>8} "
+              f"{stats.get('max_ms', '-'):>8}  {slo_text}")
+        if stats["errors"]:
+            print(f"{'':<10} erros: {stats['errors']}")
+    if jobs is not None:
+        print(f"\nJobs de processamento em paralelo: {jobs}")
+
+def parse_pairs(parser, items, option):
+    """['search=40', 'stream=10'] -> {'search': 40.0, 'stream': 10.0}, validando os endpoints."""
+    pairs = {}
+    for item in items:
+        name, _, value = item.partition("=")
+        if name not in ENDPOINTS:
+            parser.error(f"{option}: endpoint desconhecido '{name}' (use {', '.join(ENDPOINTS)})")
+        try:
+            pairs[name] = float(value)
+        except ValueError:
+            parser.error(f"{option}: valor inválido em '{item}'")
+        if pairs[name] < 0:
+            parser.error(f"{option}: valor negativo em '{item}'")
+    return pairs
+
+# ==============================================================================
+# SEÇÃO 5: EXECUÇÃO
+# ==============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Testa um servidor já rodando em vez de subir um com dados sintéticos")
+    parser.add_argument("--clients", type=int, default=16, help="Clientes concorrentes")
+    parser.add_argument("--duration", type=float, default=30, help="Duração do teste (s), incluindo o aquecimento")
+    parser.add_argument("--warmup", type=float, default=5, help="Segundos iniciais descartados das estatísticas")
+    parser.add_argument("--mix", nargs="+", default=[], metavar="ENDPOINT=PESO",
+                        help=f"Pesos do tráfego (padrão: {' '.join(f'{k}={v}' for k, v in DEFAULT_MIX.items())})")
+    parser.add_argument("--slo", nargs="+", default=[], metavar="ENDPOINT=MS",
+                        help=f"Latência máxima no percentil do SLO (padrão: {' '.join(f'{k}={v}' for k, v in DEFAULT_SLO_MS.items())})")
+    parser.add_argument("--slo-percentile", type=float, default=95)
+    parser.add_argument("--max-error-rate", type=float, default=MAX_ERROR_RATE)
+    parser.add_argument("--scenes", type=int, default=100_000, help="Cenas do catálogo sintético")
+    parser.add_argument("--media-videos", type=int, default=200, help="Vídeos fictícios nas pastas de mídia")
+    parser.add_argument("--media-size-mb", type=float, default=16, help="Tamanho de cada vídeo fictício")
+    parser.add_argument("--searches", type=int, default=500, help="Buscas distintas sorteadas pelos clientes")
+    parser.add_argument("--processing-jobs", type=int, default=0, help="Jobs de processamento simultâneos durante o teste")
+    parser.add_argument("--job-scenes", type=int, default=10, help="Cenas de cada vídeo sintético dos jobs")
+    parser.add_argument("--job-fps", type=float, default=2.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="Pasta para os dados temporários (padrão: temp do sistema)")
+    parser.add_argument("--output", help="Grava o relatório em JSON")
+    # Uso interno: o processo do servidor
+    parser.add_argument("--serve", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port)
+        return
+
+    mix = parse_pairs(parser, args.mix, "--mix") if args.mix else dict(DEFAULT_MIX)
+    mix = {endpoint: weight for endpoint, weight in mix.items() if weight > 0}
+    if not mix:
+        parser.error("--mix: todos os pesos são zero")
+    slo_ms = DEFAULT_SLO_MS | parse_pairs(parser, args.slo, "--slo")
+    if args.warmup >= args.duration:
+        parser.error("--warmup deve ser menor que --duration")
+    if args.processing_jobs and args.url:
+        parser.error("--processing-jobs só é suportado com o servidor sintético (sem --url)")
+    if args.processing_jobs and shutil.which("ffmpeg") is None:
+        parser.error("--processing-jobs requer o ffmpeg no PATH")
+
+    with tempfile.TemporaryDirectory(dir=args.workdir) as temp_dir:
+        workdir = Path(temp_dir)
+        server, url, catalog, job_videos = None, args.url, None, []
+        if url is None:
+            print(f"Gerando o catálogo sintético ({args.scenes} cenas) e a mídia fictícia...", file=sys.stderr)
+            catalog = build_catalog(workdir / "catalog.db", args.scenes, seed=args.seed)
+            catalog["media_videos"] = build_media(workdir, args.media_videos, args.media_size_mb, args.seed)
+            if args.processing_jobs:
+                job_videos = build_job_videos(workdir, args.processing_jobs, args.job_scenes, args.seed)
+            server, url = start_server(workdir)
+
+        job_params = {"model_repo": STUB_MODEL_REPO, "fps": args.job_fps, "batch_size": 8, "reuse_duplicates": False}
+        print(f"Carga em {url}: {args.clients} clientes por {args.duration:g}s ({args.warmup:g}s de aquecimento), "
+              f"mistura {mix}", file=sys.stderr)
+        try:
+            records, jobs, target_videos = asyncio.run(run_load(url, (args.media_videos, args.searches), args.clients,
+                                                                args.duration, mix, args.seed, job_videos, job_params))
+        finally:
+            if server is not None:
+                stop_server(server)
+
+    endpoints = summarize(records, args.warmup, args.duration, {k: v for k, v in slo_ms.items() if k in mix},
+                          args.slo_percentile, args.max_error_rate)
+    processing = summarize_jobs(jobs) if args.processing_jobs else None
+    print_report(endpoints, processing)
+
+    if args.output:
+        from benchmarks.run_suite import environment
+
+        parameters = {key: value for key, value in vars(args).items() if key not in ("serve", "port", "output")}
+        report = {"environment": environment(), "parameters": parameters,
+                  "results": {"load": {"catalog": catalog, "target_videos": target_videos, "endpoints": endpoints,
+                                       "processing": processing}}}
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\nRelatório gravado em {args.output}", file=sys.stderr)
+
+    if not all(stats["slo"]["ok"] for stats in endpoints.values() if "slo" in stats):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Executa a suíte de benchmarks (pipeline com vídeo sintético e catálogos de
+vários tamanhos) e grava o resultado em JSON, com o commit e o ambiente, para
+comparar versões.
+
+Uso (a partir da pasta 'backend'):
+    python -m benchmarks.run_suite
+    python -m benchmarks.run_suite --catalog-sizes 10000 100000 1000000
+    python -m benchmarks.run_suite --compare benchmarks/results/antes.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import subprocess
+from pathlib import Path
+
+from benchmarks.bench_catalog import run_catalog_benchmark
+from benchmarks.bench_pipeline import run_pipeline_benchmark
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+def environment():
+    import numpy
+    try:
+        import onnxruntime
+        onnxruntime_version = onnxruntime.__version__
+    except ImportError:
+        onnxruntime_version = None
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=Path(__file__).parent).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {"commit": commit, "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+            "platform": platform.platform(), "cpu_count": os.cpu_count(), "numpy": numpy.__version__,
+            "onnxruntime": onnxruntime_version}
+
+def flatten(data, prefix=""):
+    """{'a': {'b': 1}} -> {'a.b': 1}, só com os valores numéricos."""
+    items = {}
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            items.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            items[name] = value
+    return items
+
+def print_comparison(baseline, current):
+    old, new = flatten(baseline["results"]), flatten(current["results"])
+    print(f"\nComparação com {baseline['environment'].get('commit')} ({baseline['environment'].get('timestamp')}):")
+    print(f"{'medida':<60} {'antes':>12} {'agora':>12} {'variação':>9}")
+    for name in sorted(old.keys() & new.keys()):
+        change = f"{(new[name] - old[name]) / old[name] * 100:+.1f}%" if old[name] else "-"
+        print(f"{name:<60} {old[name]:>12} {new[name]:>12} {change:>9}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--catalog-sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--scenes", type=int, default=20, help="Cenas do vídeo sintético do pipeline")
+    parser.add_argument("--fps", type=float, default=2.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skip-pipeline", action="store_true")
+    parser.add_argument("--output", help="Arquivo JSON de saída (padrão: benchmarks/results/<commit>-<data>.json)")
+    parser.add_argument("--compare", help="JSON de uma execução anterior para comparar")
+    args = parser.parse_args()
+
+    report = {"environment": environment(), "parameters": vars(args), "results": {}}
+
+    if args.skip_pipeline:
+        report["results"]["pipeline"] = {"skipped": "--skip-pipeline"}
+    elif shutil.which("ffmpeg") is None:
+        report["results"]["pipeline"] = {"skipped": "ffmpeg não encontrado no PATH"}
+    else:
+        print("Pipeline (vídeo sintético + modelo stub)...", file=sys.stderr)
+        report["results"]["pipeline"] = run_pipeline_benchmark(args.scenes, args.fps, seed=args.seed)
+
+    report["results"]["catalog"] = {}
+    for size in args.catalog_sizes:
+        print(f"Catálogo com {size} cenas...", file=sys.stderr)
+        report["results"]["catalog"][str(size)] = run_catalog_benchmark(size, args.queries, seed=args.seed)
+
+    output = Path(args.output) if args.output else \
+        RESULTS_DIR / f"{report['environment']['commit'] or 'sem-commit'}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    os.makedirs(output.parent, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(json.dumps(report["results"], indent=2, ensure_ascii=False))
+    print(f"\nResultado gravado em {output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            print_comparison(json.load(f), report)
+
+if __name__ == "__main__":
+    main()
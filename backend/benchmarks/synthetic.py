@@ -0,0 +1,240 @@
+"""
+Dados sintéticos para os benchmarks: vídeos com cortes em instantes conhecidos
+(gerados pelo ffmpeg com fontes lavfi), um modelo ONNX "stub" com a mesma
+entrada/saída do tagger e catálogos de cenas de qualquer tamanho.
+
+Tudo é determinístico a partir de uma seed, para que resultados de commits
+diferentes sejam comparáveis.
+"""
+import os
+import sys
+import shutil
+import subprocess
+from pathlib import Path
+
+import numpy as np
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+PROJECT_ROOT = BACKEND_DIR.parent
+LABELS_CSV = PROJECT_ROOT / "selected_tags.csv"
+
+# ==============================================================================
+# SEÇÃO 1: VÍDEOS COM CORTES CONHECIDOS
+# ==============================================================================
+
+# Fontes estáticas e bem diferentes entre si; cenas vizinhas nunca repetem a fonte
+SCENE_SOURCES = ("smptebars", "color=c=red", "rgbtestsrc", "color=c=0x2040ff", "pal75bars",
+                 "color=c=white", "yuvtestsrc", "color=c=0x20c020", "smptehdbars", "color=c=black")
+
+def scene_durations(n_scenes, seed, min_seconds=2.0, max_seconds=12.0):
+    rng = np.random.default_rng(seed)
+    return np.round(rng.uniform(min_seconds, max_seconds, n_scenes), 1).tolist()
+
+def make_test_video(path, durations, size="640x360", rate=25):
+    """
+    Gera um vídeo H.264 com uma cena por duração e retorna os instantes (s) em que
+    cada cena começa. Requer o ffmpeg no PATH.
+    """
+    if shutil.which("ffmpeg") is None:
+        raise RuntimeError("ffmpeg não encontrado no PATH")
+    command = ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error"]
+    for i, duration in enumerate(durations):
+        source = SCENE_SOURCES[i % len(SCENE_SOURCES)]
+        separator = ":" if "=" in source else "="
+        command += ["-f", "lavfi", "-i", f"{source}{separator}s={size}:r={rate}:d={duration}"]
+    inputs = "".join(f"[{i}:v]" for i in range(len(durations)))
+    command += ["-filter_complex", f"{inputs}concat=n={len(durations)}:v=1:a=0[v]", "-map", "[v]",
+                "-c:v", "libx264", "-preset", "veryfast", "-pix_fmt", "yuv420p", "-g", str(rate * 2), str(path)]
+    subprocess.run(command, check=True)
+    return np.concatenate([[0.0], np.cumsum(durations)[:-1]]).round(3).tolist()
+
+def boundary_accuracy(true_starts, detected_starts, tolerance):
+    """
+    Precisão, recall e F1 dos cortes detectados (o início do vídeo não conta),
+    casando cada corte real com o detectado mais próximo dentro da tolerância.
+    """
+    true_cuts = sorted(true_starts)[1:]
+    detected = sorted(detected_starts)[1:]
+    unmatched = list(detected)
+    errors = []
+    for cut in true_cuts:
+        if not unmatched:
+            break
+        nearest = min(unmatched, key=lambda t: abs(t - cut))
+        if abs(nearest - cut) <= tolerance:
+            errors.append(abs(nearest - cut))
+            unmatched.remove(nearest)
+    hits = len(errors)
+    precision = hits / len(detected) if detected else 1.0
+    recall = hits / len(true_cuts) if true_cuts else 1.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {"true_cuts": len(true_cuts), "detected_cuts": len(detected), "precision": round(precision, 4),
+            "recall": round(recall, 4), "f1": round(f1, 4),
+            "mean_abs_error_seconds": round(float(np.mean(errors)), 4) if errors else None}
+
+# ==============================================================================
+# SEÇÃO 2: MODELO ONNX STUB
+# ==============================================================================
+
+def count_labels(csv_path=LABELS_CSV):
+    with open(csv_path, "r", encoding="utf-8") as f:
+        return sum(1 for _ in f) - 1
+
+def make_stub_model(path, n_tags, input_size=448, grid=8, seed=0):
+    """
+    Modelo com a interface do tagger wd-v3 (entrada [N, H, W, 3] float32 em BGR 0-255,
+    saída [N, n_tags] de sigmoides), mas que só faz média por blocos da imagem
+    e uma projeção aleatória fixa. Imagens parecidas geram tags parecidas e cenas
+    diferentes geram tags diferentes, o que basta para exercitar o pipeline.
+    """
+    import onnx
+    from onnx import TensorProto, helper, numpy_helper
+
+    rng = np.random.default_rng(seed)
+    cell = input_size // grid
+    features = 3 * grid * grid
+    # Escala e bias dão ~40 tags acima do limiar de 0.35 por imagem, como o tagger real
+    weights = rng.normal(0.0, 3.0 / np.sqrt(features), (features, n_tags)).astype(np.float32)
+    bias = np.full(n_tags, -4.0, dtype=np.float32)
+
+    nodes = [
+        helper.make_node("Transpose", ["input"], ["nchw"], perm=[0, 3, 1, 2]),
+        helper.make_node("AveragePool", ["nchw"], ["pooled"], kernel_shape=[cell, cell], strides=[cell, cell]),
+        helper.make_node("Flatten", ["pooled"], ["flat"], axis=1),
+        helper.make_node("Mul", ["flat", "inv_255"], ["scaled"]),
+        helper.make_node("Sub", ["scaled", "half"], ["centered"]),
+        helper.make_node("MatMul", ["centered", "weights"], ["logits_raw"]),
+        helper.make_node("Add", ["logits_raw", "bias"], ["logits"]),
+        helper.make_node("Sigmoid", ["logits"], ["output"]),
+    ]
+    initializers = [numpy_helper.from_array(np.array(1 / 255, dtype=np.float32), "inv_255"),
+                    numpy_helper.from_array(np.array(0.5, dtype=np.float32), "half"),
+                    numpy_helper.from_array(weights, "weights"),
+                    numpy_helper.from_array(bias, "bias")]
+    graph = helper.make_graph(
+        nodes, "stub_tagger",
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, ["batch", input_size, input_size, 3])],
+        [helper.make_tensor_value_info("output", TensorProto.FLOAT, ["batch", n_tags])],
+        initializers)
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 17)])
+    model.ir_version = 8
+    onnx.checker.check_model(model)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    onnx.save(model, str(path))
+    return path
+
+def install_stub_model(cache_dir, model_repo, input_size=448):
+    """
+    Aponta a pasta local de modelos para 'cache_dir' e instala nela o stub no lugar
+    de 'model_repo', com o selected_tags.csv do projeto. Nada é baixado.
+    """
+    from app.services import model_variants
+
+    model_variants.MODEL_CACHE_DIR = Path(cache_dir)
+    model_variants.MODEL_OFFLINE = True
+    target_dir = model_variants.model_dir(model_repo)
+    os.makedirs(target_dir, exist_ok=True)
+    shutil.copyfile(LABELS_CSV, target_dir / "selected_tags.csv")
+    return make_stub_model(target_dir / "model.onnx", count_labels(), input_size)
+
+# ==============================================================================
+# SEÇÃO 3: CATÁLOGOS SINTÉTICOS
+# ==============================================================================
+
+# Módulos que guardam o caminho do banco em uma constante própria
+DB_FILE_MODULES = ("app.services.database_service", "app.services.media_info_service",
+                   "app.services.job_metrics", "app.services.scene_checkpoints", "app.services.fingerprint_service",
+                   "app.services.catalog_maintenance", "app.api.search", "app.api.management")
+
+def use_database(db_path):
+    """Redireciona o backend (serviços e busca) para o banco 'db_path', criando as tabelas."""
+    import importlib
+    sys.path.insert(0, str(PROJECT_ROOT))
+    from construir_banco_de_cenas import setup_database
+
+    for module_name in DB_FILE_MODULES:
+        importlib.import_module(module_name).DB_FILE = Path(db_path)
+    setup_database(str(db_path)).close()
+    from app.services.database_service import init_database
+    init_database()
+
+def general_tag_names(csv_path=LABELS_CSV):
+    import csv
+    with open(csv_path, "r", encoding="utf-8", newline="") as f:
+        return [row["name"] for row in csv.DictReader(f) if row["category"] == "0"]
+
+def zipf_tag_sample(rng, n_rows, tags_per_row, vocabulary_size, exponent=1.1):
+    """
+    Índices de tags por linha, sem repetição na linha, com popularidade Zipf
+    (poucas tags muito comuns e uma cauda longa), como nos catálogos reais.
+    Retorna (indptr, indices) no formato CSR.
+    """
+    weights = 1.0 / np.arange(1, vocabulary_size + 1) ** exponent
+    cumulative = np.cumsum(weights / weights.sum())
+    draws = np.searchsorted(cumulative, rng.random((n_rows, tags_per_row * 2)))
+    draws = np.minimum(draws, vocabulary_size - 1)
+    draws.sort(axis=1)
+    unique = np.ones_like(draws, dtype=bool)
+    unique[:, 1:] = draws[:, 1:] != draws[:, :-1]
+    keep = unique & (np.cumsum(unique, axis=1) <= tags_per_row)
+    indptr = np.concatenate([[0], np.cumsum(keep.sum(axis=1))])
+    return indptr, draws[keep]
+
+def synthetic_scenes(rng, n_scenes, tag_names, tags_per_scene):
+    """Cenas no formato do pipeline (cena_n, start/end, duration, tags_principais) para um vídeo."""
+    durations = np.round(rng.lognormal(2.0, 0.7, n_scenes), 3)
+    starts = np.concatenate([[0.0], np.cumsum(durations)[:-1]])
+    indptr, indices = zipf_tag_sample(rng, n_scenes, tags_per_scene, len(tag_names))
+    scores = np.round(rng.uniform(0.35, 1.0, len(indices)), 3)
+    return [{"cena_n": i + 1, "start_time": round(float(starts[i]), 3), "end_time": round(float(starts[i] + durations[i]), 3),
+             "duration": float(durations[i]),
+             "tags_principais": {tag_names[t]: float(s) for t, s in zip(indices[indptr[i]:indptr[i + 1]], scores[indptr[i]:indptr[i + 1]])}}
+            for i in range(n_scenes)]
+
+def build_catalog(db_path, n_scenes, scenes_per_video=40, tags_per_scene=20, seed=0, chunk_scenes=50_000):
+    """
+    Cria um catálogo com 'n_scenes' cenas (vídeos, cenas, tags e scene_tags) por
+    inserção em massa, sem passar pelo add_video_to_database, e depois os índices
+    e triggers do backend. Retorna o resumo do catálogo.
+    """
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    sys.path.insert(0, str(PROJECT_ROOT))
+    from construir_banco_de_cenas import setup_database
+
+    rng = np.random.default_rng(seed)
+    tag_names = general_tag_names()
+    conn = setup_database(str(db_path))
+    try:
+        conn.executemany("INSERT INTO tags (tag_id, tag_name) VALUES (?, ?)", enumerate(tag_names, start=1))
+        n_videos = -(-n_scenes // scenes_per_video)
+        conn.executemany("INSERT INTO videos (video_id, video_name, category, file_path) VALUES (?, ?, ?, ?)",
+                         ((v + 1, f"video_{v:07d}", f"categoria_{v % 50:02d}", f"backend/videos/categoria_{v % 50:02d}/video_{v:07d}.mp4")
+                          for v in range(n_videos)))
+
+        tag_rows = 0
+        # Blocos com vídeos inteiros, para calcular os inícios das cenas dentro de cada bloco
+        chunk = scenes_per_video * max(1, chunk_scenes // scenes_per_video)
+        for first in range(0, n_scenes, chunk):
+            ids = np.arange(first, min(first + chunk, n_scenes))
+            video_ids = ids // scenes_per_video + 1
+            numbers = ids % scenes_per_video + 1
+            durations = np.round(rng.lognormal(2.0, 0.7, len(ids)), 3)
+            # Início de cada cena = soma das durações anteriores do mesmo vídeo
+            starts = np.cumsum(durations) - durations
+            video_offset = starts[np.searchsorted(video_ids, video_ids)]
+            starts = np.round(starts - video_offset, 3)
+            conn.executemany("INSERT INTO scenes (scene_id, video_id, scene_number, start_time, end_time, duration) VALUES (?, ?, ?, ?, ?, ?)",
+                             zip((ids + 1).tolist(), video_ids.tolist(), numbers.tolist(), starts.tolist(),
+                                 np.round(starts + durations, 3).tolist(), durations.tolist()))
+            indptr, indices = zipf_tag_sample(rng, len(ids), tags_per_scene, len(tag_names))
+            scene_ids = np.repeat(ids + 1, np.diff(indptr))
+            scores = np.round(rng.uniform(0.35, 1.0, len(indices)), 3)
+            conn.executemany("INSERT INTO scene_tags (scene_id, tag_id, score) VALUES (?, ?, ?)",
+                             zip(scene_ids.tolist(), (indices + 1).tolist(), scores.tolist()))
+            tag_rows += len(indices)
+        conn.commit()
+    finally:
+        conn.close()
+    return {"scenes": n_scenes, "videos": n_videos, "tags": len(tag_names), "scene_tags": tag_rows,
+            "size_mb": round(os.path.getsize(db_path) / 2**20, 1)}
@@ -0,0 +1,68 @@
+import asyncio
+import shutil
+import subprocess
+
+import pytest
+
+from app.services import clip_service, keyframe_index
+
+pytestmark = pytest.mark.skipif(shutil.which("ffmpeg") is None or shutil.which("ffprobe") is None,
+                                reason="ffmpeg/ffprobe não encontrados")
+
+def ffmpeg(*args):
+    subprocess.run(["ffmpeg", "-v", "error", "-y", *args], check=True)
+
+def frame_hashes(path, *input_args):
+    """md5 de cada frame decodificado (em rgb24), na ordem de apresentação."""
+    output = subprocess.run(["ffmpeg", "-v", "error", *input_args, "-i", str(path), "-map", "0:v", "-fps_mode", "passthrough", "-pix_fmt", "rgb24",
+                             "-f", "framemd5", "-"], check=True, capture_output=True, text=True).stdout
+    return [line.rsplit(",", 1)[-1].strip() for line in output.splitlines() if not line.startswith("#")]
+
+def stream_params(path):
+    return asyncio.run(clip_service.probe_stream_params(str(path)))
+
+@pytest.fixture(autouse=True)
+def temp_dirs(tmp_path, monkeypatch):
+    monkeypatch.setattr(clip_service, "CLIPS_DIR", tmp_path)
+    monkeypatch.setattr(keyframe_index, "KEYFRAME_CACHE_PATH", tmp_path / ".keyframes")
+
+@pytest.mark.parametrize("pix_fmt, profile", [("yuv420p", "high"), ("yuv422p10le", "high422")])
+def test_smart_cut_decodes_like_the_source(tmp_path, pix_fmt, profile):
+    source = tmp_path / f"source_{pix_fmt}.mp4"
+    try:
+        # Keyframes a cada 2 s; áudio 44,1 kHz mono (diferente do padrão do encoder)
+        ffmpeg("-f", "lavfi", "-i", "testsrc2=size=320x240:rate=25", "-f", "lavfi", "-i", "sine=frequency=440:sample_rate=44100",
+               "-t", "8", "-c:v", "libx264", "-profile:v", profile, "-pix_fmt", pix_fmt, "-g", "50", "-sc_threshold", "0",
+               "-c:a", "aac", "-ac", "1", str(source))
+    except subprocess.CalledProcessError:
+        pytest.skip(f"libx264 deste ffmpeg não gera {pix_fmt}")
+
+    clip = tmp_path / "clip.mp4"
+    strategy = asyncio.run(clip_service.cut_clip(str(source), 1.3, 5.0, clip))
+    assert strategy == "smart"
+
+    video, audio = stream_params(clip)
+    source_video, source_audio = stream_params(source)
+    for key in ("profile", "pix_fmt", "width", "height"):
+        assert video[key] == source_video[key]
+    for key in ("sample_rate", "channels"):
+        assert audio[key] == source_audio[key]
+
+    # Depois da cabeça reencodada, cada frame é idêntico a um frame da fonte, a partir do keyframe em 2 s
+    # (frame 50) e sem buracos até o fim da janela (5 s = frame 125)
+    source_frames = {digest: index for index, digest in enumerate(frame_hashes(source))}
+    indices = [source_frames.get(digest) for digest in frame_hashes(clip)]
+    head = indices.index(50)
+    assert head > 0 and all(index is None for index in indices[:head])
+    copied = indices[head:]
+    assert None not in copied and copied == sorted(copied)
+    assert copied[:75] == list(range(50, 125))
+
+def test_unmatchable_source_falls_back_to_full_encode():
+    video = {"codec_name": "h264", "profile": "High", "level": 30, "pix_fmt": "yuv420p",
+             "width": 320, "height": 240, "time_base": "1/12800"}
+    assert clip_service.matching_head_args(video, None) is not None
+    assert clip_service.matching_head_args({**video, "pix_fmt": "yuv420p12le"}, None) is None
+    assert clip_service.matching_head_args({**video, "profile": "High 4:4:4 Intra"}, None) is None
+    assert clip_service.matching_head_args(video, {"codec_name": "aac", "profile": "HE-AAC", "sample_rate": "48000",
+                                                   "channels": 2}) is None
@@ -0,0 +1,33 @@
+import json
+import random
+
+import pytest
+
+from app.services.scene_detection import FrameTagMatrix, OnlineSegmenter, aggregate_scene_tags, detect_boundaries
+
+def random_frames(seed, n_frames=60):
+    """Frames com poucos scores possíveis, para forçar empates no top_k."""
+    rng = random.Random(seed)
+    tags = [f"tag{i}" for i in range(8)]
+    return {f"frame_{n:06d}.png": {tag: rng.choice([0.25, 0.5, 0.75]) for tag in rng.sample(tags, rng.randint(0, 5))}
+            for n in range(1, n_frames + 1)}
+
+@pytest.mark.parametrize("seed", range(40))
+def test_online_segmenter_matches_batch(seed):
+    rng = random.Random(seed)
+    params = (0.3, "jaccard", rng.randint(0, 2), rng.randint(1, 3), rng.choice([None, 1, 2, 3]), 0.0)
+    frames = random_frames(seed)
+    matrix = FrameTagMatrix.from_tag_dict(frames)
+    starts = detect_boundaries(matrix, *params[:4])
+    expected = aggregate_scene_tags(matrix, starts, *params[4:])
+
+    segmenter, scenes = OnlineSegmenter(*params), []
+    for i, name in enumerate(sorted(frames)):
+        scenes += segmenter.push(float(i), frames[name])
+        if i == len(frames) // 2:
+            # Retomada de um checkpoint no meio do vídeo
+            segmenter = OnlineSegmenter.from_state(json.loads(json.dumps(segmenter.to_state())), *params)
+    scenes += segmenter.finish()
+
+    assert [int(start) for start, _, _ in scenes] == starts.tolist()
+    assert [[(tag, pytest.approx(score)) for tag, score in tags] for _, _, tags in scenes] == expected
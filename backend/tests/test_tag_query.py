@@ -0,0 +1,83 @@
+import sqlite3
+
+import pytest
+
+from app.core.schemas import SearchRequest
+from app.services.database_service import ensure_catalog_triggers
+from app.services.tag_query import QueryNode, get_catalog_index, parse_query, plan_query, query_search, request_query
+
+# (video_id, categoria, duração da cena, tags {nome: score}) por cena
+SCENES = [
+    (1, "Anime", 2.0, {"smile": 0.9, "cat": 0.5}),
+    (1, "Anime", 6.0, {"smile": 0.4}),
+    (1, "Anime", 8.0, {"dog": 0.8}),
+    (2, "Filmes", 3.0, {"smile": 0.7, "dog": 0.6}),
+    (2, "Filmes", 10.0, {"night": 0.5}),
+    (3, "Filmes", 4.0, {}),
+]
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(tmp_path / "catalog.db", isolation_level=None)
+    conn.executescript("""
+        CREATE TABLE videos (video_id INTEGER PRIMARY KEY, video_name TEXT UNIQUE, category TEXT, file_path TEXT UNIQUE);
+        CREATE TABLE scenes (scene_id INTEGER PRIMARY KEY, video_id INTEGER, scene_number INTEGER,
+                             start_time REAL, end_time REAL, duration REAL);
+        CREATE TABLE tags (tag_id INTEGER PRIMARY KEY, tag_name TEXT UNIQUE);
+        CREATE TABLE scene_tags (scene_id INTEGER, tag_id INTEGER, score REAL, PRIMARY KEY (scene_id, tag_id));
+    """)
+    ensure_catalog_triggers(conn)
+    starts = {}
+    for video_id, category, duration, tags in SCENES:
+        conn.execute("INSERT OR IGNORE INTO videos VALUES (?, ?, ?, ?)",
+                     (video_id, f"video{video_id}", category, f"videos/{category}/video{video_id}.mp4"))
+        start = starts.get(video_id, 0.0)
+        starts[video_id] = start + duration
+        scene_id = conn.execute("INSERT INTO scenes (video_id, scene_number, start_time, end_time, duration) VALUES (?, ?, ?, ?, ?)",
+                                (video_id, 0, start, start + duration, duration)).lastrowid
+        for tag, score in tags.items():
+            conn.execute("INSERT OR IGNORE INTO tags (tag_name) VALUES (?)", (tag,))
+            conn.execute("INSERT INTO scene_tags SELECT ?, tag_id, ? FROM tags WHERE tag_name = ?", (scene_id, score, tag))
+    yield conn
+    conn.close()
+
+def scene_ids(response):
+    return sorted(scene["scene_id"] for video in response["results"] for scene in video["matching_scenes"])
+
+@pytest.mark.parametrize("engine", ["memory", "sql"])
+@pytest.mark.parametrize("request_fields, expected", [
+    ({"explain": True}, [1, 2, 3, 4, 5, 6]),
+    ({"query": "smile"}, [1, 2, 4]),
+    ({"query": "smile AND NOT cat"}, [2, 4]),
+    ({"query": "NOT smile"}, [3, 5, 6]),
+    ({"query": "cat OR dog"}, [1, 3, 4]),
+    ({"query": "smile>0.6 category:Filmes"}, [4]),
+    ({"query": "duration>=6"}, [2, 3, 5]),
+    ({"query": "smile AND missing"}, []),
+    ({"query": "smile", "exclude_tags": ["dog"], "min_duration": 2.5}, [2]),
+])
+def test_engines_agree(conn, engine, request_fields, expected):
+    response = query_search(conn, SearchRequest(engine=engine, limit=100, **request_fields))
+    assert scene_ids(response) == expected
+    assert response["total_videos"] == len({video for video, *_ in (SCENES[i - 1] for i in expected)})
+
+@pytest.mark.parametrize("engine", ["memory", "sql"])
+def test_explain_without_filters_matches_everything(conn, engine):
+    response = query_search(conn, SearchRequest(engine=engine, explain=True, limit=100))
+    assert response["explain"]["plan"] == {"op": "AND", "estimated": len(SCENES), "actual": len(SCENES)}
+
+def test_request_without_filters_is_empty_and(conn):
+    node = request_query(SearchRequest(explain=True))
+    assert node.kind == "and" and node.children == []
+    plan = plan_query(conn, node, get_catalog_index(conn))
+    assert plan.exact and plan.estimated == len(SCENES)
+
+def test_planner_orders_and_children(conn):
+    plan = plan_query(conn, parse_query("smile AND NOT night AND cat"), get_catalog_index(conn))
+    assert [child.query.label() for child in plan.children] == ["tag cat", "tag smile", "NOT"]
+    assert not plan.exact
+
+def test_planner_short_circuits_missing_tag(conn):
+    plan = plan_query(conn, parse_query("smile AND missing"), get_catalog_index(conn))
+    assert plan.exact and plan.estimated == 0
+    assert QueryNode("tag", value="missing") in [child.query for child in plan.children]
@@ -0,0 +1,43 @@
+import numpy as np
+
+from app.services.temporal_search import ScenePostings, match_sequence
+
+def postings(*scenes):
+    """Cenas (scene_id, video_id, início, fim), já em ordem de (vídeo, início)."""
+    scene_ids, video_ids, starts, ends = (np.array(column) for column in zip(*scenes))
+    return ScenePostings(video_ids.astype(np.int64), starts.astype(np.float64), ends.astype(np.float64),
+                         scene_ids.astype(np.int64), np.ones(len(scenes)))
+
+def test_sequence_skips_nearest_scene_without_continuation():
+    a = postings((1, 1, 0, 5))
+    b = postings((2, 1, 10, 20), (3, 1, 30, 40))
+    c = postings((4, 1, 90, 100))
+    video_ids, starts, ends, scene_ids = match_sequence([a, b, c], max_gap=60)
+    assert scene_ids.tolist() == [[1, 3, 4]]
+    assert (video_ids.tolist(), starts.tolist(), ends.tolist()) == ([1], [0.0], [100.0])
+
+def test_sequence_prefers_nearest_scene_that_continues():
+    a = postings((1, 1, 0, 5))
+    b = postings((2, 1, 10, 20), (3, 1, 30, 40))
+    c = postings((4, 1, 50, 60))
+    _, _, _, scene_ids = match_sequence([a, b, c], max_gap=60)
+    assert scene_ids.tolist() == [[1, 2, 4]]
+
+def test_sequence_respects_gap_and_video():
+    a = postings((1, 1, 0, 5), (5, 2, 0, 5))
+    b = postings((2, 1, 70, 80), (6, 3, 10, 20))
+    video_ids, _, _, scene_ids = match_sequence([a, b], max_gap=60)
+    assert len(video_ids) == 0 and scene_ids.shape == (0, 2)
+
+def test_sequence_keeps_closest_start_per_final_scene():
+    a = postings((1, 1, 0, 5), (2, 1, 10, 15))
+    b = postings((3, 1, 20, 30))
+    _, starts, _, scene_ids = match_sequence([a, b], max_gap=60)
+    assert scene_ids.tolist() == [[2, 3]]
+    assert starts.tolist() == [10.0]
+
+def test_sequence_accepts_adjacent_scenes():
+    a = postings((1, 1, 0, 5.0004))
+    b = postings((2, 1, 5, 9))
+    _, _, _, scene_ids = match_sequence([a, b], max_gap=0)
+    assert scene_ids.tolist() == [[1, 2]]
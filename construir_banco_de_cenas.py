@@ -1,8 +1,12 @@
 import os
+import sys
 import sqlite3
-import json
 from tqdm import tqdm
 
+# Usa o leitor de arquivos de cenas do backend (_cenas.npz e o antigo _cenas.json)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from app.services.scene_store import SceneFileError, find_scene_file, read_scenes, scene_base_name
+
 # ==============================================================================
 # --- CONFIGURAÇÃO ---
 # ==============================================================================
@@ -72,7 +76,7 @@ def setup_database(db_path):
 # ==============================================================================
 def build_scene_database():
     """
-    Função principal que varre as pastas, processa os JSONs e popula o
+    Função principal que varre as pastas, processa os arquivos de cenas e popula o
     banco de dados com informações de vídeos e cenas, SEM extrair os clipes.
     """
     conn = setup_database(DB_FILE)
@@ -87,10 +91,10 @@ def build_scene_database():
     for category_name in tqdm(category_folders, desc="Processando Categorias"):
         category_folder_path = os.path.join(VIDEOS_ROOT_FOLDER, category_name)
         
-        json_files = [f for f in os.listdir(category_folder_path) if f.endswith("_cenas.json")]
+        # Um vídeo pode ter os dois formatos durante a migração; cada nome entra uma vez
+        base_names = sorted({scene_base_name(f) for f in os.listdir(category_folder_path)} - {None})
 
-        for json_filename in tqdm(json_files, desc=f"  Vídeos de '{category_name}'", leave=False):
-            base_video_name = json_filename.replace("_cenas.json", "")
+        for base_video_name in tqdm(base_names, desc=f"  Vídeos de '{category_name}'", leave=False):
             
             source_video_path = None
             for ext in ['.mp4', '.mkv', '.mov', '.webm', '.avi', '.wmv', '.mpg']:
@@ -100,7 +104,7 @@ def build_scene_database():
                     break
             
             if not source_video_path:
-                tqdm.write(f"Aviso: Vídeo original para '{json_filename}' não encontrado. Pulando.")
+                tqdm.write(f"Aviso: Vídeo original para '{base_video_name}' não encontrado. Pulando.")
                 continue
 
             cursor.execute("INSERT OR IGNORE INTO videos (video_name, category, file_path) VALUES (?, ?, ?)", 
@@ -108,12 +112,8 @@ def build_scene_database():
             cursor.execute("SELECT video_id FROM videos WHERE video_name = ?", (base_video_name,))
             video_id = cursor.fetchone()[0]
             
-            json_path = os.path.join(category_folder_path, json_filename)
-            with open(json_path, 'r', encoding='utf-8') as f:
-                try: scenes_data = json.load(f)
-                except json.JSONDecodeError: continue
-
-            if not isinstance(scenes_data, list): continue
+            try: scenes_data = read_scenes(find_scene_file(category_folder_path, base_video_name))
+            except SceneFileError: continue
 
             for scene in scenes_data:
                 scene_duration = scene.get('duration', 0)
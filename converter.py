@@ -1,92 +1,305 @@
 import os
-import subprocess
+import sys
+import json
+import time
+import sqlite3
+import asyncio
+import argparse
 from tqdm import tqdm
 
+# Reaproveita o executor de ferramentas de mídia e a media_info do backend
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "backend"))
+from app.services import media_tools
+from app.services.database_service import DB_FILE, init_database
+from app.services.media_info_service import get_media_info_batch
+from app.services.media_tools import MediaToolError, run_tool
+
 # ==============================================================================
 # --- CONFIGURAÇÃO ---
 # ==============================================================================
 
 # A pasta raiz que contém as subpastas de cada atriz com os vídeos.
-VIDEO_ROOT_FOLDER = os.path.join("web", "videos")
+VIDEO_ROOT_FOLDER = os.path.join("backend", "videos")
 
 # Formatos a serem convertidos. Adicione outros se necessário.
 FORMATS_TO_CONVERT = ('.wmv', '.avi', '.mkv', '.mpg', '.mpeg', '.flv', '.mov')
 
+# Encoder de vídeo usado quando o codec original não cabe em MP4.
+# 'libx264' roda em qualquer CPU; 'h264_nvenc' usa a GPU NVIDIA (com fallback para libx264).
+DEFAULT_ENCODER = os.environ.get("CONVERTER_ENCODER", "libx264")
+CPU_ENCODER = "libx264"
+
+# Codecs que podem ir para um container MP4 apenas com cópia (remux)
+MP4_VIDEO_CODECS = ('h264', 'hevc', 'mpeg4', 'av1')
+MP4_AUDIO_CODECS = ('aac', 'mp3')
+
+# Diário de conversões, usado para retomar o trabalho e sincronizar o DB
+JOURNAL_FILENAME = ".converter_journal.jsonl"
+
+# ==============================================================================
+# --- PLANEJAMENTO DE CADA ARQUIVO ---
+# ==============================================================================
+
+def default_parallel_jobs(encoder):
+    """
+    O libx264 já usa várias threads por processo, então rodamos poucos jobs com
+    algumas threads cada; encoders de GPU e remux quase não usam CPU.
+    """
+    cores = os.cpu_count() or 2
+    if encoder == CPU_ENCODER:
+        return max(1, cores // 4)
+    return max(2, min(4, cores // 2))
+
+def build_ffmpeg_args(video_path, output_path, media_info, encoder, threads):
+    """
+    Monta os argumentos do ffmpeg e devolve (modo, argumentos):
+    - 'remux': vídeo e áudio já são compatíveis, só troca o container;
+    - 'audio': copia o vídeo e reencoda apenas o áudio;
+    - 'encode': reencoda o vídeo com o encoder configurado.
+    """
+    video_codec = media_info.get('video_codec') if media_info else None
+    audio_codec = media_info.get('audio_codec') if media_info else None
+
+    copy_video = video_codec in MP4_VIDEO_CODECS
+    copy_audio = audio_codec is None or audio_codec in MP4_AUDIO_CODECS
+    if not media_info:
+        copy_video = copy_audio = False
+
+    args = ['-y', '-hide_banner', '-loglevel', 'error', '-i', video_path, '-map', '0:v:0', '-map', '0:a:0?']
+    if copy_video:
+        args += ['-c:v', 'copy']
+        if video_codec == 'hevc':
+            args += ['-tag:v', 'hvc1']
+    else:
+        args += ['-c:v', encoder]
+        if encoder == CPU_ENCODER:
+            args += ['-preset', 'fast', '-crf', '21', '-pix_fmt', 'yuv420p', '-threads', str(threads)]
+        else:
+            args += ['-preset', 'fast']
+    args += ['-c:a', 'copy'] if copy_audio else ['-c:a', 'aac', '-b:a', '192k']
+    args += ['-movflags', '+faststart', '-f', 'mp4', output_path]
+
+    if copy_video and copy_audio:
+        mode = 'remux'
+    elif copy_video:
+        mode = 'audio'
+    else:
+        mode = 'encode'
+    return mode, args
+
+# ==============================================================================
+# --- DIÁRIO (RESUME) ---
+# ==============================================================================
+
+def load_journal(journal_path):
+    """Lê o diário e retorna {source: última entrada registrada}."""
+    entries = {}
+    if os.path.exists(journal_path):
+        with open(journal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Linha truncada por uma interrupção
+                entries[entry['source']] = entry
+    return entries
+
+def append_journal(journal_path, entry):
+    with open(journal_path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+def rewrite_journal(journal_path, entries):
+    temp_path = journal_path + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    os.replace(temp_path, journal_path)
+
+def reconcile_pending(journal):
+    """
+    Conclui as conversões interrompidas entre a troca do .mp4 e o registro final
+    (entradas 'pending'). Se o .mp4 existe, a troca aconteceu: o original é
+    removido (se ainda existir) e a entrada vira 'done', para o DB ser atualizado.
+    Senão a conversão não terminou e o arquivo volta a ser convertido.
+    """
+    for source, entry in list(journal.items()):
+        if entry['status'] != 'pending':
+            continue
+        if os.path.exists(entry['target']):
+            if os.path.exists(source):
+                os.remove(source)
+            journal[source] = {**entry, "status": "done", "time": time.time()}
+        else:
+            del journal[source]
+
+# ==============================================================================
+# --- ATUALIZAÇÃO DO CATÁLOGO ---
+# ==============================================================================
+
+def _path_variants(path):
+    """O DB guarda caminhos absolutos (pipeline) ou relativos à raiz do projeto (scripts)."""
+    absolute = os.path.abspath(path)
+    relative = os.path.relpath(absolute, PROJECT_ROOT).replace(os.path.sep, '/')
+    return {absolute, absolute.replace(os.path.sep, '/'), relative}
+
+def update_catalog_paths(converted):
+    """
+    Atualiza videos.file_path de todos os arquivos convertidos em uma única transação.
+    'converted' é uma lista de (caminho_antigo, caminho_novo). Retorna o número de linhas alteradas.
+    Sem o catálogo (o construir_banco_de_cenas.py ainda não rodou) não há o que atualizar: retorna 0.
+    """
+    if not converted:
+        return 0
+
+    new_suffix_by_old = {}
+    for old_path, new_path in converted:
+        for variant in _path_variants(old_path):
+            new_suffix_by_old[variant] = os.path.splitext(variant)[0] + os.path.splitext(new_path)[1]
+
+    conn = sqlite3.connect(DB_FILE)
+    try:
+        # O arquivo sempre existe (init_database), mas o catálogo só depois do construir_banco_de_cenas.py
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'videos'").fetchone() is None:
+            return 0
+        old_paths = list(new_suffix_by_old)
+        rows = []
+        for i in range(0, len(old_paths), 500):
+            chunk = old_paths[i:i + 500]
+            placeholders = ', '.join('?' for _ in chunk)
+            rows += conn.execute(f"SELECT video_id, file_path FROM videos WHERE file_path IN ({placeholders})", chunk).fetchall()
+        conn.executemany("UPDATE videos SET file_path = ? WHERE video_id = ?",
+                         [(new_suffix_by_old[file_path], video_id) for video_id, file_path in rows])
+        conn.commit()
+        return len(rows)
+    finally:
+        conn.close()
+
 # ==============================================================================
 # --- FUNÇÃO PRINCIPAL DE CONVERSÃO ---
 # ==============================================================================
 
-def convert_videos_to_mp4():
+async def convert_one(video_path, media_info, encoder, threads, before_replace=None):
     """
-    Varre as pastas de vídeo, converte formatos antigos para MP4 usando a GPU,
-    e deleta os arquivos originais.
+    Converte um arquivo para MP4 escrevendo primeiro em um arquivo temporário,
+    que só substitui o destino quando o ffmpeg termina com sucesso.
+    'before_replace(output_path, mode)' é chamado logo antes da troca (ex.: para
+    registrar no diário a conversão que está sendo concluída).
     """
-    print(f"--- Iniciando a conversão de vídeos em '{VIDEO_ROOT_FOLDER}' para MP4 ---")
+    base_path, _ = os.path.splitext(video_path)
+    output_path = f"{base_path}.mp4"
+    temp_path = f"{base_path}.mp4.part"
+
+    # Tentativas em ordem: plano ideal, reencode completo (containers antigos que
+    # não remuxam bem) e, sem GPU ou com codec não suportado por ela, o encoder de CPU
+    attempts = [build_ffmpeg_args(video_path, temp_path, media_info, encoder, threads),
+                build_ffmpeg_args(video_path, temp_path, None, encoder, threads),
+                build_ffmpeg_args(video_path, temp_path, None, CPU_ENCODER, threads)]
+    unique_attempts = []
+    for mode, args in attempts:
+        if all(args != previous for _, previous in unique_attempts):
+            unique_attempts.append((mode, args))
+    try:
+        for i, (mode, args) in enumerate(unique_attempts):
+            try:
+                await run_tool('ffmpeg', args)
+                break
+            except MediaToolError:
+                if i == len(unique_attempts) - 1:
+                    raise
+        if before_replace is not None:
+            before_replace(output_path, mode)
+        os.replace(temp_path, output_path)
+        os.remove(video_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return output_path, mode
+
+async def convert_videos_to_mp4(root_folder=VIDEO_ROOT_FOLDER, encoder=DEFAULT_ENCODER, jobs=None, retry_failed=False):
+    """
+    Varre as pastas de vídeo e converte formatos antigos para MP4:
+    remux quando os codecs já são compatíveis, senão reencoda com o encoder configurado.
+    Roda 'jobs' conversões em paralelo, registra cada resultado no diário e, no fim,
+    atualiza os caminhos no banco de dados em lote.
+    """
+    print(f"--- Iniciando a conversão de vídeos em '{root_folder}' para MP4 ---")
+    init_database()
+    journal_path = os.path.join(root_folder, JOURNAL_FILENAME)
+    journal = load_journal(journal_path)
+    reconcile_pending(journal)
 
     videos_to_convert = []
-    # Encontra todos os arquivos que precisam de conversão
-    for root, _, files in os.walk(VIDEO_ROOT_FOLDER):
+    # Encontra todos os arquivos que precisam de conversão (e limpa restos de execuções interrompidas)
+    for root, _, files in os.walk(root_folder):
         for file in files:
-            if file.lower().endswith(FORMATS_TO_CONVERT):
-                videos_to_convert.append(os.path.join(root, file))
-
-    if not videos_to_convert:
-        print("Nenhum vídeo para converter. Todos já estão em formato moderno ou a pasta está vazia.")
-        return
+            full_path = os.path.join(root, file)
+            if file.endswith('.mp4.part'):
+                os.remove(full_path)
+            elif file.lower().endswith(FORMATS_TO_CONVERT):
+                previous = journal.get(os.path.abspath(full_path))
+                if previous and previous['status'] == 'failed' and not retry_failed:
+                    continue
+                if os.path.exists(os.path.splitext(full_path)[0] + ".mp4"):
+                    tqdm.write(f"  AVISO: '{file}' já tem um .mp4 com o mesmo nome. Pulando.")
+                    continue
+                videos_to_convert.append(full_path)
 
-    print(f"Encontrados {len(videos_to_convert)} vídeos para converter.")
+    jobs = jobs or default_parallel_jobs(encoder)
+    threads = max(1, (os.cpu_count() or 2) // jobs)
+    media_tools.TOOL_CONCURRENCY['ffmpeg'] = jobs
 
     success_count = 0
     fail_count = 0
+    if videos_to_convert:
+        print(f"Encontrados {len(videos_to_convert)} vídeos para converter ({jobs} em paralelo, encoder: {encoder}).")
+        media_infos = await get_media_info_batch(videos_to_convert)
+
+        def journal_pending(video_path, output_path, mode):
+            append_journal(journal_path, {"source": os.path.abspath(video_path), "target": os.path.abspath(output_path),
+                                          "status": "pending", "mode": mode, "time": time.time()})
+
+        async def run_job(video_path):
+            try:
+                output_path, mode = await convert_one(video_path, media_infos.get(video_path), encoder, threads,
+                                                      lambda output_path, mode: journal_pending(video_path, output_path, mode))
+                entry = {"source": os.path.abspath(video_path), "target": os.path.abspath(output_path),
+                         "status": "done", "mode": mode, "time": time.time()}
+            except Exception as e:
+                tqdm.write(f"  ERRO: Falha ao converter '{os.path.basename(video_path)}': {e}")
+                entry = {"source": os.path.abspath(video_path), "status": "failed", "error": str(e)[-500:], "time": time.time()}
+            append_journal(journal_path, entry)
+            journal[entry['source']] = entry
+            return entry
+
+        tasks = [asyncio.ensure_future(run_job(path)) for path in videos_to_convert]
+        for task in tqdm(asyncio.as_completed(tasks), total=len(tasks), desc="Convertendo vídeos"):
+            entry = await task
+            if entry['status'] == 'done':
+                success_count += 1
+            else:
+                fail_count += 1
+    else:
+        print("Nenhum vídeo para converter. Todos já estão em formato moderno ou a pasta está vazia.")
+
+    # Sincroniza o DB com tudo o que foi convertido (inclusive em execuções anteriores interrompidas)
+    converted = [(entry['source'], entry['target']) for entry in journal.values() if entry['status'] == 'done']
+    if converted:
+        updated = update_catalog_paths(converted)
+        print(f"Caminhos atualizados no banco de dados: {updated}")
+        rewrite_journal(journal_path, [entry for entry in journal.values() if entry['status'] != 'done'])
 
-    for video_path in tqdm(videos_to_convert, desc="Convertendo vídeos"):
-        base_path, _ = os.path.splitext(video_path)
-        output_path = f"{base_path}.mp4"
-        
-        # Comando de conversão com aceleração por GPU (NVENC)
-        # '-c:v h264_nvenc' -> Encoder de vídeo da Nvidia
-        # '-preset fast' -> Bom equilíbrio de velocidade/qualidade
-        # '-c:a aac' -> Codec de áudio padrão e compatível
-        command = [
-            'ffmpeg', '-y', '-hide_banner', '-loglevel', 'error',
-            '-i', video_path,
-            '-c:v', 'h264_nvenc',
-            '-preset', 'fast',
-            '-c:a', 'aac',
-            '-b:a', '192k',
-            output_path
-        ]
-
-        try:
-            # Executa a conversão
-            subprocess.run(command, check=True)
-            
-            # Se a conversão foi bem-sucedida, deleta o original
-            os.remove(video_path)
-            
-            # [CRUCIAL] Renomeia o arquivo JSON correspondente, se existir
-            original_json_path = f"{base_path}_cenas.json"
-            new_json_path = f"{base_path}.mp4_cenas.json" # Temporário
-            final_json_path = f"{base_path}_cenas.json" # O nome final correto
-
-            if os.path.exists(original_json_path):
-                # Renomeia para um nome temporário para evitar conflitos se o .mp4 já existia
-                os.rename(original_json_path, new_json_path)
-                # Renomeia de volta para o nome final, agora que o original se foi
-                os.rename(new_json_path, final_json_path)
-
-            success_count += 1
-        except subprocess.CalledProcessError:
-            tqdm.write(f"  ERRO: Falha ao converter '{os.path.basename(video_path)}'. Pode ser um codec não suportado pela GPU.")
-            # Opcional: Adicionar um fallback para CPU aqui se quiser ser exaustivo
-            fail_count += 1
-        except Exception as e:
-            tqdm.write(f"  ERRO inesperado com '{os.path.basename(video_path)}': {e}")
-            fail_count += 1
-            
     print("\n--- Conversão Concluída ---")
     print(f"✅ Convertidos com sucesso: {success_count}")
     print(f"❌ Falhas: {fail_count}")
 
 if __name__ == "__main__":
-    convert_videos_to_mp4()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Converte vídeos antigos para MP4 (remux quando possível).")
+    parser.add_argument("--root", default=VIDEO_ROOT_FOLDER, help="Pasta raiz dos vídeos")
+    parser.add_argument("--encoder", default=DEFAULT_ENCODER, help="Encoder de vídeo (libx264, h264_nvenc, ...)")
+    parser.add_argument("--jobs", type=int, default=None, help="Conversões em paralelo (padrão: baseado no número de núcleos)")
+    parser.add_argument("--retry-failed", action="store_true", help="Tenta de novo os arquivos que falharam antes")
+    args = parser.parse_args()
+    asyncio.run(convert_videos_to_mp4(args.root, args.encoder, args.jobs, args.retry_failed))
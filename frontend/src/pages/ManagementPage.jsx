@@ -31,6 +31,17 @@ function ManagementPage() {
     fetchStatus();
   }, []);
 
+  // As ações rodam em segundo plano no servidor: acompanha o job até terminar
+  const waitForJob = async (jobId) => {
+    while (true) {
+      const { data } = await axios.get(`${API_URL}/management/jobs/${jobId}`);
+      if (data.status === 'completed') return data;
+      if (data.status === 'error') throw new Error(data.message);
+      if (data.message) setActionMessage(`${data.message} (${data.progress}%)`);
+      await new Promise(resolve => setTimeout(resolve, 500));
+    }
+  };
+
   // --- NOVAS FUNÇÕES DE AÇÃO ---
   const handleCleanup = async () => {
     if (!status || status.orphan_records.length === 0) return;
@@ -41,7 +52,8 @@ function ManagementPage() {
       const response = await axios.post(`${API_URL}/management/cleanup`, {
         paths: status.orphan_records
       });
-      setActionMessage(`Sucesso! ${response.data.deleted_count} registro(s) removido(s).`);
+      const job = await waitForJob(response.data.job_id);
+      setActionMessage(`Sucesso! ${job.result.deleted_count} registro(s) removido(s).`);
       // Atualiza o status para refletir as mudanças
       fetchStatus();
     } catch (err) {
@@ -61,7 +73,8 @@ function ManagementPage() {
       const response = await axios.post(`${API_URL}/management/scan_new`, {
         paths: status.untracked_files
       });
-      setActionMessage(response.data.message);
+      const job = await waitForJob(response.data.job_id);
+      setActionMessage(job.message);
       // Atualiza o status
       fetchStatus();
     } catch (err) {